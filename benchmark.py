@@ -0,0 +1,563 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark module for Moxy Rates Template Transfer
+
+This module times every stage of the conversion pipeline on synthetic Adjusted
+Rates files of increasing size (1k, 10k, 100k and 1M rows by default) and
+writes the results as JSON, so that runs on different commits or machines can
+be compared.
+
+Results can be stored as the baseline of the current machine and later runs
+compared against it. The comparison fails when the median time or the peak
+memory of any stage regresses by more than its budget, after allowing for the
+run-to-run spread (interquartile range) measured in both runs.
+
+Usage:
+    python benchmark.py
+    python benchmark.py --sizes 1000 10000 --repeat 5
+    python benchmark.py --save-baseline
+    python benchmark.py --compare
+"""
+
+import os
+import sys
+import gc
+import json
+import socket
+import hashlib
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+from datetime import datetime
+
+import pandas as pd
+
+from file_analyzer import FileAnalyzer
+from mapping_system import MappingSystem
+from config_manager import MappingConfigManager
+from data_processor import DataProcessor
+from pipeline_metrics import RunMetrics, configure_metrics
+from log_pipeline import setup_logging, shutdown_logging
+from config_manager import ConfigManager
+import synthetic_data
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+
+# Generated workbooks are cached here and reused by later runs
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "data")
+
+DEFAULT_RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+
+# One baseline file per machine profile
+DEFAULT_BASELINE_DIR = os.path.join(DEFAULT_RESULTS_DIR, "baselines")
+
+# Regression budgets, overridable in the [Benchmark] section of config.ini
+DEFAULT_BUDGETS = {
+    "max_slowdown_pct": 15,
+    "max_memory_growth_pct": 20,
+    # Stages faster than this are dominated by timer noise and are not gated on time
+    "min_stage_seconds": 0.05,
+    # Memory changes smaller than this are ignored
+    "min_memory_mb": 5
+}
+
+# Pipeline stages in execution order
+BENCHMARK_STAGES = ("analyze", "map", "load", "transform", "plan_deduct", "integrate", "save")
+
+RESULTS_VERSION = 1
+
+# Repeat runs give the median and interquartile range used by the comparison
+DEFAULT_REPEAT = 3
+
+
+def machine_profile():
+    """
+    Describe the machine running the benchmark.
+
+    Returns:
+        dict: Host, platform, CPU and library versions
+    """
+    return {
+        "host": socket.gethostname(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__
+    }
+
+
+def machine_profile_id(profile=None):
+    """
+    Build a stable identifier for a machine profile.
+
+    Results are only comparable on the same hardware and library versions, so
+    the identifier changes when any of them changes.
+
+    Args:
+        profile: Result of machine_profile (current machine if None)
+
+    Returns:
+        str: Identifier such as "buildbox-3f2a9c1e"
+    """
+    profile = profile or machine_profile()
+    key = json.dumps({k: profile.get(k) for k in ("platform", "machine", "processor", "cpu_count",
+                                                    "python", "pandas")}, sort_keys=True)
+    host = "".join(c if c.isalnum() or c in "-_" else "_" for c in str(profile.get("host") or "host"))[:40]
+    return f"{host}-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:8]}"
+
+
+def prepare_inputs(rows, data_dir=None, seed=0):
+    """
+    Generate (or reuse) the adjusted rates workbook and template for one size.
+
+    Args:
+        rows: Number of adjusted rates rows
+        data_dir: Directory for the generated workbooks
+        seed: Random seed of the generated data
+
+    Returns:
+        tuple: (adjusted file path, template file path)
+    """
+    data_dir = data_dir or DEFAULT_DATA_DIR
+    adjusted_file = os.path.join(data_dir, f"adjusted_{rows}_s{seed}.xlsx")
+    template_file = os.path.join(data_dir, "template.xlsx")
+
+    if not os.path.exists(adjusted_file):
+        print(f"Generating {rows:,} row adjusted rates file...", flush=True)
+        df = synthetic_data.generate_adjusted_rates(rows, seed=seed)
+        synthetic_data.write_workbook(df, adjusted_file)
+    if not os.path.exists(template_file):
+        synthetic_data.generate_template(template_file)
+    return adjusted_file, template_file
+
+
+def run_pipeline(adjusted_file, template_file, work_dir, track_memory=False,
+                 sheet_name="Dealer Cost Rates"):
+    """
+    Run every benchmarked stage once on fresh component instances.
+
+    Args:
+        adjusted_file: Adjusted rates workbook
+        template_file: Template workbook
+        work_dir: Directory for the output workbook and mapping file
+        track_memory: Trace Python allocations per stage
+        sheet_name: Sheet of the adjusted rates workbook
+
+    Returns:
+        RunMetrics: Finished metrics with one stage per entry in BENCHMARK_STAGES
+    """
+    file_analyzer = FileAnalyzer()
+    # Private mapping file so saved mappings neither help nor get overwritten
+    mapping_system = MappingSystem(MappingConfigManager(os.path.join(work_dir, "mappings.json")))
+    data_processor = DataProcessor()
+    # RSS is sampled while each stage runs, so the memory gate sees transient peaks
+    metrics = RunMetrics(source_file=adjusted_file, track_memory=track_memory, sample_rss=True)
+
+    try:
+        with metrics.stage("analyze") as stage:
+            structure = file_analyzer.analyze_file_structure(adjusted_file, sheet_name)
+            stage.rows_in = structure.get('row_count')
+        source_columns = list(structure['columns'].keys())
+
+        with metrics.stage("map"):
+            mapping = mapping_system.generate_mapping(structure, use_saved_mappings=False)
+            mapping_system.detect_pivot_columns(source_columns, mapping, structure)
+
+        with metrics.stage("load") as stage:
+            adjusted_df = data_processor.load_excel_file(adjusted_file, sheet_name)
+            stage.rows_out = len(adjusted_df)
+
+        with metrics.stage("transform", rows_in=len(adjusted_df)) as stage:
+            transformed_df = data_processor.transform_data(adjusted_df, mapping)
+            stage.rows_out = len(transformed_df)
+
+        # Works on its own copy so the integrate stage sees the same input as in production
+        plan_input = transformed_df.copy()
+        with metrics.stage("plan_deduct", rows_in=len(plan_input)) as stage:
+            plan_df = data_processor._add_plan_deduct_column(plan_input)
+            stage.rows_out = len(plan_df)
+        del plan_input, plan_df
+
+        with metrics.stage("integrate", rows_in=len(transformed_df)) as stage:
+            final_df = data_processor.integrate_with_template(transformed_df, template_file)
+            stage.rows_out = len(final_df)
+
+        with metrics.stage("save", rows_in=len(final_df)):
+            data_processor.save_excel_file(final_df, os.path.join(work_dir, "output.xlsx"))
+    except Exception as e:
+        metrics.finish("failed", e)
+        raise
+
+    metrics.finish()
+    return metrics
+
+
+def _spread(values):
+    """Median and interquartile range of a list of samples."""
+    if len(values) < 2:
+        return values[0], 0.0
+    quartiles = statistics.quantiles(values, n=4, method='inclusive')
+    return statistics.median(values), quartiles[2] - quartiles[0]
+
+
+def summarize_runs(size, runs):
+    """
+    Combine repeated runs of one size into one result per stage.
+
+    Args:
+        size: Number of adjusted rates rows
+        runs: List of RunMetrics for this size
+
+    Returns:
+        list: One result dict per stage
+    """
+    results = []
+    for name in BENCHMARK_STAGES:
+        records = [stage for run in runs for stage in run.stages if stage.name == name]
+        if not records:
+            continue
+        walls = [record.wall_seconds for record in records]
+        median, iqr = _spread(walls)
+        rows_in = records[-1].rows_in
+        rows = rows_in if rows_in is not None else records[-1].rows_out
+        rss = [record.rss_peak for record in records if record.rss_peak is not None]
+        traced = [record.traced_peak for record in records if record.traced_peak is not None]
+        results.append({
+            "rows": size,
+            "stage": name,
+            "repeats": len(records),
+            "wall_seconds_median": round(median, 6),
+            "wall_seconds_iqr": round(iqr, 6),
+            "wall_seconds": [round(wall, 6) for wall in walls],
+            "cpu_seconds_median": round(statistics.median(record.cpu_seconds for record in records), 6),
+            "rows_in": rows_in,
+            "rows_out": records[-1].rows_out,
+            "rows_per_second": round(rows / median, 1) if rows and median > 0 else None,
+            "rss_peak_mb": round(max(rss) / (1024 * 1024), 2) if rss else None,
+            "traced_peak_mb": round(max(traced) / (1024 * 1024), 2) if traced else None
+        })
+    return results
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, repeat=DEFAULT_REPEAT, seed=0, data_dir=None, track_memory=False):
+    """
+    Benchmark every stage at each size.
+
+    Args:
+        sizes: Row counts to benchmark
+        repeat: Number of timed runs per size
+        seed: Random seed of the generated data
+        data_dir: Directory for the generated workbooks
+        track_memory: Trace Python allocations per stage
+
+    Returns:
+        dict: Results document (see write_results)
+    """
+    results = []
+    with tempfile.TemporaryDirectory(prefix="moxy_bench_") as work_dir:
+        for rows in sizes:
+            adjusted_file, template_file = prepare_inputs(rows, data_dir, seed)
+            runs = []
+            for attempt in range(repeat):
+                print(f"Running {rows:,} rows ({attempt + 1}/{repeat})...", flush=True)
+                gc.collect()
+                runs.append(run_pipeline(adjusted_file, template_file, work_dir, track_memory))
+            results.extend(summarize_runs(rows, runs))
+
+    return {
+        "version": RESULTS_VERSION,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "machine": machine_profile(),
+        "settings": {"sizes": list(sizes), "repeat": repeat, "seed": seed, "track_memory": track_memory,
+                     "rss_sampled": True},
+        "results": results
+    }
+
+
+def write_results(document, output_file=None):
+    """
+    Write a results document as JSON.
+
+    Args:
+        document: Results from run_benchmark
+        output_file: Path of the JSON file (timestamped file in benchmarks/ if None)
+
+    Returns:
+        str: Path of the JSON file
+    """
+    if output_file is None:
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        output_file = os.path.join(DEFAULT_RESULTS_DIR, f"bench_{stamp}.json")
+    directory = os.path.dirname(output_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output_file, 'w') as f:
+        json.dump(document, f, indent=2)
+    return output_file
+
+
+def baseline_path(profile_id=None, baseline_dir=None):
+    """
+    Get the baseline file of a machine profile.
+
+    Args:
+        profile_id: Machine profile identifier (current machine if None)
+        baseline_dir: Directory holding the baselines
+
+    Returns:
+        str: Path of the baseline JSON file
+    """
+    return os.path.join(baseline_dir or DEFAULT_BASELINE_DIR, f"{profile_id or machine_profile_id()}.json")
+
+
+def load_results(path):
+    """
+    Read a results document.
+
+    Args:
+        path: Path of the JSON file
+
+    Returns:
+        dict: Results document
+    """
+    with open(path, 'r') as f:
+        document = json.load(f)
+    if document.get("version") != RESULTS_VERSION:
+        raise ValueError(f"Unsupported benchmark results version in {path}: {document.get('version')}")
+    return document
+
+
+def load_budgets(config_manager=None):
+    """
+    Read the regression budgets from config.ini.
+
+    Budgets can be set per stage by prefixing the key with the stage name, for
+    example ``transform_max_slowdown_pct = 10``.
+
+    Args:
+        config_manager: ConfigManager to read from (a new one is created if None)
+
+    Returns:
+        dict: Budget name -> value, plus "stages" with per-stage overrides
+    """
+    config_manager = config_manager or ConfigManager()
+    budgets = {key: config_manager.get_setting(key, default, section="Benchmark")
+               for key, default in DEFAULT_BUDGETS.items()}
+    budgets["stages"] = {}
+    for stage in BENCHMARK_STAGES:
+        overrides = {}
+        for key in ("max_slowdown_pct", "max_memory_growth_pct"):
+            value = config_manager.get_setting(f"{stage}_{key}", None, section="Benchmark")
+            if value is not None:
+                try:
+                    overrides[key] = float(value)
+                except ValueError:
+                    logging.warning(f"Ignoring invalid benchmark budget {stage}_{key} = {value}")
+        if overrides:
+            budgets["stages"][stage] = overrides
+    return budgets
+
+
+def _memory_metric(result, other, rss_comparable=True):
+    """Pick the peak memory figure available in both results (traced peak, else RSS)."""
+    if result.get("traced_peak_mb") is not None and other.get("traced_peak_mb") is not None:
+        return "traced_peak_mb"
+    if rss_comparable and result.get("rss_peak_mb") is not None and other.get("rss_peak_mb") is not None:
+        return "rss_peak_mb"
+    return None
+
+
+def compare_results(baseline, current, budgets=None):
+    """
+    Compare a benchmark run against a baseline.
+
+    A stage regresses on time when its median wall time grew by more than the
+    budget plus the noise of both runs (their interquartile ranges relative to
+    the baseline median). Equivalently, its throughput dropped past the budget.
+    It regresses on memory when its peak grew by more than the budget and by
+    more than ``min_memory_mb``.
+
+    Args:
+        baseline: Baseline results document
+        current: Results document of the new run
+        budgets: Budgets from load_budgets (defaults if None)
+
+    Returns:
+        list: One comparison dict per stage and size present in both runs
+    """
+    if budgets is None:
+        budgets = dict(DEFAULT_BUDGETS, stages={})
+    baseline_results = {(r["rows"], r["stage"]): r for r in baseline["results"]}
+    # Older documents recorded RSS at stage exit, not a sampled peak
+    rss_comparable = all(document["settings"].get("rss_sampled") for document in (baseline, current))
+
+    comparisons = []
+    for result in current["results"]:
+        base = baseline_results.get((result["rows"], result["stage"]))
+        if base is None:
+            continue
+        stage_budgets = budgets.get("stages", {}).get(result["stage"], {})
+        max_slowdown = stage_budgets.get("max_slowdown_pct", budgets["max_slowdown_pct"]) / 100.0
+        max_growth = stage_budgets.get("max_memory_growth_pct", budgets["max_memory_growth_pct"]) / 100.0
+
+        comparison = {"rows": result["rows"], "stage": result["stage"], "time_change": None,
+                      "noise": None, "memory_metric": None, "memory_change": None, "regressions": []}
+
+        base_median = base["wall_seconds_median"]
+        if base_median > 0:
+            comparison["time_change"] = result["wall_seconds_median"] / base_median - 1.0
+            comparison["noise"] = (base["wall_seconds_iqr"] + result["wall_seconds_iqr"]) / base_median
+            gated = max(base_median, result["wall_seconds_median"]) >= budgets["min_stage_seconds"]
+            if gated and comparison["time_change"] > max_slowdown + comparison["noise"]:
+                comparison["regressions"].append(
+                    f"time +{comparison['time_change']:.1%} (budget {max_slowdown:.0%}, "
+                    f"noise {comparison['noise']:.1%})")
+
+        metric = _memory_metric(result, base, rss_comparable)
+        if metric and base[metric]:
+            comparison["memory_metric"] = metric
+            comparison["memory_change"] = result[metric] / base[metric] - 1.0
+            growth_mb = result[metric] - base[metric]
+            if comparison["memory_change"] > max_growth and growth_mb >= budgets["min_memory_mb"]:
+                comparison["regressions"].append(
+                    f"{metric} +{comparison['memory_change']:.1%} ({growth_mb:+.1f} MB, budget {max_growth:.0%})")
+
+        comparisons.append(comparison)
+    return comparisons
+
+
+def format_comparison(comparisons):
+    """
+    Format a comparison as a table.
+
+    Args:
+        comparisons: Result of compare_results
+
+    Returns:
+        str: Multi-line table
+    """
+    lines = [f"{'Rows':>10}  {'Stage':<12}{'Time':>10}{'Noise':>10}{'Memory':>10}  Result"]
+    for comparison in comparisons:
+        time_change = comparison["time_change"]
+        memory_change = comparison["memory_change"]
+        noise = comparison["noise"]
+        lines.append(
+            f"{comparison['rows']:>10,}  {comparison['stage']:<12}"
+            f"{'' if time_change is None else f'{time_change:+.1%}':>10}"
+            f"{'' if noise is None else f'{noise:.1%}':>10}"
+            f"{'' if memory_change is None else f'{memory_change:+.1%}':>10}"
+            f"  {'; '.join(comparison['regressions']) or 'ok'}"
+        )
+    return "\n".join(lines)
+
+
+def format_results(document):
+    """
+    Format a results document as a table.
+
+    Args:
+        document: Results from run_benchmark
+
+    Returns:
+        str: Multi-line table
+    """
+    lines = [f"{'Rows':>10}  {'Stage':<12}{'Median s':>10}{'IQR s':>10}{'Rows/s':>14}{'RSS MB':>10}"]
+    for result in document["results"]:
+        rate = result["rows_per_second"]
+        rss = result["rss_peak_mb"]
+        lines.append(
+            f"{result['rows']:>10,}  {result['stage']:<12}{result['wall_seconds_median']:>10.3f}"
+            f"{result['wall_seconds_iqr']:>10.3f}"
+            f"{'' if rate is None else f'{rate:,.0f}':>14}"
+            f"{'' if rss is None else f'{rss:.1f}':>10}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """
+    Command-line entry point.
+
+    Returns:
+        int: Exit status (0 success, 1 regression found, 2 no usable baseline)
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the conversion pipeline on synthetic data")
+    parser.add_argument("--sizes", type=int, nargs="+", default=None,
+                        help="Row counts to benchmark (default: 1000 10000 100000 1000000, "
+                             "or the baseline's sizes with --compare)")
+    parser.add_argument("--repeat", type=int, default=None,
+                        help=f"Timed runs per size (default: {DEFAULT_REPEAT}, or the baseline's with --compare)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Random seed of the generated data")
+    parser.add_argument("--data-dir", metavar="DIR", default=None,
+                        help="Directory for the generated workbooks (reused between runs)")
+    parser.add_argument("--output", metavar="FILE", default=None,
+                        help="Results JSON file (default: benchmarks/bench_<timestamp>.json)")
+    parser.add_argument("--track-memory", action="store_true",
+                        help="Trace Python allocations per stage (slower)")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Store the results as the baseline of this machine")
+    parser.add_argument("--compare", action="store_true",
+                        help="Compare against the baseline of this machine and fail on regressions")
+    parser.add_argument("--baseline", metavar="FILE", default=None,
+                        help="Baseline file to use instead of the one for this machine")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Show the application's INFO log output")
+    args = parser.parse_args(argv)
+
+    if args.repeat is not None and args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+
+    # Application logging would otherwise dominate the timings of small sizes
+    setup_logging(level=logging.INFO if args.verbose else logging.WARNING)
+
+    try:
+        baseline = None
+        sizes, repeat, track_memory = args.sizes, args.repeat, args.track_memory
+        if args.compare:
+            path = args.baseline or baseline_path()
+            if not os.path.exists(path):
+                print(f"No baseline for this machine ({path}). Run with --save-baseline first.")
+                return 2
+            baseline = load_results(path)
+            if machine_profile_id(baseline["machine"]) != machine_profile_id():
+                print("Warning: the baseline was recorded on a different machine profile")
+            # Same workload as the baseline so every stage has a counterpart
+            settings = baseline["settings"]
+            sizes = sizes or settings["sizes"]
+            repeat = repeat or settings["repeat"]
+            track_memory = track_memory or settings["track_memory"]
+            budgets = load_budgets()
+
+        configure_metrics(track_memory=track_memory)
+        document = run_benchmark(sizes or list(DEFAULT_SIZES), repeat or DEFAULT_REPEAT, args.seed,
+                                 args.data_dir, track_memory)
+        path = write_results(document, args.output)
+        print(format_results(document))
+        print(f"Results written to {path}")
+
+        if args.save_baseline:
+            saved = write_results(document, args.baseline or baseline_path(machine_profile_id(document["machine"])))
+            print(f"Baseline saved to {saved}")
+
+        if baseline is not None:
+            comparisons = compare_results(baseline, document, budgets)
+            print(format_comparison(comparisons))
+            regressions = [c for c in comparisons if c["regressions"]]
+            if regressions:
+                print(f"{len(regressions)} stage(s) regressed past their budget")
+                return 1
+            print("No regressions")
+        return 0
+    finally:
+        shutdown_logging()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,6 +11,7 @@ saved column mappings.
 import os
 import json
 import logging
+import threading
 import configparser
 from datetime import datetime
 
@@ -72,7 +73,26 @@ class ConfigManager:
         if 'Advanced' not in self.config:
             self.config['Advanced'] = {
                 'mapping_confidence_threshold': '70',
-                'fuzzy_match_threshold': '60'
+                'fuzzy_match_threshold': '60',
+                'profile_mode': 'off',
+                'profile_top_n': '25',
+                'profile_sample_interval_ms': '5',
+                'track_memory': 'False',
+                'memory_top_sites': '5',
+                'trace_rows': 'False',
+                'log_max_mb': '10',
+                'log_backup_count': '5',
+                'log_queue_size': '10000',
+                'compress_old_logs': 'True',
+                'startup_budget_ms': '1500',
+                'out_of_core': 'auto',
+                'out_of_core_memory_mb': '512',
+                'spill_dir': '',
+                'transform_workers': '1',
+                'parallel_min_rows': '100000',
+                'write_rate_index': 'False',
+                'fixed_point_rates': 'False',
+                'rate_decimals': '2'
             }
     
     def save_config(self):
@@ -146,6 +166,9 @@ class ConfigManager:
 class MappingConfigManager:
     """Manages saving and loading of column mappings."""
     
+    # Serializes writes to the mappings file across worker threads
+    _write_lock = threading.Lock()
+    
     def __init__(self, config_path=None):
         """
         Initialize the mapping configuration manager.
@@ -214,8 +237,9 @@ class MappingConfigManager:
                 
             self.mappings["metadata"]["updated"] = datetime.now().isoformat()
             
-            with open(self.config_path, 'w') as f:
-                json.dump(self.mappings, f, indent=2)
+            with self._write_lock:
+                with open(self.config_path, 'w') as f:
+                    json.dump(self.mappings, f, indent=2)
                 
             logging.info("Mappings saved successfully")
         except Exception as e:
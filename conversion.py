@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Conversion module for Moxy Rates Template Transfer
+
+This module runs the complete Adjusted Rates to Template conversion without the
+GUI, so that background services can convert files unattended.
+
+`convert` is the stateless core: it takes everything it needs as arguments and
+keeps no state between calls, so it can run on many threads at once.
+"""
+
+import os
+import logging
+import pandas as pd
+
+from file_analyzer import FileAnalyzer
+from mapping_system import MappingSystem
+from config_manager import MappingConfigManager
+from data_processor import DataProcessor
+from pipeline_metrics import RunMetrics
+from profiling import RunProfiler
+from out_of_core import ChunkedTransformer, sheet_needs_streaming
+from parallel_transform import transform_parallel
+from rate_index import write_index_for
+from template_spec import TemplateSpec
+
+
+class ConversionOptions:
+    """Options that control a single conversion."""
+
+    def __init__(self, default_deductible="100", adjusted_sheet=None, out_of_core=None, transform_workers=None):
+        """
+        Initialize conversion options.
+
+        Args:
+            default_deductible: Preferred deductible for the PlanDeduct column
+            adjusted_sheet: Sheet to read when the adjusted source is a file path
+            out_of_core: Stream a file path source through spill files instead of
+                loading it (decided from the sheet size if None)
+            transform_workers: Worker processes for the pivot of an in-memory
+                table (process default if None; 0 for one per CPU)
+        """
+        self.default_deductible = str(default_deductible)
+        self.adjusted_sheet = adjusted_sheet
+        self.out_of_core = out_of_core
+        self.transform_workers = transform_workers
+
+
+class ConversionResult:
+    """Output of a conversion."""
+
+    def __init__(self, data, mapping, rows_in, template_spec, metrics=None):
+        """
+        Initialize the conversion result.
+
+        Args:
+            data: Converted DataFrame in template format
+            mapping: Mapping that was applied (including pivot columns)
+            rows_in: Number of source rows
+            template_spec: TemplateSpec the data was shaped to
+            metrics: RunMetrics with the stage timings of the conversion (optional)
+        """
+        self.data = data
+        self.mapping = mapping
+        self.rows_in = rows_in
+        self.rows_out = len(data)
+        self.template_spec = template_spec
+        self.metrics = metrics
+
+
+def convert(adjusted_source, template_spec, mapping, options=None, metrics=None):
+    """
+    Convert adjusted rates data into the template format.
+
+    Nothing passed in is modified and no state is shared between calls, so any
+    number of conversions can run concurrently on a thread pool.
+
+    Args:
+        adjusted_source: DataFrame of adjusted rates, or path to the Excel file
+            (streamed out of core when it is larger than the memory budget)
+        template_spec: TemplateSpec describing the output sheet
+        mapping: Dictionary of template field -> source column
+        options: ConversionOptions (defaults are used if None)
+        metrics: RunMetrics that receives the stage timings (a new one is created if None)
+
+    Returns:
+        ConversionResult: Converted data and row counts
+    """
+    options = options or ConversionOptions()
+    # transform_data fills in missing pivot columns on the mapping it is given
+    mapping = dict(mapping)
+
+    data_processor = DataProcessor(template_spec)
+    data_processor.default_deductible = options.default_deductible
+
+    owns_metrics = metrics is None
+    if owns_metrics:
+        metrics = RunMetrics(source_file=None if isinstance(adjusted_source, pd.DataFrame) else adjusted_source)
+
+    final_df = None
+    try:
+        streaming = False
+        if not isinstance(adjusted_source, pd.DataFrame):
+            streaming = options.out_of_core
+            if streaming is None:
+                streaming = sheet_needs_streaming(adjusted_source, options.adjusted_sheet)[0]
+
+        if streaming:
+            # Sheets larger than the memory budget are never loaded as a whole
+            transformer = ChunkedTransformer(data_processor)
+            with metrics.stage("transform") as stage:
+                transformed_df = transformer.transform(adjusted_source, options.adjusted_sheet, mapping)
+                stage.rows_in = transformer.rows_in
+                stage.rows_out = len(transformed_df)
+            rows_in = transformer.rows_in
+            if not rows_in:
+                raise ValueError("The adjusted rates file contains no data to process.")
+        else:
+            if isinstance(adjusted_source, pd.DataFrame):
+                adjusted_df = adjusted_source
+            else:
+                with metrics.stage("load") as stage:
+                    adjusted_df = data_processor.load_excel_file(adjusted_source, options.adjusted_sheet)
+                    stage.rows_out = len(adjusted_df)
+            if adjusted_df.empty:
+                raise ValueError("The adjusted rates file contains no data to process.")
+            rows_in = len(adjusted_df)
+
+            with metrics.stage("transform", rows_in=rows_in) as stage:
+                # Large tables are pivoted on worker processes when configured
+                transformed_df = transform_parallel(adjusted_df, mapping, workers=options.transform_workers,
+                                                    default_deductible=options.default_deductible,
+                                                    data_processor=data_processor)
+                stage.rows_out = len(transformed_df)
+        if transformed_df.empty:
+            raise ValueError("The data transformation process resulted in no data.")
+
+        with metrics.stage("integrate", rows_in=len(transformed_df)) as stage:
+            final_df = data_processor.integrate_with_template(transformed_df, template_spec)
+            if final_df.empty:
+                final_df = transformed_df
+            stage.rows_out = len(final_df)
+    finally:
+        if owns_metrics:
+            metrics.finish("ok" if final_df is not None else "failed")
+
+    return ConversionResult(final_df, mapping, rows_in, template_spec, metrics)
+
+
+def run_conversion(adjusted_file, template_file, output_file, adjusted_sheet=None,
+                   template_sheet=None, mapping_config=None, default_deductible="100",
+                   use_saved_mappings=True, progress_callback=None):
+    """
+    Convert an Adjusted Rates file into the template format.
+
+    Every call uses its own analyzer, mapping system and processor instances, so
+    several conversions can run at the same time on different threads.
+
+    Args:
+        adjusted_file: Path to the Adjusted Rates Excel file
+        template_file: Path to the Template Excel file
+        output_file: Path of the Excel file to create
+        adjusted_sheet: Sheet to read from the adjusted file (auto-detected if None)
+        template_sheet: Sheet to read from the template (first sheet if None)
+        mapping_config: MappingConfigManager for saved mappings (optional)
+        default_deductible: Preferred deductible for the PlanDeduct column
+        use_saved_mappings: Whether to reuse mappings saved for the same file layout
+        progress_callback: Optional callable(message, percent) for progress updates
+
+    Returns:
+        dict: Summary of the conversion (output file, row counts, mapping)
+    """
+    def report(message, percent):
+        logging.info(message)
+        if progress_callback:
+            progress_callback(message, percent)
+
+    file_analyzer = FileAnalyzer()
+    mapping_system = MappingSystem(mapping_config or MappingConfigManager())
+    data_processor = DataProcessor()
+    metrics = RunMetrics(source_file=adjusted_file)
+
+    # Profiles the whole run when profiling is enabled (see profiling.configure_profiling)
+    profiler = RunProfiler(label=os.path.splitext(os.path.basename(adjusted_file))[0])
+    with profiler:
+        try:
+            # Resolve sheets and build required fields from the template header
+            report("Analyzing template structure...", 10)
+            with metrics.stage("analyze") as stage:
+                if not adjusted_sheet:
+                    adjusted_sheet = file_analyzer.analyze_workbook(adjusted_file)["main_sheet"]
+                template_spec = TemplateSpec.from_file(template_file, template_sheet)
+                mapping_system.set_required_fields(list(template_spec.required_fields))
+
+                report("Analyzing adjusted rates file...", 20)
+                adjusted_structure = file_analyzer.analyze_file_structure(adjusted_file, adjusted_sheet)
+                source_columns = list(adjusted_structure['columns'].keys())
+                stage.rows_in = adjusted_structure.get('row_count')
+
+            report(f"Generating column mapping for {len(source_columns)} columns...", 30)
+            with metrics.stage("map"):
+                mapping = mapping_system.generate_mapping(adjusted_structure, use_saved_mappings=use_saved_mappings)
+                mapping_system.detect_pivot_columns(source_columns, mapping, adjusted_structure)
+                signature = mapping_system._generate_file_signature(adjusted_structure)
+
+            options = ConversionOptions(default_deductible=default_deductible, adjusted_sheet=adjusted_sheet)
+            if adjusted_structure.get('out_of_core'):
+                # Too large to load: convert streams the sheet through spill files
+                options.out_of_core = True
+                report(f"Transforming data out of core (about {adjusted_structure['row_count']} rows)...", 60)
+                result = convert(adjusted_file, template_spec, mapping, options, metrics=metrics)
+            else:
+                # Load data
+                report("Loading source data...", 45)
+                with metrics.stage("load") as stage:
+                    adjusted_df = data_processor.load_excel_file(adjusted_file, adjusted_sheet)
+                    stage.rows_out = len(adjusted_df)
+
+                # Transform and integrate
+                report(f"Transforming data ({len(adjusted_df)} rows)...", 60)
+                result = convert(adjusted_df, template_spec, mapping, options, metrics=metrics)
+            final_df = result.data
+            row_count = result.rows_in
+
+            # Save output
+            if not output_file.lower().endswith(('.xlsx', '.xls')):
+                output_file = output_file + '.xlsx'
+            output_dir = os.path.dirname(output_file)
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+
+            report(f"Saving output file with {len(final_df)} rows...", 90)
+            with metrics.stage("save", rows_in=len(final_df)):
+                data_processor.save_excel_file(final_df, output_file, sheet_name=template_spec.sheet_name)
+            rate_index_file = write_index_for(final_df, output_file)
+        except Exception as e:
+            metrics.finish("failed", e)
+            metrics.write()
+            raise
+
+    metrics.finish()
+    metrics.write()
+    logging.info(metrics.format_summary())
+
+    report(f"Processing complete! Created file with {len(final_df)} rows", 100)
+
+    return {
+        "output_file": output_file,
+        "rate_index_file": rate_index_file,
+        "adjusted_sheet": adjusted_sheet,
+        "template_sheet": template_spec.sheet_name,
+        "rows_in": row_count,
+        "rows_out": len(final_df),
+        "mapping": result.mapping,
+        "mapping_signature": signature,
+        "metrics": metrics.to_dict(),
+        "profile_files": profiler.output_files
+    }
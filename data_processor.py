@@ -9,18 +9,142 @@ Excel data between Adjusted Rates and Template files.
 """
 
 import os
+import re
 import logging
+import numpy as np
 import pandas as pd
 import openpyxl
+from openpyxl.utils import get_column_letter
+
+from rate_table import (RateTable, DEFAULT_RATE_DECIMALS, deductible_amount,
+                        to_fixed_point, format_fixed_point)
+from template_spec import TemplateSpec
+
+# Per-row tracing for diagnosing individual files. Off by default: on large
+# files it produces several log lines per source row.
+row_trace = logging.getLogger("rowtrace")
+row_trace.setLevel(logging.WARNING)
+
+
+def set_row_tracing(enabled):
+    """
+    Enable or disable per-row tracing in the transform hot path.
+    
+    Args:
+        enabled: Whether to log every pivoted row at DEBUG level
+    """
+    row_trace.setLevel(logging.DEBUG if enabled else logging.WARNING)
+
+
+# Decimal places of fixed-point rates; None keeps rates as they were read
+_rate_settings = {"decimals": None}
+
+
+def configure_fixed_point_rates(enabled, decimals=DEFAULT_RATE_DECIMALS):
+    """
+    Hold pivoted rates as int64 fixed point (cents by default) in every new DataProcessor.
+    
+    Rates are then exact, and are written as decimal text with all their
+    decimal places ("300.00" rather than "300.0").
+    
+    Args:
+        enabled: Whether to use fixed-point rates
+        decimals: Decimal places kept (2 for cents)
+    """
+    _rate_settings["decimals"] = decimals if enabled else None
+
+
+# Source columns that already hold the rates of one deductible (Deduct100, Deductible_500, ...)
+WIDE_DEDUCTIBLE_PATTERN = re.compile(r'(?i)deduct(?:ible)?[\s_]?(\d+)$')
+
+
+def as_row_values(values, row_dtype=object):
+    """
+    Convert values to the dtype of the rows DataFrame.iterrows yields.
+    
+    iterrows gives every row the common dtype of all columns, so in a table
+    of only numeric columns an integer 12 is seen as 12.0.
+    
+    Args:
+        values: Series, Index or array
+        row_dtype: Common dtype of the table (see DataFrame.to_numpy)
+        
+    Returns:
+        ndarray: The converted values
+    """
+    if row_dtype == object:
+        return np.asarray(values, dtype=object)
+    return np.asarray(values).astype(row_dtype)
+
+
+def cell_text(value):
+    """Text of a cell as the pivot writes it into a group key."""
+    return str(value) if pd.notna(value) else ""
+
+
+def encode_column(column, row_dtype=object):
+    """
+    Factorize a column into integer codes and the text of each code.
+    
+    Every distinct value is turned into text once, instead of once per row.
+    Values with the same text share a code, and codes are numbered in order
+    of first appearance.
+    
+    Args:
+        column (Series): Column to encode
+        row_dtype: Common dtype of the table the column belongs to
+        
+    Returns:
+        tuple: (codes array with one code per row, object array with the text of each code)
+    """
+    if column.dtype == object and pd.api.types.infer_dtype(column, skipna=False).startswith('mixed'):
+        # factorize treats 1, 1.0 and True as one value, but their texts differ
+        cells = np.asarray(column, dtype=object)
+        type_codes = pd.factorize(np.frompyfunc(type, 1, 1)(cells))[0]
+        codes = combine_codes([pd.factorize(cells, use_na_sentinel=False)[0], type_codes], len(cells))
+        values = cells[np.unique(codes, return_index=True)[1]]
+    else:
+        codes, uniques = pd.factorize(column, use_na_sentinel=False)
+        values = as_row_values(uniques, row_dtype)
+    texts = np.array([cell_text(v) for v in values], dtype=object)
+    text_codes, text_uniques = pd.factorize(texts)
+    return text_codes[codes], np.asarray(text_uniques, dtype=object)
+
+
+def combine_codes(code_columns, length):
+    """
+    Number the distinct combinations of several code columns in order of first appearance.
+    
+    Args:
+        code_columns: Integer code arrays of equal length
+        length: Number of rows (used when there are no code columns)
+        
+    Returns:
+        ndarray: One combination code per row
+    """
+    combined = np.zeros(length, dtype=np.int64)
+    for codes in code_columns:
+        if length:
+            combined = pd.factorize(combined * (int(codes.max()) + 1) + codes)[0]
+    return combined
 
 
 class DataProcessor:
     """Handles Excel data processing operations."""
     
-    def __init__(self):
-        """Initialize the data processor."""
+    def __init__(self, template_spec=None):
+        """
+        Initialize the data processor.
+        
+        Args:
+            template_spec: TemplateSpec of the output template (the standard template if None)
+        """
         logging.info("DataProcessor initialized")
         self.default_deductible = "100"  # Default value, can be changed by user
+        # Columns every stage shapes its output to
+        self.template_spec = template_spec or TemplateSpec.standard()
+        # Decimal places of fixed-point rates (None for rates as read)
+        self.rate_decimals = _rate_settings["decimals"]
     
     def load_excel_file(self, file_path, sheet_name=None):
         """
@@ -101,8 +225,8 @@ class DataProcessor:
         try:
             logging.info("STEP 1: Starting data transformation process")
             logging.info(f"Source data shape: {source_df.shape}")
-            logging.info(f"Source columns: {source_df.columns.tolist()}")
-            logging.info(f"Mapping: {mapping}")
+            logging.debug("Source columns: %s", source_df.columns.tolist())
+            logging.debug("Mapping: %s", mapping)
             
             # Safety check - return source df if empty
             if source_df.empty:
@@ -110,56 +234,22 @@ class DataProcessor:
                 return source_df
             
             # Log a sample row for debugging
-            if len(source_df) > 0:
-                logging.info(f"Sample source row: {source_df.iloc[0].to_dict()}")
+            if len(source_df) > 0 and logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug("Sample source row: %s", source_df.iloc[0].to_dict())
             
-            # STEP 2: Check for Deductible and RateCost in mapping
-            if "Deductible" not in mapping or "RateCost" not in mapping:
-                logging.error("Missing required mapping for pivot operations: Deductible and/or RateCost")
-                deductible_cols = [col for col in mapping.keys() if "deduct" in str(col).lower()]
-                cost_cols = [col for col in mapping.keys() if any(x in str(col).lower() for x in ["rate", "cost", "premium"])]
-                
-                logging.info(f"Potential deductible columns: {deductible_cols}")
-                logging.info(f"Potential rate/cost columns: {cost_cols}")
-                
-                # Try to auto-detect if possible
-                if "Deductible" not in mapping and deductible_cols:
-                    mapping["Deductible"] = deductible_cols[0]
-                    logging.info(f"Auto-assigned Deductible mapping to {deductible_cols[0]}")
-                
-                if "RateCost" not in mapping and cost_cols:
-                    mapping["RateCost"] = cost_cols[0]
-                    logging.info(f"Auto-assigned RateCost mapping to {cost_cols[0]}")
-                
-                # Check again after auto-detection
-                if "Deductible" not in mapping or "RateCost" not in mapping:
-                    logging.warning("Cannot perform pivot operation due to missing mappings. Returning source data.")
-                    return source_df
-            
-            # STEP 3: Create inverse mapping from template fields to source columns
-            logging.info("STEP 3: Creating mapping from template fields to source columns")
-            inverse_mapping = {}
-            for field, source_col in mapping.items():
-                if source_col and field and source_col in source_df.columns:
-                    inverse_mapping[field] = source_col
-            
-            # Check if we have the essential mappings
-            source_deductible_col = inverse_mapping.get("Deductible")
-            source_rate_cost_col = inverse_mapping.get("RateCost")
-            
-            if not source_deductible_col or not source_rate_cost_col:
-                logging.error(f"Missing essential columns: Deductible={source_deductible_col}, RateCost={source_rate_cost_col}")
+            # Sources with a column per deductible are already in the template layout
+            wide_columns = self.wide_deductible_columns(source_df.columns, mapping)
+            if wide_columns:
+                return self.transform_wide(source_df, mapping, wide_columns)
+            
+            # STEP 2-3: Resolve the pivot columns and map template fields to source columns
+            inverse_mapping = self.resolve_pivot_mapping(source_df.columns, mapping)
+            if inverse_mapping is None:
                 return source_df
             
             # STEP 4: Create a new DataFrame with renamed columns
             logging.info("STEP 4: Renaming columns according to mapping")
-            renamed_df = pd.DataFrame()
-            
-            # Copy columns with their new names
-            for template_field, source_col in inverse_mapping.items():
-                if source_col in source_df.columns:
-                    renamed_df[template_field] = source_df[source_col].fillna('')
-                    logging.info(f"Renamed column {source_col} to {template_field}")
+            renamed_df = self.rename_for_pivot(source_df, inverse_mapping)
             
             # STEP 5: Prepare for pivoting
             logging.info("STEP 5: Preparing for pivot operation")
@@ -176,75 +266,25 @@ class DataProcessor:
             logging.info(f"Will group by these columns for pivoting: {group_cols}")
             
             # Log sample data before pivoting
-            if len(renamed_df) > 0:
-                logging.info(f"Sample data before pivoting: {renamed_df.iloc[0].to_dict()}")
+            if len(renamed_df) > 0 and logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug("Sample data before pivoting: %s", renamed_df.iloc[0].to_dict())
             
             # STEP 6: Prepare dictionaries for the pivot
             logging.info("STEP 6: Executing pivot operation")
             
             try:
-                # Create a dictionary to store the grouped data
-                grouped_data = {}
+                # Per-row tracing is checked once, not on every row
+                trace = row_trace.isEnabledFor(logging.DEBUG)
+                result_df, skipped_invalid, skipped_non_numeric, overwritten = self.pivot_rows(
+                    renamed_df, group_cols, trace=trace)
                 
-                # Process each row
-                for idx, row in renamed_df.iterrows():
-                    # Create a key from the group columns
-                    key_parts = []
-                    for col in group_cols:
-                        val = row.get(col)
-                        # For Series objects (can happen with duplicate column names)
-                        if isinstance(val, pd.Series):
-                            val = val.iloc[0] if not val.empty else None
-                        key_parts.append(str(val) if pd.notna(val) else "")
-                    
-                    key = "||".join(key_parts)
-                    
-                    # Get deductible and rate cost
-                    try:
-                        deductible = str(row['Deductible']).strip() if pd.notna(row.get('Deductible')) else ""
-                        rate_cost = row.get('RateCost') if pd.notna(row.get('RateCost')) else None
-                        
-                        # Handle Series objects
-                        if isinstance(deductible, pd.Series):
-                            deductible = str(deductible.iloc[0]).strip() if not deductible.empty else ""
-                        if isinstance(rate_cost, pd.Series):
-                            rate_cost = rate_cost.iloc[0] if not rate_cost.empty else None
-                    except Exception as e:
-                        logging.warning(f"Error getting deductible or rate cost: {str(e)}")
-                        continue
-                    
-                    # Skip rows with empty values
-                    if not deductible or deductible.lower() == 'nan' or rate_cost is None:
-                        logging.info(f"Skipping row with invalid deductible: {deductible} or missing rate cost")
-                        continue
-                    
-                    # If this key doesn't exist, create a new entry
-                    if key not in grouped_data:
-                        entry = {}
-                        # Add the group column values
-                        for i, col in enumerate(group_cols):
-                            entry[col] = key_parts[i]
-                        
-                        grouped_data[key] = entry
-                        logging.info(f"Created new entry for key: {key}")
-                    
-                    # Add the deductible value column 
-                    # Clean up the deductible value
-                    deductible_clean = ''.join(c for c in deductible if c.isdigit())
-                    if not deductible_clean:
-                        logging.warning(f"Deductible '{deductible}' has no numeric characters, skipping")
-                        continue
-                    
-                    # Create the deductible column name following exact format: "Deduct50", "Deduct100", etc.
-                    deduct_col = f"Deduct{deductible_clean}"
-                    logging.info(f"Created deductible column: '{deduct_col}' from value '{deductible}'")
-                    
-                    # Add the rate cost to the appropriate deductible column
-                    grouped_data[key][deduct_col] = rate_cost
-                    logging.info(f"Added {deduct_col}={rate_cost} to key: {key}")
-                
-                # Convert the dictionary to a DataFrame
-                result_df = pd.DataFrame(list(grouped_data.values()))
+                # One summary line instead of several lines per row
+                logging.info(f"Pivoted {len(renamed_df)} rows into {len(result_df)} groups "
+                             f"({skipped_invalid} rows without deductible or rate, "
+                             f"{skipped_non_numeric} with non-numeric deductible, "
+                             f"{overwritten} duplicate deductible values overwritten)")
+                if skipped_non_numeric:
+                    logging.warning(f"{skipped_non_numeric} rows had a deductible without numeric characters and were skipped")
                 
                 if result_df.empty:
                     logging.warning("Pivot produced no data, returning renamed DataFrame")
@@ -259,27 +299,8 @@ class DataProcessor:
                 # Fallback method if the above fails
                 result_df = renamed_df
             
-            # STEP 7: Initialize any missing required columns with empty string
-            required_cols = [
-                'CompanyCode', 'Term', 'Miles', 'FromMiles', 'ToMiles', 'Coverage', 
-                'State', 'Class', 'PlanDeduct', 'Markup', 'New/Used', 'MaxYears', 
-                'SurchargeCode', 'PlanCode', 'RateCardCode', 'ClassListCode', 
-                'MinYear', 'IncScCode', 'IncScAmt'
-            ]
-            
-            for col in required_cols:
-                if col not in result_df.columns:
-                    result_df[col] = ''
-            
-            # Initialize standard deductible columns with empty string if missing
-            standard_deducts = ['Deduct0', 'Deduct50', 'Deduct100', 'Deduct200', 'Deduct250', 'Deduct500']
-            for deduct_col in standard_deducts:
-                if deduct_col not in result_df.columns:
-                    result_df[deduct_col] = ''
-            
-            # Ensure all empty values are properly set to empty string
-            for col in result_df.columns:
-                result_df[col] = result_df[col].fillna('')
+            # STEP 7: Template columns, empty cells and column order
+            result_df = self.finish_transform(result_df, group_cols)
             
             logging.info(f"Final transformed data shape: {result_df.shape}")
             logging.info(f"Final columns: {result_df.columns.tolist()}")
@@ -290,6 +311,471 @@ class DataProcessor:
             logging.error(f"Error in data transformation: {str(e)}", exc_info=True)
             return source_df
     
+    def rename_for_pivot(self, source_df, inverse_mapping):
+        """
+        Copy the mapped source columns under their template names, with empty cells as ''.
+        
+        Args:
+            source_df (DataFrame): The source data
+            inverse_mapping: Template field -> source column
+            
+        Returns:
+            DataFrame: Renamed columns
+        """
+        renamed_df = pd.DataFrame()
+        for template_field, source_col in inverse_mapping.items():
+            if source_col in source_df.columns:
+                renamed_df[template_field] = source_df[source_col].fillna('')
+                logging.debug("Renamed column %s to %s", source_col, template_field)
+        return renamed_df
+    
+    def wide_deductible_columns(self, source_columns, mapping):
+        """
+        Find the source columns that already hold the rates of one deductible each.
+        
+        Such "wide" sources (Deduct0, Deduct100, Deductible 500, ...) are in the
+        template layout and need no pivot. Columns mapped to a DeductN template
+        field count as well. A mapped Deductible column that is not one of them
+        means the source is in the long layout.
+        
+        Args:
+            source_columns: Columns of the source data
+            mapping (dict): The mapping from template fields to source columns
+            
+        Returns:
+            dict: Source column -> DeductN column in source order, or an empty
+            dict if the source has to be pivoted
+        """
+        deductible_source = mapping.get("Deductible")
+        if (deductible_source in source_columns and mapping.get("RateCost") in source_columns
+                and not WIDE_DEDUCTIBLE_PATTERN.match(str(deductible_source))):
+            return {}
+        
+        mapped = {source: field for field, source in mapping.items()
+                  if source in source_columns and deductible_amount(field) is not None}
+        wide_columns = {}
+        for col in source_columns:
+            if col in mapped:
+                deduct_col = mapped[col]
+            else:
+                match = WIDE_DEDUCTIBLE_PATTERN.match(str(col))
+                if not match:
+                    continue
+                deduct_col = f"Deduct{match.group(1)}"
+            if deduct_col in wide_columns.values():
+                logging.warning(f"Ignoring source column {col}, another column already holds {deduct_col}")
+                continue
+            wide_columns[col] = deduct_col
+        return wide_columns
+    
+    def transform_wide(self, source_df, mapping, wide_columns):
+        """
+        Map a source that already has a column per deductible, without pivoting.
+        
+        Columns are renamed to their template fields with vectorized operations,
+        so this runs at about the speed of copying the table. Every source row
+        with at least one rate becomes one output row; rows of the same group
+        are not merged. Values are kept as read (fixed-point rates are formatted
+        as in a pivot).
+        
+        Args:
+            source_df (DataFrame): The source data
+            mapping (dict): The mapping from template fields to source columns
+            wide_columns (dict): Source column -> DeductN column (see wide_deductible_columns)
+            
+        Returns:
+            DataFrame: Transformed data
+        """
+        logging.info(f"STEP 2: Source already has {len(wide_columns)} deductible columns "
+                     f"({', '.join(wide_columns.values())}), mapping them without a pivot")
+        
+        group_cols = [field for field, source_col in mapping.items()
+                      if field and source_col in source_df.columns and source_col not in wide_columns
+                      and field not in ('Deductible', 'RateCost', 'PlanDeduct') and deductible_amount(field) is None]
+        columns = {field: source_df[mapping[field]] for field in group_cols}
+        columns.update((deduct_col, source_df[source_col]) for source_col, deduct_col in wide_columns.items())
+        result_df = pd.DataFrame(columns).reset_index(drop=True)
+        
+        # Rows without a single rate (blank rows at the end of a sheet, for example) have no group
+        deduct_cols = list(wide_columns.values())
+        rates = result_df[deduct_cols]
+        has_rate = (rates.notna() & rates.ne('')).any(axis=1).to_numpy()
+        if not has_rate.all():
+            logging.info(f"Skipping {int((~has_rate).sum())} rows without a rate")
+            result_df = result_df[has_rate].reset_index(drop=True)
+        
+        if self.rate_decimals is not None:
+            result_df = self._format_wide_rates(result_df, deduct_cols)
+        
+        result_df = self.order_transformed_columns(self.add_template_columns(result_df).fillna(''), group_cols)
+        
+        logging.info(f"Final transformed data shape: {result_df.shape}")
+        logging.info(f"Final columns: {result_df.columns.tolist()}")
+        return result_df
+    
+    def _format_wide_rates(self, df, deduct_cols):
+        """Format the rates of DeductN columns as fixed-point text, keeping them as read if one is not a number."""
+        formatted = {}
+        rounded = 0
+        for col in deduct_cols:
+            values = df[col].to_numpy()
+            scaled, parsed, column_rounded = to_fixed_point(values, self.rate_decimals)
+            blank = pd.isna(values) | np.array([isinstance(value, str) and value == '' for value in values], dtype=bool)
+            if not (parsed | blank).all():
+                logging.warning(f"Keeping rates as read instead of fixed point: {col} has rates that are not numbers")
+                return df
+            rounded += column_rounded
+            formatted[col] = np.where(parsed, format_fixed_point(scaled, self.rate_decimals), '')
+        if rounded:
+            logging.warning(f"{rounded} rates had more than {self.rate_decimals} decimal places and were rounded")
+        return df.assign(**formatted)
+    
+    def unpivot_data(self, df):
+        """
+        Turn transformed or template data back into the long Deductible/RateCost layout.
+        
+        The reverse of transform_data: every non-empty DeductN cell becomes one
+        row holding the other columns of its row, the deductible amount and the
+        rate. Rows keep their order, with the deductibles of a row in amount
+        order. Empty cells are dropped with one mask over all DeductN columns.
+        
+        Args:
+            df (DataFrame or RateTable): Data with DeductN columns
+            
+        Returns:
+            DataFrame: The other columns in their order, then Deductible and RateCost
+            
+        Raises:
+            ValueError: If the data has no DeductN columns
+        """
+        if isinstance(df, RateTable):
+            df = df.to_dataframe(empty=np.nan)
+        
+        deduct_cols = sorted((col for col in df.columns if deductible_amount(col) is not None),
+                             key=lambda col: int(deductible_amount(col)))
+        if not deduct_cols:
+            raise ValueError("The data has no DeductN columns to unpivot")
+        other_cols = [col for col in df.columns if col not in deduct_cols]
+        
+        rates = df[deduct_cols].to_numpy()
+        present = pd.notna(rates)
+        if rates.dtype == object:
+            present &= rates != ''
+        rows, cols = np.nonzero(present)
+        
+        result_df = df[other_cols].iloc[rows].reset_index(drop=True)
+        amounts = np.array([int(deductible_amount(col)) for col in deduct_cols], dtype=np.int64)
+        result_df['Deductible'] = amounts[cols]
+        result_df['RateCost'] = rates[rows, cols]
+        
+        logging.info(f"Unpivoted {len(df)} rows with {len(deduct_cols)} deductible columns "
+                     f"into {len(result_df)} rates")
+        return result_df
+    
+    def transform_to_rate_table(self, source_df, mapping):
+        """
+        Pivot the source data into a RateTable.
+        
+        Groups and rates are the same as in transform_data, without the empty
+        template columns transform_data adds.
+        
+        Args:
+            source_df (DataFrame): The source data
+            mapping (dict): The mapping from source to template columns
+            
+        Returns:
+            RateTable: Pivoted rates
+            
+        Raises:
+            ValueError: If the data has no Deductible and RateCost columns or a rate is not a number
+        """
+        inverse_mapping = self.resolve_pivot_mapping(source_df.columns, mapping)
+        if inverse_mapping is None:
+            raise ValueError("Cannot pivot the data without Deductible and RateCost columns")
+        renamed_df = self.rename_for_pivot(source_df, inverse_mapping)
+        group_cols = [col for col in renamed_df.columns if col not in ['Deductible', 'RateCost', 'PlanDeduct']]
+        table, skipped_invalid, skipped_non_numeric, overwritten = self.pivot_rows(
+            renamed_df, group_cols, trace=row_trace.isEnabledFor(logging.DEBUG), as_table=True)
+        logging.info(f"Pivoted {len(renamed_df)} rows into a rate table of {len(table)} groups "
+                     f"and {len(table.deductibles)} deductibles ({skipped_invalid} rows without deductible or rate, "
+                     f"{skipped_non_numeric} with non-numeric deductible, {overwritten} overwritten)")
+        return table
+    
+    def pivot_rows(self, renamed_df, group_cols, trace=False, as_table=False, keep_rates=False):
+        """
+        Pivot renamed rows into one row per group with a DeductN column per deductible.
+        
+        The group columns are factorized into integer codes and rows are grouped
+        on the codes, so each distinct value is turned into text only once. The
+        result is the same as building "||"-joined text keys row by row: groups
+        in order of their first row with a deductible and rate, group values as
+        text, and the last rate winning when a group repeats a deductible.
+        
+        Args:
+            renamed_df (DataFrame): Rows with template column names, including
+                Deductible and RateCost
+            group_cols: Columns that identify a group, in key order
+            trace: Log every row to the row trace logger
+            as_table: Return the pivoted rows as a RateTable instead of a DataFrame
+            keep_rates: Keep the rates as read, with NaN where a group has none
+                (for partitions formatted together by format_pivoted_rates)
+            
+        Returns:
+            tuple: (pivoted DataFrame or RateTable, rows without deductible or
+            rate, rows with a non-numeric deductible, duplicate deductible values
+            overwritten)
+            
+        Raises:
+            ValueError: If as_table is set and a rate is not a number
+        """
+        # Values are seen as DataFrame.iterrows would give them
+        row_dtype = renamed_df.iloc[:0].to_numpy().dtype
+        
+        deduct_codes, deduct_texts = encode_column(renamed_df['Deductible'], row_dtype)
+        deduct_texts = [text.strip() for text in deduct_texts]
+        has_deductible = np.array([bool(text) and text.lower() != 'nan' for text in deduct_texts], dtype=bool)
+        rate_costs = as_row_values(renamed_df['RateCost'], row_dtype)
+        positions = np.flatnonzero(has_deductible[deduct_codes] & pd.notna(rate_costs))
+        skipped_invalid = len(renamed_df) - len(positions)
+        
+        # Group rows with a deductible and rate on their key codes
+        key_codes = []
+        key_texts = []
+        for col in group_cols:
+            codes, texts = encode_column(renamed_df[col], row_dtype)
+            key_codes.append(codes[positions])
+            key_texts.append(texts)
+        group_ids = combine_codes(key_codes, len(positions))
+        first_rows = np.unique(group_ids, return_index=True)[1]
+        if any('|' in text for texts in key_texts for text in texts):
+            # Values containing the separator can join into the same text key
+            joined = np.array(["||".join(texts[codes[i]] for texts, codes in zip(key_texts, key_codes))
+                               for i in first_rows], dtype=object)
+            group_ids = pd.factorize(joined)[0][group_ids]
+            first_rows = np.unique(group_ids, return_index=True)[1]
+        
+        # Deductibles that clean to the same digits share a column
+        clean_codes, clean_values = pd.factorize(np.array(
+            [''.join(c for c in text if c.isdigit()) for text in deduct_texts], dtype=object))
+        row_clean = clean_codes[deduct_codes[positions]] if len(clean_codes) else np.zeros(0, dtype=np.int64)
+        numeric = np.asarray(clean_values, dtype=object)[row_clean] != ''
+        skipped_non_numeric = int((~numeric).sum())
+        
+        # The last rate of each group and deductible wins
+        pairs = group_ids[numeric] * len(clean_values) + row_clean[numeric]
+        reversed_first = np.unique(pairs[::-1], return_index=True)[1]
+        last = len(pairs) - 1 - reversed_first
+        overwritten = len(pairs) - len(last)
+        value_rows = positions[numeric][last]
+        value_groups = group_ids[numeric][last]
+        value_columns = row_clean[numeric][last]
+        cells = []
+        for clean_code in pd.unique(value_columns[np.argsort(value_rows, kind='stable')]):
+            selected = value_columns == clean_code
+            cells.append((clean_values[clean_code], value_groups[selected], rate_costs[value_rows[selected]]))
+        
+        if trace:
+            self._trace_pivot(renamed_df, positions, group_ids, first_rows, deduct_texts, deduct_codes,
+                              numeric, rate_costs, key_texts, key_codes)
+        
+        group_codes = np.zeros((len(first_rows), len(group_cols)), dtype=np.int64)
+        for i, codes in enumerate(key_codes):
+            group_codes[:, i] = codes[first_rows]
+        table = None
+        if not keep_rates:
+            try:
+                table = RateTable.from_groups(group_cols, group_codes, key_texts, len(first_rows), cells,
+                                              skip_empty=as_table, decimals=self.rate_decimals)
+            except ValueError as e:
+                if as_table:
+                    raise
+                # Rates that are not numbers (text, booleans) keep their values in a DataFrame
+                if self.rate_decimals is not None:
+                    logging.warning(f"Keeping rates as read instead of fixed point: {str(e)}")
+        
+        if as_table:
+            result = table
+        elif table is not None:
+            result = table.to_dataframe(empty=np.nan)
+        else:
+            columns = {col: texts[codes].tolist() for col, texts, codes in zip(group_cols, key_texts, group_codes.T)}
+            for amount, groups, rates in cells:
+                values = np.full(len(first_rows), np.nan, dtype=object)
+                values[groups] = rates
+                columns[f"Deduct{amount}"] = values.tolist()
+            result = pd.DataFrame(columns) if columns else pd.DataFrame(index=range(len(first_rows)))
+        return result, skipped_invalid, skipped_non_numeric, overwritten
+    
+    def _trace_pivot(self, renamed_df, positions, group_ids, first_rows, deduct_texts, deduct_codes,
+                     numeric, rate_costs, key_texts, key_codes):
+        """Log what the pivot did with every row (row tracing only)."""
+        valid = dict(zip(positions.tolist(), range(len(positions))))
+        created = set(first_rows.tolist())
+        for position, idx in enumerate(renamed_df.index):
+            deductible = deduct_texts[deduct_codes[position]]
+            i = valid.get(position)
+            if i is None:
+                row_trace.debug("Skipping row %s with invalid deductible: %r or missing rate cost", idx, deductible)
+                continue
+            key = "||".join(texts[codes[i]] for texts, codes in zip(key_texts, key_codes))
+            if i in created:
+                row_trace.debug("Created new entry for key: %s", key)
+            if not numeric[i]:
+                row_trace.debug("Deductible %r has no numeric characters, skipping", deductible)
+                continue
+            deduct_col = f"Deduct{''.join(c for c in deductible if c.isdigit())}"
+            row_trace.debug("Added %s=%s to key: %s", deduct_col, rate_costs[position], key)
+    
+    def format_pivoted_rates(self, df, deduct_cols):
+        """
+        Format rates pivoted in partitions with keep_rates as one pivot of the whole table would.
+        
+        Whether every rate is a number, and which rate columns are all integers
+        or have gaps, depends on all partitions, so it is decided once they are
+        concatenated.
+        
+        Args:
+            df (DataFrame): Concatenated partitions with a RangeIndex, NaN where a group has no rate
+            deduct_cols: DeductN columns created by the pivot
+            
+        Returns:
+            DataFrame: The same DataFrame with its rate columns formatted
+        """
+        cells = []
+        for col in deduct_cols:
+            values = df[col].to_numpy()
+            rows = np.flatnonzero(pd.notna(values))
+            cells.append((deductible_amount(col), rows, values[rows]))
+        try:
+            table = RateTable.from_groups([], np.zeros((len(df), 0), dtype=np.int64), [], len(df), cells,
+                                          decimals=self.rate_decimals)
+        except ValueError as e:
+            # Rates that are not numbers (text, booleans) keep their values
+            if self.rate_decimals is not None:
+                logging.warning(f"Keeping rates as read instead of fixed point: {str(e)}")
+            return df
+        
+        formatted = table.to_dataframe(empty=np.nan)
+        for col in deduct_cols:
+            df[col] = formatted[f"Deduct{deductible_amount(col)}"].to_numpy()
+        return df
+    
+    def finish_transform(self, result_df, group_cols):
+        """
+        Add the template columns the data does not have, set empty cells to ''
+        and put the columns in their fixed order.
+        
+        Args:
+            result_df (DataFrame): Pivoted (or, on failure, renamed) rows
+            group_cols: Group key columns, in key order
+            
+        Returns:
+            DataFrame: Transformed data
+        """
+        result_df = self.add_template_columns(result_df)
+        
+        # Ensure all empty values are properly set to empty string
+        for col in result_df.columns:
+            result_df[col] = result_df[col].fillna('')
+        
+        # Same column order however the rows were grouped (see order_transformed_columns)
+        if 'RateCost' not in result_df.columns:
+            result_df = self.order_transformed_columns(result_df, group_cols)
+        return result_df
+    
+    def add_template_columns(self, df):
+        """
+        Add the template columns a DataFrame lacks, filled with empty strings.
+        
+        Args:
+            df (DataFrame): Transformed data
+            
+        Returns:
+            DataFrame: The same DataFrame, with every template column
+        """
+        spec = self.template_spec
+        for col in spec.columns:
+            if col not in df.columns:
+                df[col] = ''
+        return df
+    
+    def order_transformed_columns(self, df, group_cols):
+        """
+        Put transformed columns in a fixed order: group columns, deductible
+        columns by amount, then the remaining columns.
+        
+        The order does not depend on which rows came first, so tables pivoted
+        in pieces line up with a table pivoted in one go.
+        
+        Args:
+            df (DataFrame): Transformed data
+            group_cols: Group key columns, in key order
+            
+        Returns:
+            DataFrame: The same data with its columns reordered
+        """
+        group_cols = [col for col in group_cols if col in df.columns]
+        deduct_cols = sorted((col for col in df.columns
+                              if col not in group_cols and str(col).startswith('Deduct')
+                              and str(col)[6:].isdigit()),
+                             key=lambda col: int(str(col)[6:]))
+        rest = [col for col in df.columns if col not in group_cols and col not in deduct_cols]
+        return df[group_cols + deduct_cols + rest]
+    
+    def resolve_pivot_mapping(self, source_columns, mapping):
+        """
+        Resolve the Deductible and RateCost pivot columns and map template fields to source columns.
+        
+        Missing pivot columns are auto-detected and added to ``mapping``.
+        
+        Args:
+            source_columns: Columns of the source data
+            mapping (dict): The mapping from template fields to source columns
+            
+        Returns:
+            dict: Template field -> source column for the fields present in the
+            source, or None if the data cannot be pivoted
+        """
+        # STEP 2: Check for Deductible and RateCost in mapping
+        if "Deductible" not in mapping or "RateCost" not in mapping:
+            logging.error("Missing required mapping for pivot operations: Deductible and/or RateCost")
+            deductible_cols = [col for col in mapping.keys() if "deduct" in str(col).lower()]
+            cost_cols = [col for col in mapping.keys() if any(x in str(col).lower() for x in ["rate", "cost", "premium"])]
+        
+            logging.info(f"Potential deductible columns: {deductible_cols}")
+            logging.info(f"Potential rate/cost columns: {cost_cols}")
+        
+            # Try to auto-detect if possible
+            if "Deductible" not in mapping and deductible_cols:
+                mapping["Deductible"] = deductible_cols[0]
+                logging.info(f"Auto-assigned Deductible mapping to {deductible_cols[0]}")
+        
+            if "RateCost" not in mapping and cost_cols:
+                mapping["RateCost"] = cost_cols[0]
+                logging.info(f"Auto-assigned RateCost mapping to {cost_cols[0]}")
+        
+            # Check again after auto-detection
+            if "Deductible" not in mapping or "RateCost" not in mapping:
+                logging.warning("Cannot perform pivot operation due to missing mappings. Returning source data.")
+                return None
+        
+        # STEP 3: Create inverse mapping from template fields to source columns
+        logging.info("STEP 3: Creating mapping from template fields to source columns")
+        inverse_mapping = {}
+        for field, source_col in mapping.items():
+            if source_col and field and source_col in source_columns:
+                inverse_mapping[field] = source_col
+        
+        # Check if we have the essential mappings
+        source_deductible_col = inverse_mapping.get("Deductible")
+        source_rate_cost_col = inverse_mapping.get("RateCost")
+        
+        if not source_deductible_col or not source_rate_cost_col:
+            logging.error(f"Missing essential columns: Deductible={source_deductible_col}, RateCost={source_rate_cost_col}")
+            return None
+        
+        return inverse_mapping
+    
     def _get_min_deductible(self, row, deductible_columns):
         """
         Get the minimum available deductible from a row.
@@ -321,44 +807,50 @@ class DataProcessor:
         else:
             return min(available_deducts)  # This calls the min function properly
     
-    def integrate_with_template(self, transformed_data, template_path):
+    def integrate_with_template(self, transformed_data, template=None):
         """
         Integrate the transformed data with the template.
         
+        The data is projected onto the template header in one reindex: template
+        columns the data lacks are added empty and data columns the template
+        lacks are dropped. Columns that are not text yet are formatted, so their
+        cells are strings as in the written sheet.
+        
         Args:
             transformed_data (DataFrame): The transformed data
-            template_path (str): Path to the template file
+            template: TemplateSpec, path to the template file (first sheet),
+                DataFrame with the template columns or list of column names;
+                this processor's template_spec if None
             
         Returns:
             DataFrame: Data integrated with template format
         """
         try:
             logging.info("Starting template integration process")
+            spec = self.template_spec if template is None else TemplateSpec.from_template(template)
             
-            # Initialize template columns with empty strings
-            template_columns = [
-                'CompanyCode', 'Term', 'Miles', 'FromMiles', 'ToMiles', 'Coverage', 
-                'State', 'Class', 'PlanDeduct', 'Deduct0', 'Deduct50', 'Deduct100', 
-                'Deduct200', 'Deduct250', 'Deduct500', 'Markup', 'New/Used', 'MaxYears', 
-                'SurchargeCode', 'PlanCode', 'RateCardCode', 'ClassListCode', 'MinYear', 
-                'IncScCode', 'IncScAmt'
-            ]
-            
-            # Create a new DataFrame with template columns
-            result_df = pd.DataFrame(columns=template_columns)
-            
-            # Copy data from transformed_data, filling missing values with empty string
-            for col in template_columns:
-                if col in transformed_data.columns:
-                    result_df[col] = transformed_data[col].fillna('')
-                else:
-                    result_df[col] = ''
+            dropped = [col for col in transformed_data.columns
+                       if deductible_amount(col) is not None and col not in spec.columns
+                       and (transformed_data[col].notna() & transformed_data[col].ne('')).any()]
+            if dropped:
+                logging.warning(f"Template has no column for the rates in {', '.join(dropped)}; they are not written")
             
-            # Ensure all columns are string type
-            for col in result_df.columns:
-                result_df[col] = result_df[col].astype(str)
-                # Replace 'nan' and 'None' strings with empty string
-                result_df[col] = result_df[col].replace({'nan': '', 'None': '', 'NaN': ''})
+            result_df = transformed_data.reindex(columns=list(spec.columns), fill_value='')
+            result_df = result_df.reset_index(drop=True)
+            
+            # Text cells are written as strings; missing values become empty strings
+            for col, dtype in result_df.dtypes.items():
+                values = result_df[col]
+                if isinstance(dtype, np.dtype) and dtype.kind in 'iub':
+                    result_df[col] = values.astype(str)
+                elif isinstance(dtype, np.dtype) and dtype.kind == 'f':
+                    result_df[col] = values.astype(str).where(values.notna(), '')
+                elif isinstance(dtype, pd.StringDtype):
+                    if values.hasnans or values.isin(('nan', 'None', 'NaN')).any():
+                        result_df[col] = values.fillna('').replace({'nan': '', 'None': '', 'NaN': ''})
+                else:
+                    text = values.astype(object).fillna('').astype(str)
+                    result_df[col] = text.where(~text.isin(('nan', 'None', 'NaN')), '')
             
             logging.info(f"Final integrated data shape: {result_df.shape}")
             logging.info(f"Final columns: {result_df.columns.tolist()}")
@@ -374,11 +866,15 @@ class DataProcessor:
         Add the PlanDeduct column to the DataFrame and ensure proper column ordering.
         
         Args:
-            df (DataFrame): The DataFrame with deductible columns
+            df (DataFrame or RateTable): The data with deductible columns
             
         Returns:
             DataFrame: DataFrame with PlanDeduct column added and columns properly ordered
+            (a RateTable with PlanDeduct chosen when given a RateTable)
         """
+        if isinstance(df, RateTable):
+            return df.with_plan_deduct(self.default_deductible)
+        
         try:
             if df.empty:
                 return df
@@ -404,6 +900,10 @@ class DataProcessor:
             deduct_values.sort()
             logging.info(f"Sorted deductible values: {deduct_values}")
             
+            # Transformed tables hold '' where a deductible has no rate
+            def has_value(value):
+                return pd.notna(value) and not (isinstance(value, str) and value == '')
+            
             # Add PlanDeduct column if it doesn't exist
             if 'PlanDeduct' not in df.columns:
                 df['PlanDeduct'] = None
@@ -415,7 +915,7 @@ class DataProcessor:
                 # 1. If default_deductible is set, check if that column has a value
                 if hasattr(self, 'default_deductible') and self.default_deductible:
                     default_col = f"Deduct{self.default_deductible}"
-                    if default_col in df.columns and pd.notna(df.loc[idx, default_col]):
+                    if default_col in df.columns and has_value(df.loc[idx, default_col]):
                         df.loc[idx, 'PlanDeduct'] = self.default_deductible
                         continue
                 
@@ -425,7 +925,7 @@ class DataProcessor:
                     if class_val in ['C', 'D']:
                         # Find the lowest deductible column with a value
                         for val, col in deduct_values:
-                            if pd.notna(df.loc[idx, col]):
+                            if has_value(df.loc[idx, col]):
                                 df.loc[idx, 'PlanDeduct'] = str(val)
                                 break
                         continue
@@ -433,32 +933,28 @@ class DataProcessor:
                 # 3. For all other classes (E, F, G, H), use deductible 100 if available
                 default_val = "100"
                 default_col = f"Deduct{default_val}"
-                if default_col in df.columns and pd.notna(df.loc[idx, default_col]):
+                if default_col in df.columns and has_value(df.loc[idx, default_col]):
                     df.loc[idx, 'PlanDeduct'] = default_val
                     continue
                 
                 # 4. Fallback to lowest available deductible
                 for val, col in deduct_values:
-                    if pd.notna(df.loc[idx, col]):
+                    if has_value(df.loc[idx, col]):
                         df.loc[idx, 'PlanDeduct'] = str(val)
                         break
             
-            # Organize columns in the desired order based on the second image example
-            # Define the expected column order following the second image example
-            # This is a template of the order we want (not all columns may exist)
-            desired_order = [
-                'CompanyCode', 'Term', 'Miles', 'FromMiles', 'ToMiles', 'Coverage', 'State', 'Class', 
-                'PlanDeduct'
-            ]
+            # Organize columns in the template's order: the columns before its
+            # deductible block (not all columns may exist), then the deductible
+            # columns in numerical order, then the columns after the block
+            desired_order = list(self.template_spec.leading_columns)
+            if 'PlanDeduct' not in self.template_spec.columns:
+                desired_order.append('PlanDeduct')
             
             # Add all deductible columns in numerical order
             sorted_deduct_cols = [col for _, col in deduct_values]
             
-            # Add remaining columns in the desired order
-            remaining_order = [
-                'Markup', 'New/Used', 'MaxYears', 'SurchargeCode', 'PlanCode', 
-                'RateCardCode', 'ClassListCode', 'MinYear', 'IncSCode', 'IncSAmt'
-            ]
+            # Add remaining columns in the template's order
+            remaining_order = list(self.template_spec.trailing_columns)
             
             # Create the final order based on what's actually in the DataFrame
             final_order = []
@@ -500,10 +996,13 @@ class DataProcessor:
         Save DataFrame to Excel with proper handling of empty columns.
         
         Args:
-            df (DataFrame): The DataFrame to save
+            df (DataFrame or RateTable): The data to save
             output_file (str): Path to save the Excel file
             sheet_name (str): Name of the sheet to save to
         """
+        if isinstance(df, RateTable):
+            df = df.to_dataframe()
+        
         try:
             logging.info(f"Saving DataFrame to {output_file}")
             logging.info(f"DataFrame shape: {df.shape}")
@@ -521,14 +1020,16 @@ class DataProcessor:
                 worksheet = writer.sheets[sheet_name]
                 for idx, col in enumerate(df_to_save.columns):
                     # Get maximum length of column name and its contents
+                    # (empty cells are None here and may stay missing after astype(str))
+                    content_lengths = df_to_save[col].astype(str).str.len()
                     max_length = max(
-                        df_to_save[col].astype(str).apply(len).max(),
+                        int(content_lengths.max()) if content_lengths.notna().any() else 0,
                         len(str(col))
                     )
                     # Add a little extra space
                     adjusted_width = (max_length + 2)
                     # Set column width
-                    worksheet.column_dimensions[chr(65 + idx)].width = adjusted_width
+                    worksheet.column_dimensions[get_column_letter(idx + 1)].width = adjusted_width
             
             logging.info(f"Successfully saved DataFrame to {output_file}")
             
@@ -14,6 +14,15 @@ import pandas as pd
 from fuzzywuzzy import fuzz
 import re
 
+from out_of_core import sheet_needs_streaming
+from data_processor import WIDE_DEDUCTIBLE_PATTERN
+
+# Number of data rows read from each sheet when profiling a whole workbook
+WORKBOOK_SAMPLE_ROWS = 500
+
+# Number of data rows analyzed from sheets too large to load (see out_of_core)
+LARGE_SHEET_SAMPLE_ROWS = 10000
+
 class FileAnalyzer:
     """Analyzes Excel files to detect structure and suggest mappings."""
     
@@ -52,19 +61,25 @@ class FileAnalyzer:
         try:
             logging.info(f"Analyzing file structure: {file_path}, sheet: {sheet_name}")
             
-            # Try to read the file
-            if sheet_name:
-                df = pd.read_excel(file_path, sheet_name=sheet_name)
-            else:
-                # If no sheet specified, get first sheet
+            # If no sheet specified, get first sheet
+            if not sheet_name:
                 sheets = self.get_sheet_names(file_path)
                 if not sheets:
                     raise ValueError("No sheets found in Excel file")
                 sheet_name = sheets[0]
-                df = pd.read_excel(file_path, sheet_name=sheet_name)
+            
+            # Sheets that will be transformed out of core are only sampled here
+            streaming, sheet_rows = sheet_needs_streaming(file_path, sheet_name)
+            sampled = streaming and sheet_rows is not None
+            if sampled:
+                logging.info(f"Sheet has about {sheet_rows} rows, analyzing the first {LARGE_SHEET_SAMPLE_ROWS}")
+            
+            # Try to read the file
+            df = pd.read_excel(file_path, sheet_name=sheet_name,
+                               nrows=LARGE_SHEET_SAMPLE_ROWS if sampled else None)
             
             # Get basic info
-            row_count = len(df)
+            row_count = max(sheet_rows, len(df)) if sampled else len(df)
             col_count = len(df.columns)
             logging.info(f"File has {row_count} rows and {col_count} columns")
             
@@ -125,7 +140,9 @@ class FileAnalyzer:
                 "column_count": col_count,
                 "columns": column_data,
                 "column_mapping_suggestions": column_mapping_suggestions,
-                "patterns": patterns
+                "patterns": patterns,
+                "sampled": sampled,
+                "out_of_core": streaming
             }
             
             logging.info(f"File analysis complete. Identified {len(column_mapping_suggestions)} potential column mappings")
@@ -374,7 +391,7 @@ class FileAnalyzer:
             result["values"] = deduct_values
         
         # Check for separate deductible columns (like Deduct0, Deduct50, etc.)
-        deduct_columns = [col for col in df.columns if re.match(r'(?i)deduct(?:ible)?[\s_]?\d+$', str(col))]
+        deduct_columns = [col for col in df.columns if WIDE_DEDUCTIBLE_PATTERN.match(str(col))]
         if deduct_columns:
             result["has_deductible_data"] = True
             result["pattern"] = "multiple_columns"
@@ -493,6 +510,95 @@ class FileAnalyzer:
         
         return structure
     
+    def analyze_workbook(self, file_path, sample_rows=WORKBOOK_SAMPLE_ROWS):
+        """
+        Profile every sheet of a workbook and pick the most likely rate sheet.
+
+        The workbook is opened once and its sheets are profiled one after the
+        other, reading at most ``sample_rows`` data rows so large tabs stay cheap
+        to profile. Sheets are not parsed on threads: openpyxl parses in pure
+        Python under the GIL, and the ExcelFile handle is not safe to share.
+
+        Args:
+            file_path: Path to the Excel file
+            sample_rows: Maximum number of data rows read from each sheet
+
+        Returns:
+            dict: Workbook analysis with per-sheet structures and the main sheet name
+        """
+        try:
+            xls = pd.ExcelFile(file_path)
+        except Exception as e:
+            logging.error(f"Error opening workbook: {str(e)}")
+            raise ValueError(f"Unable to read Excel file: {str(e)}")
+
+        try:
+            sheet_names = xls.sheet_names
+            if not sheet_names:
+                raise ValueError("No sheets found in Excel file")
+
+            logging.info(f"Profiling {len(sheet_names)} sheets in {file_path} (sample of {sample_rows} rows each)")
+
+            def profile_sheet(sheet_name):
+                # Read the sheet size first: pandas calls reset_dimensions() on
+                # read-only openpyxl sheets it parses, after which max_row is None
+                total_rows = self._get_sheet_row_count(xls, sheet_name)
+
+                df = xls.parse(sheet_name, nrows=sample_rows)
+                analysis = self.analyze_sheet_structure(df)
+                analysis['sampled_rows'] = len(df)
+
+                # Prefer the real sheet size over the sample size for ranking
+                if total_rows is not None:
+                    analysis['row_count'] = max(total_rows, len(df))
+                return analysis
+
+            sheets_analysis = {}
+            for sheet_name in sheet_names:
+                try:
+                    sheets_analysis[sheet_name] = profile_sheet(sheet_name)
+                except Exception as e:
+                    logging.warning(f"Could not profile sheet '{sheet_name}': {str(e)}")
+                    sheets_analysis[sheet_name] = {'error': str(e), 'row_count': 0, 'columns': {}}
+
+            profiled = {name: analysis for name, analysis in sheets_analysis.items() if 'error' not in analysis}
+            main_sheet = self.identify_main_data_sheet(profiled) if profiled else None
+
+            return {
+                "file_path": file_path,
+                "sheet_names": sheet_names,
+                "sheets": sheets_analysis,
+                "main_sheet": main_sheet or sheet_names[0]
+            }
+        finally:
+            xls.close()
+
+    def _get_sheet_row_count(self, xls, sheet_name):
+        """
+        Get the number of data rows in a sheet without parsing it.
+
+        Args:
+            xls: Open pandas ExcelFile
+            sheet_name: Name of the sheet
+
+        Returns:
+            int: Data row count (excluding the header), or None if unknown
+        """
+        try:
+            book = xls.book
+            if hasattr(book, 'sheet_by_name'):
+                # xlrd workbook (.xls)
+                total = book.sheet_by_name(sheet_name).nrows
+            else:
+                # openpyxl workbook (.xlsx); max_row comes from the sheet dimension
+                total = book[sheet_name].max_row
+            if total is None:
+                return None
+            return max(0, total - 1)
+        except Exception as e:
+            logging.debug(f"Row count unavailable for sheet '{sheet_name}': {str(e)}")
+            return None
+
     def identify_main_data_sheet(self, sheets_analysis):
         """
         Identify the most likely sheet containing main data.
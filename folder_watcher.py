@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Folder Watcher module for Moxy Rates Template Transfer
+
+This module provides a daemon that watches a drop folder for new Adjusted Rates
+workbooks and converts each one automatically using saved mappings.
+"""
+
+import os
+import time
+import shutil
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config_manager import MappingConfigManager
+from conversion import run_conversion
+
+# Try to import watchdog - uses inotify/ReadDirectoryChangesW when available
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    WATCHDOG_AVAILABLE = False
+    FileSystemEventHandler = object
+
+# File extensions picked up from the drop folder
+WATCHED_EXTENSIONS = ('.xlsx', '.xls')
+
+
+class _DropFolderEventHandler(FileSystemEventHandler):
+    """Forwards file system events for the drop folder to the watcher."""
+
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher.notify(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher.notify(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.watcher.notify(event.dest_path)
+
+
+class FolderWatcher:
+    """Watches a drop folder and converts new Adjusted Rates workbooks."""
+
+    def __init__(self, watch_dir, template_file, template_sheet=None, output_dir=None,
+                 processed_dir=None, failed_dir=None, max_workers=2, max_pending=8,
+                 settle_seconds=2.0, poll_interval=1.0, default_deductible="100",
+                 mapping_config=None):
+        """
+        Initialize the folder watcher.
+
+        Args:
+            watch_dir: Directory where adjusted rates files are dropped
+            template_file: Path to the Template Excel file used for every conversion
+            template_sheet: Sheet name in the template (first sheet if None)
+            output_dir: Directory for converted files (default: watch_dir/output)
+            processed_dir: Directory for successfully converted sources (default: watch_dir/processed)
+            failed_dir: Directory for sources that failed (default: watch_dir/failed)
+            max_workers: Number of conversions run concurrently
+            max_pending: Maximum number of files queued or running at once
+            settle_seconds: Time a file must stay unchanged before it is picked up
+            poll_interval: Seconds between folder scans / stability checks
+            default_deductible: Preferred deductible for the PlanDeduct column
+            mapping_config: MappingConfigManager for saved mappings (optional)
+        """
+        self.watch_dir = os.path.abspath(watch_dir)
+        self.template_file = template_file
+        self.template_sheet = template_sheet
+        self.output_dir = output_dir or os.path.join(self.watch_dir, "output")
+        self.processed_dir = processed_dir or os.path.join(self.watch_dir, "processed")
+        self.failed_dir = failed_dir or os.path.join(self.watch_dir, "failed")
+        self.max_workers = max(1, max_workers)
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.default_deductible = default_deductible
+        self.mapping_config_path = mapping_config.config_path if mapping_config else None
+
+        # Candidate files waiting to settle: path -> (size, mtime, last_change)
+        self._candidates = {}
+        self._in_flight = set()
+        # Files that could not be moved out of the drop folder are not retried
+        self._skipped = set()
+        # Output paths chosen for conversions that have not finished yet
+        self._outputs = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._slots = threading.BoundedSemaphore(max(self.max_workers, max_pending))
+
+        self._executor = None
+        self._observer = None
+        self._scan_thread = None
+
+        self._counters = {
+            "processed": 0,
+            "failed": 0,
+            "rows_in": 0,
+            "rows_out": 0,
+            "bytes_in": 0,
+            "busy_seconds": 0.0
+        }
+        self._started_at = None
+
+        logging.info(f"FolderWatcher initialized for {self.watch_dir}")
+
+    def start(self):
+        """Start watching the drop folder."""
+        for directory in (self.watch_dir, self.output_dir, self.processed_dir, self.failed_dir):
+            os.makedirs(directory, exist_ok=True)
+
+        self._stop_event.clear()
+        self._started_at = time.monotonic()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                            thread_name_prefix="watch-worker")
+
+        if WATCHDOG_AVAILABLE:
+            self._observer = Observer()
+            self._observer.schedule(_DropFolderEventHandler(self), self.watch_dir, recursive=False)
+            self._observer.start()
+            logging.info("Watching folder with native file system events")
+        else:
+            logging.info(f"watchdog package not found. Polling folder every {self.poll_interval}s")
+
+        # Pick up files that were dropped while the watcher was not running
+        self._scan_folder()
+
+        self._scan_thread = threading.Thread(target=self._scan_loop, name="watch-scanner", daemon=True)
+        self._scan_thread.start()
+
+    def stop(self):
+        """Stop watching and wait for running conversions to finish."""
+        self._stop_event.set()
+        self._wakeup.set()
+
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+
+        if self._scan_thread is not None:
+            self._scan_thread.join()
+            self._scan_thread = None
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+        logging.info(f"FolderWatcher stopped. {self.format_stats()}")
+
+    def run_forever(self, stats_interval=300):
+        """
+        Run the watcher until interrupted, logging throughput periodically.
+
+        Args:
+            stats_interval: Seconds between throughput log lines
+        """
+        self.start()
+        try:
+            while not self._stop_event.wait(stats_interval):
+                logging.info(self.format_stats())
+        except KeyboardInterrupt:
+            logging.info("Interrupted, shutting down folder watcher")
+        finally:
+            self.stop()
+
+    def notify(self, path):
+        """
+        Register a changed file as a conversion candidate.
+
+        Args:
+            path: Path of the created or modified file
+        """
+        if not self._is_watched_file(path):
+            return
+
+        with self._lock:
+            if path in self._in_flight or path in self._skipped:
+                return
+            # Any change restarts the settle timer
+            self._candidates[path] = (None, None, time.monotonic())
+        self._wakeup.set()
+
+    def stats(self):
+        """
+        Get throughput counters.
+
+        Returns:
+            dict: Processed/failed counts, row totals and rates
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats["queued"] = len(self._in_flight)
+            stats["waiting"] = len(self._candidates)
+
+        uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+        stats["uptime_seconds"] = uptime
+        stats["files_per_minute"] = (stats["processed"] / uptime * 60) if uptime > 0 else 0.0
+        stats["rows_per_second"] = (stats["rows_in"] / stats["busy_seconds"]) if stats["busy_seconds"] > 0 else 0.0
+        return stats
+
+    def format_stats(self):
+        """
+        Format throughput counters for logging.
+
+        Returns:
+            str: One-line summary of the counters
+        """
+        stats = self.stats()
+        return (f"Watcher stats: {stats['processed']} processed, {stats['failed']} failed, "
+                f"{stats['queued']} in progress, {stats['rows_in']} rows in, {stats['rows_out']} rows out, "
+                f"{stats['files_per_minute']:.2f} files/min, {stats['rows_per_second']:.0f} rows/s")
+
+    def _is_watched_file(self, path):
+        """Check whether a path is a workbook directly inside the drop folder."""
+        name = os.path.basename(path)
+        if name.startswith('~$') or name.startswith('.'):
+            # Excel lock files and hidden temp files
+            return False
+        if os.path.dirname(os.path.abspath(path)) != self.watch_dir:
+            return False
+        return name.lower().endswith(WATCHED_EXTENSIONS)
+
+    def _scan_loop(self):
+        """Periodically scan the folder (polling mode) and dispatch settled files."""
+        while not self._stop_event.is_set():
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            if self._stop_event.is_set():
+                break
+
+            if not WATCHDOG_AVAILABLE:
+                self._scan_folder()
+            self._dispatch_settled()
+
+    def _scan_folder(self):
+        """Register every workbook currently in the drop folder."""
+        try:
+            with os.scandir(self.watch_dir) as entries:
+                for entry in entries:
+                    if entry.is_file() and self._is_watched_file(entry.path):
+                        with self._lock:
+                            known = entry.path in self._candidates or entry.path in self._in_flight
+                        if not known:
+                            self.notify(entry.path)
+        except OSError as e:
+            logging.error(f"Error scanning watch folder: {str(e)}")
+
+    def _dispatch_settled(self):
+        """Queue candidates whose size and modification time have stopped changing."""
+        now = time.monotonic()
+        ready = []
+
+        with self._lock:
+            candidates = list(self._candidates.items())
+
+        for path, (size, mtime, last_change) in candidates:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # File was removed or renamed before it settled
+                with self._lock:
+                    self._candidates.pop(path, None)
+                continue
+
+            if (stat.st_size, stat.st_mtime) != (size, mtime):
+                with self._lock:
+                    self._candidates[path] = (stat.st_size, stat.st_mtime, now)
+                continue
+
+            if now - last_change >= self.settle_seconds and self._is_writable(path):
+                ready.append(path)
+
+        for path in ready:
+            # Bounded queue: leave the file waiting if every slot is taken
+            if not self._slots.acquire(blocking=False):
+                break
+            with self._lock:
+                self._candidates.pop(path, None)
+                self._in_flight.add(path)
+            self._executor.submit(self._process_file, path)
+
+    def _is_writable(self, path):
+        """Check that no other process still holds the file open for writing."""
+        # Only effective on Windows, where a file being written is opened without
+        # write sharing. POSIX systems let any number of writers open a file, so
+        # there the size/mtime settle check in _dispatch_settled is the only guard.
+        try:
+            with open(path, 'ab'):
+                pass
+            return True
+        except OSError:
+            return False
+
+    def _process_file(self, path):
+        """Convert a single workbook and move it to the processed or failed folder."""
+        started = time.monotonic()
+        name = os.path.basename(path)
+        output_file = None
+        try:
+            size = os.path.getsize(path)
+            output_file = self._output_path(name)
+
+            logging.info(f"Converting dropped file: {name}")
+            mapping_config = MappingConfigManager(self.mapping_config_path)
+            result = run_conversion(
+                path,
+                self.template_file,
+                output_file,
+                template_sheet=self.template_sheet,
+                mapping_config=mapping_config,
+                default_deductible=self.default_deductible
+            )
+
+            if not self._move_to(path, self.processed_dir):
+                with self._lock:
+                    self._skipped.add(path)
+            with self._lock:
+                self._counters["processed"] += 1
+                self._counters["rows_in"] += result["rows_in"]
+                self._counters["rows_out"] += result["rows_out"]
+                self._counters["bytes_in"] += size
+            logging.info(f"Converted {name} -> {result['output_file']} ({result['rows_in']} rows in, {result['rows_out']} rows out)")
+
+        except Exception as e:
+            logging.error(f"Failed to convert {name}: {str(e)}", exc_info=True)
+            failed_path = self._move_to(path, self.failed_dir)
+            if not failed_path:
+                with self._lock:
+                    self._skipped.add(path)
+            else:
+                try:
+                    with open(failed_path + ".error.txt", 'w') as f:
+                        f.write(f"{str(e)}\n")
+                except OSError:
+                    pass
+            with self._lock:
+                self._counters["failed"] += 1
+        finally:
+            with self._lock:
+                self._counters["busy_seconds"] += time.monotonic() - started
+                self._in_flight.discard(path)
+                self._outputs.discard(output_file)
+            self._slots.release()
+
+    def _output_path(self, name):
+        """
+        Choose the output path of a dropped file.
+
+        Names carry the conversion time, so dropping a file with the same name
+        again never overwrites an earlier output.
+
+        Args:
+            name: File name of the dropped workbook
+
+        Returns:
+            str: Path of a new output file
+        """
+        base = f"{os.path.splitext(name)[0]}_processed_{time.strftime('%Y%m%d_%H%M%S')}"
+        target = os.path.join(self.output_dir, base + ".xlsx")
+        counter = 1
+        with self._lock:
+            # Two drops of the same name within one second are converted concurrently
+            while os.path.exists(target) or target in self._outputs:
+                target = os.path.join(self.output_dir, f"{base}_{counter}.xlsx")
+                counter += 1
+            self._outputs.add(target)
+        return target
+
+    def _move_to(self, path, directory):
+        """
+        Move a file into a directory without overwriting existing files.
+
+        Returns:
+            str: New path of the file, or None if it could not be moved
+        """
+        base, ext = os.path.splitext(os.path.basename(path))
+        target = os.path.join(directory, base + ext)
+        counter = 1
+        while os.path.exists(target):
+            target = os.path.join(directory, f"{base}_{counter}{ext}")
+            counter += 1
+        try:
+            shutil.move(path, target)
+            return target
+        except OSError as e:
+            logging.error(f"Could not move {path} to {directory}: {str(e)}")
+            return None
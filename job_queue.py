@@ -0,0 +1,620 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Job Queue module for Moxy Rates Template Transfer
+
+This module provides a durable, SQLite-backed queue of conversion jobs. Each job
+records its inputs, mapping signature, current stage and output checksum, so an
+interrupted batch can be restarted without redoing finished files, and several
+worker processes sharing the queue file can drain it together.
+"""
+
+import os
+import sys
+import time
+import ctypes
+import socket
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+
+from config_manager import MappingConfigManager
+from conversion import run_conversion
+
+# Seconds a claimed job may go without a heartbeat before another worker may take it over
+DEFAULT_LEASE_SECONDS = 600
+
+# Attempts made before a job is left in the failed state
+DEFAULT_MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    batch_id TEXT NOT NULL,
+    adjusted_file TEXT NOT NULL,
+    input_checksum TEXT NOT NULL,
+    template_file TEXT NOT NULL,
+    adjusted_sheet TEXT,
+    template_sheet TEXT,
+    output_file TEXT NOT NULL,
+    default_deductible TEXT NOT NULL DEFAULT '100',
+    status TEXT NOT NULL DEFAULT 'pending',
+    stage TEXT,
+    worker_id TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    mapping_signature TEXT,
+    output_checksum TEXT,
+    rows_in INTEGER,
+    rows_out INTEGER,
+    error TEXT,
+    created_at REAL NOT NULL,
+    claimed_at REAL,
+    heartbeat_at REAL,
+    finished_at REAL,
+    UNIQUE (batch_id, adjusted_file)
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id);
+"""
+
+# Queue files written before jobs were keyed on the input file alone kept one row per input checksum
+OLD_UNIQUE_KEY = "UNIQUE (batch_id, adjusted_file, input_checksum)"
+
+
+def file_checksum(path, chunk_size=1024 * 1024):
+    """
+    Calculate the SHA-256 checksum of a file.
+
+    Args:
+        path: Path to the file
+        chunk_size: Bytes read at a time
+
+    Returns:
+        str: Hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def batch_output_path(output_dir, adjusted_file):
+    """
+    Build the output path of a batch input file.
+
+    A short hash of the input's full path is part of the name, so inputs with
+    the same file name in different folders never write the same output.
+
+    Args:
+        output_dir: Directory for converted files
+        adjusted_file: Path to the Adjusted Rates Excel file
+
+    Returns:
+        str: Path of the Excel file to create
+    """
+    source = os.path.normcase(os.path.abspath(adjusted_file))
+    digest = hashlib.sha256(source.encode('utf-8')).hexdigest()[:8]
+    name = os.path.splitext(os.path.basename(adjusted_file))[0]
+    return os.path.join(output_dir, f"{name}_{digest}_processed.xlsx")
+
+
+def _pid_alive(pid):
+    """
+    Check whether a process with the given id is running on this host.
+
+    Args:
+        pid: Process id
+
+    Returns:
+        bool: True if the process exists (or cannot be checked)
+    """
+    if pid == os.getpid():
+        return True
+    if sys.platform == 'win32':
+        # os.kill(pid, 0) would terminate the process on Windows
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return kernel32.GetLastError() == 5  # ERROR_ACCESS_DENIED: exists, owned by someone else
+        try:
+            exit_code = ctypes.c_ulong()
+            kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+            return exit_code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists but belongs to another user
+        return True
+    return True
+
+
+def default_worker_id():
+    """
+    Build an identifier that is unique per host, process and thread.
+
+    Returns:
+        str: Worker identifier
+    """
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+class JobQueue:
+    """Durable queue of conversion jobs stored in a SQLite database."""
+
+    def __init__(self, db_path, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        Initialize the job queue.
+
+        Args:
+            db_path: Path to the SQLite database file (created if missing)
+            lease_seconds: Heartbeat timeout after which a claimed job is reclaimed
+            max_attempts: Attempts made before a job stays failed
+        """
+        self.db_path = os.path.abspath(db_path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        with self._connect() as conn:
+            self._migrate(conn)
+            conn.executescript(SCHEMA)
+
+        logging.info(f"JobQueue initialized with database: {self.db_path}")
+
+    @contextmanager
+    def _connect(self):
+        """Open a short-lived connection; sqlite3 connections are not shared between threads."""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _migrate(self, conn):
+        """Key a queue file written by an older version on the input file alone, keeping each file's newest job."""
+        row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'jobs'").fetchone()
+        if row is None or OLD_UNIQUE_KEY not in row["sql"]:
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("ALTER TABLE jobs RENAME TO jobs_old")
+            # The CREATE TABLE statement of SCHEMA; the index is created again with the rest of it
+            conn.execute(SCHEMA.split(";")[0])
+            conn.execute("INSERT INTO jobs SELECT * FROM jobs_old WHERE id IN "
+                         "(SELECT MAX(id) FROM jobs_old GROUP BY batch_id, adjusted_file)")
+            conn.execute("DROP TABLE jobs_old")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        logging.info(f"Migrated {self.db_path} to one job per input file")
+
+    def enqueue(self, batch_id, adjusted_file, template_file, output_file, adjusted_sheet=None,
+                template_sheet=None, default_deductible="100"):
+        """
+        Add the job of an input file, or requeue it if the file changed.
+
+        A batch has one job per input file. When the file's checksum differs
+        from the one recorded, the job is reset to pending and converted again;
+        an unchanged file leaves its job as it is. A worker still converting the
+        old contents loses the job (its complete and fail calls are ignored).
+
+        Args:
+            batch_id: Identifier grouping the jobs of one batch run
+            adjusted_file: Path to the Adjusted Rates Excel file
+            template_file: Path to the Template Excel file
+            output_file: Path of the Excel file to create
+            adjusted_sheet: Sheet to read from the adjusted file (auto-detected if None)
+            template_sheet: Sheet to read from the template (first sheet if None)
+            default_deductible: Preferred deductible for the PlanDeduct column
+
+        Returns:
+            bool: True if a job was added or requeued, False if it was unchanged
+        """
+        adjusted_file = os.path.abspath(adjusted_file)
+        checksum = file_checksum(adjusted_file)
+
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (batch_id, adjusted_file, input_checksum, template_file, "
+                "adjusted_sheet, template_sheet, output_file, default_deductible, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (batch_id, adjusted_file) DO UPDATE SET "
+                "input_checksum = excluded.input_checksum, template_file = excluded.template_file, "
+                "adjusted_sheet = excluded.adjusted_sheet, template_sheet = excluded.template_sheet, "
+                "output_file = excluded.output_file, default_deductible = excluded.default_deductible, "
+                "status = 'pending', stage = NULL, worker_id = NULL, attempts = 0, mapping_signature = NULL, "
+                "output_checksum = NULL, rows_in = NULL, rows_out = NULL, error = NULL, "
+                "created_at = excluded.created_at, claimed_at = NULL, heartbeat_at = NULL, finished_at = NULL "
+                "WHERE jobs.input_checksum != excluded.input_checksum",
+                (batch_id, adjusted_file, checksum, os.path.abspath(template_file), adjusted_sheet,
+                 template_sheet, os.path.abspath(output_file), str(default_deductible), time.time())
+            )
+            return cursor.rowcount > 0
+
+    def reclaim_dead_workers(self, batch_id=None):
+        """
+        Release the claims of worker processes on this host that are no longer running.
+
+        A crashed worker's job would otherwise stay claimed until its lease runs
+        out. Released jobs go back to pending, or to failed once they have used
+        all their attempts. Claims of other hosts are left to the lease.
+
+        Args:
+            batch_id: Restrict to one batch (optional)
+
+        Returns:
+            int: Number of jobs released
+        """
+        host = socket.gethostname()
+        batch_filter = "AND batch_id = ?" if batch_id is not None else ""
+        params = (batch_id,) if batch_id is not None else ()
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT id, worker_id FROM jobs WHERE status = 'claimed' {batch_filter}", params
+            ).fetchall()
+
+        dead = []
+        for row in rows:
+            # Worker ids are host:pid:thread (see default_worker_id)
+            parts = (row["worker_id"] or "").rsplit(':', 2)
+            if len(parts) == 3 and parts[0] == host and parts[1].isdigit() and not _pid_alive(int(parts[1])):
+                dead.append((row["id"], row["worker_id"]))
+
+        if dead:
+            with self._connect() as conn:
+                conn.executemany(
+                    "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                    "stage = NULL, error = 'Worker process stopped while converting', finished_at = ? "
+                    "WHERE id = ? AND worker_id = ? AND status = 'claimed'",
+                    [(self.max_attempts, time.time(), job_id, worker_id) for job_id, worker_id in dead]
+                )
+            logging.warning(f"Released {len(dead)} jobs claimed by stopped worker processes")
+        return len(dead)
+
+    def claim(self, worker_id, batch_id=None):
+        """
+        Atomically claim the next runnable job.
+
+        Pending jobs are taken first, then jobs whose worker stopped sending
+        heartbeats (crashed process or rebooted host). Stale claims that have
+        used all their attempts are marked failed instead.
+
+        Args:
+            worker_id: Identifier of the claiming worker
+            batch_id: Restrict claiming to one batch (optional)
+
+        Returns:
+            dict: Claimed job, or None if nothing is runnable
+        """
+        now = time.time()
+        stale_before = now - self.lease_seconds
+        batch_filter = "AND batch_id = ?" if batch_id is not None else ""
+        params = [stale_before, self.max_attempts]
+        if batch_id is not None:
+            params.append(batch_id)
+
+        with self._connect() as conn:
+            # BEGIN IMMEDIATE takes the write lock up front, so two workers cannot pick the same row
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', stage = 'failed', finished_at = ?, "
+                    "error = COALESCE(error, 'Worker stopped sending heartbeats') "
+                    f"WHERE status = 'claimed' AND heartbeat_at < ? AND attempts >= ? {batch_filter}",
+                    [now] + params
+                )
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE (status = 'pending' "
+                    "OR (status = 'claimed' AND heartbeat_at < ?)) "
+                    f"AND attempts < ? {batch_filter} ORDER BY status DESC, id LIMIT 1",
+                    params
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+
+                if row["status"] == "claimed":
+                    logging.warning(f"Reclaiming job {row['id']} abandoned by {row['worker_id']}")
+
+                conn.execute(
+                    "UPDATE jobs SET status = 'claimed', worker_id = ?, stage = 'claimed', "
+                    "attempts = attempts + 1, claimed_at = ?, heartbeat_at = ?, error = NULL WHERE id = ?",
+                    (worker_id, now, now, row["id"])
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        job = dict(row)
+        job.update(status="claimed", worker_id=worker_id, attempts=row["attempts"] + 1)
+        return job
+
+    def heartbeat(self, job_id, worker_id):
+        """
+        Extend the lease of a claimed job.
+
+        Returns:
+            bool: False if the job is no longer owned by this worker
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND worker_id = ? AND status = 'claimed'",
+                (time.time(), job_id, worker_id)
+            )
+            return cursor.rowcount > 0
+
+    def update_stage(self, job_id, worker_id, stage):
+        """
+        Record the current stage of a claimed job; doubles as a heartbeat.
+
+        Returns:
+            bool: False if the job is no longer owned by this worker
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET stage = ?, heartbeat_at = ? WHERE id = ? AND worker_id = ? AND status = 'claimed'",
+                (stage, time.time(), job_id, worker_id)
+            )
+            return cursor.rowcount > 0
+
+    def complete(self, job_id, worker_id, output_file, mapping_signature=None, rows_in=None, rows_out=None):
+        """
+        Mark a job as finished and record the checksum of its output.
+
+        Returns:
+            bool: False if the job is no longer owned by this worker
+        """
+        checksum = file_checksum(output_file)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'done', stage = 'done', output_file = ?, output_checksum = ?, "
+                "mapping_signature = ?, rows_in = ?, rows_out = ?, finished_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = 'claimed'",
+                (os.path.abspath(output_file), checksum, mapping_signature, rows_in, rows_out,
+                 time.time(), job_id, worker_id)
+            )
+            return cursor.rowcount > 0
+
+    def fail(self, job_id, worker_id, error):
+        """
+        Record a failed attempt. The job returns to pending until max_attempts is reached.
+
+        Returns:
+            bool: False if the job is no longer owned by this worker
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "stage = 'failed', error = ?, finished_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = 'claimed'",
+                (self.max_attempts, str(error), time.time(), job_id, worker_id)
+            )
+            return cursor.rowcount > 0
+
+    def reset_missing_outputs(self, batch_id):
+        """
+        Requeue finished jobs whose output file was deleted or changed since it was written.
+
+        Args:
+            batch_id: Batch to check
+
+        Returns:
+            int: Number of jobs requeued
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, output_file, output_checksum FROM jobs WHERE batch_id = ? AND status = 'done'",
+                (batch_id,)
+            ).fetchall()
+
+        stale = []
+        for row in rows:
+            path = row["output_file"]
+            if not os.path.exists(path) or file_checksum(path) != row["output_checksum"]:
+                stale.append(row["id"])
+
+        if stale:
+            with self._connect() as conn:
+                conn.executemany(
+                    "UPDATE jobs SET status = 'pending', stage = NULL, attempts = 0, output_checksum = NULL "
+                    "WHERE id = ? AND status = 'done'",
+                    [(job_id,) for job_id in stale]
+                )
+            logging.info(f"Requeued {len(stale)} finished jobs with missing or modified output")
+        return len(stale)
+
+    def counts(self, batch_id=None):
+        """
+        Count jobs by status.
+
+        Args:
+            batch_id: Restrict counts to one batch (optional)
+
+        Returns:
+            dict: Status -> number of jobs
+        """
+        query = "SELECT status, COUNT(*) AS n FROM jobs"
+        params = ()
+        if batch_id is not None:
+            query += " WHERE batch_id = ?"
+            params = (batch_id,)
+        query += " GROUP BY status"
+
+        with self._connect() as conn:
+            return {row["status"]: row["n"] for row in conn.execute(query, params)}
+
+    def jobs(self, batch_id=None):
+        """
+        List jobs in queue order.
+
+        Returns:
+            list: Job rows as dictionaries
+        """
+        query = "SELECT * FROM jobs"
+        params = ()
+        if batch_id is not None:
+            query += " WHERE batch_id = ?"
+            params = (batch_id,)
+        query += " ORDER BY id"
+
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute(query, params)]
+
+
+class Heartbeat:
+    """Timer thread that keeps the lease of a running job alive."""
+
+    def __init__(self, queue, job_id, worker_id):
+        """
+        Initialize the heartbeat.
+
+        Args:
+            queue: JobQueue holding the job
+            job_id: Claimed job
+            worker_id: Worker that claimed it
+        """
+        self.queue = queue
+        self.job_id = job_id
+        self.worker_id = worker_id
+        # Several beats per lease, so one slow database write does not lose the job
+        self.interval = max(queue.lease_seconds / 4, 0.05)
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{job_id}", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop_event.set()
+        self._thread.join()
+
+    def _run(self):
+        """Send heartbeats until stopped or the job is lost."""
+        while not self._stop_event.wait(self.interval):
+            try:
+                if not self.queue.heartbeat(self.job_id, self.worker_id):
+                    logging.warning(f"Job {self.job_id} is no longer owned by {self.worker_id}")
+                    return
+            except sqlite3.Error as e:
+                logging.warning(f"Heartbeat for job {self.job_id} failed: {str(e)}")
+
+
+def run_worker(queue, batch_id=None, worker_id=None, mapping_config_path=None, stop_event=None):
+    """
+    Claim and convert jobs until the queue has nothing runnable left.
+
+    Args:
+        queue: JobQueue to drain
+        batch_id: Restrict the worker to one batch (optional)
+        worker_id: Worker identifier (defaults to host:pid:thread)
+        mapping_config_path: Path to the saved mappings file (optional)
+        stop_event: threading.Event that stops the worker between jobs (optional)
+
+    Returns:
+        dict: Number of jobs completed and failed by this worker
+    """
+    worker_id = worker_id or default_worker_id()
+    summary = {"completed": 0, "failed": 0}
+
+    while stop_event is None or not stop_event.is_set():
+        job = queue.claim(worker_id, batch_id=batch_id)
+        if job is None:
+            break
+
+        name = os.path.basename(job["adjusted_file"])
+        logging.info(f"Worker {worker_id} claimed job {job['id']} ({name}, attempt {job['attempts']})")
+
+        def progress(message, percent, job_id=job["id"]):
+            queue.update_stage(job_id, worker_id, message)
+
+        try:
+            # Heartbeats come from a timer, so one long stage cannot outlive the lease
+            with Heartbeat(queue, job["id"], worker_id):
+                result = run_conversion(
+                    job["adjusted_file"],
+                    job["template_file"],
+                    job["output_file"],
+                    adjusted_sheet=job["adjusted_sheet"],
+                    template_sheet=job["template_sheet"],
+                    mapping_config=MappingConfigManager(mapping_config_path),
+                    default_deductible=job["default_deductible"],
+                    progress_callback=progress
+                )
+            if queue.complete(job["id"], worker_id, result["output_file"],
+                              mapping_signature=result["mapping_signature"],
+                              rows_in=result["rows_in"], rows_out=result["rows_out"]):
+                summary["completed"] += 1
+            else:
+                logging.warning(f"Job {job['id']} was reclaimed by another worker before it finished")
+        except Exception as e:
+            logging.error(f"Job {job['id']} ({name}) failed: {str(e)}", exc_info=True)
+            queue.fail(job["id"], worker_id, e)
+            summary["failed"] += 1
+
+    return summary
+
+
+def run_batch(queue, input_files, template_file, output_dir, batch_id=None, template_sheet=None,
+              default_deductible="100", max_workers=2, mapping_config_path=None):
+    """
+    Queue a set of files as a batch and convert them, skipping work already done.
+
+    Running the same batch again (for example after a crash) only converts files
+    that have not finished, were edited, or whose output has gone missing. Jobs
+    left claimed by a crashed worker process on this host are picked up again
+    right away. Outputs are named by batch_output_path.
+
+    Args:
+        queue: JobQueue holding the batch
+        input_files: Adjusted Rates files to convert
+        template_file: Path to the Template Excel file
+        output_dir: Directory for converted files
+        batch_id: Batch identifier (defaults to the output directory)
+        template_sheet: Sheet name in the template (first sheet if None)
+        default_deductible: Preferred deductible for the PlanDeduct column
+        max_workers: Number of worker threads in this process
+        mapping_config_path: Path to the saved mappings file (optional)
+
+    Returns:
+        dict: Job counts by status for the batch
+    """
+    batch_id = batch_id or os.path.abspath(output_dir)
+
+    added = 0
+    for path in input_files:
+        if queue.enqueue(batch_id, path, template_file, batch_output_path(output_dir, path),
+                         template_sheet=template_sheet, default_deductible=default_deductible):
+            added += 1
+    requeued = queue.reset_missing_outputs(batch_id)
+    requeued += queue.reclaim_dead_workers(batch_id)
+
+    logging.info(f"Batch {batch_id}: {added} new or changed inputs, {requeued} requeued, {queue.counts(batch_id)}")
+
+    workers = [
+        threading.Thread(target=run_worker, name=f"batch-worker-{i}",
+                         kwargs={"queue": queue, "batch_id": batch_id,
+                                 "mapping_config_path": mapping_config_path})
+        for i in range(max(1, max_workers))
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    counts = queue.counts(batch_id)
+    logging.info(f"Batch {batch_id} finished: {counts}")
+    return counts
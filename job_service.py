@@ -0,0 +1,583 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Job Service module for Moxy Rates Template Transfer
+
+This module provides a small local HTTP service (asyncio, standard library only)
+that lets other tools upload files, queue conversions on a worker pool, poll job
+progress and download results.
+
+Endpoints:
+    POST /uploads?name=<file name>   Upload a workbook (raw request body)
+    POST /jobs                       Queue a conversion (JSON body)
+    GET  /jobs                       List jobs
+    GET  /jobs/<id>                  Job status and progress
+    GET  /jobs/<id>/result           Download the converted workbook
+    GET  /health                     Service counters
+"""
+
+import os
+import re
+import json
+import uuid
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+from config_manager import MappingConfigManager
+from conversion import run_conversion
+
+# Size of the blocks used to stream request and response bodies
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Largest JSON request body accepted
+MAX_JSON_BYTES = 64 * 1024
+
+# Largest request line / header block accepted
+MAX_HEADER_BYTES = 16 * 1024
+
+# Number of finished jobs kept for status queries
+MAX_FINISHED_JOBS = 500
+
+# Seconds an upload no queued or running job refers to is kept before it is deleted
+DEFAULT_UPLOAD_TTL = 3600
+
+# Longest pause between sweeps for expired uploads
+UPLOAD_SWEEP_INTERVAL = 60
+
+HTTP_REASONS = {
+    200: "OK", 201: "Created", 202: "Accepted", 400: "Bad Request", 404: "Not Found",
+    405: "Method Not Allowed", 409: "Conflict", 411: "Length Required",
+    413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"
+}
+
+
+class HTTPError(Exception):
+    """Error that is reported to the client with an HTTP status code."""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+class ConversionJob:
+    """State of a single queued conversion."""
+
+    def __init__(self, adjusted_file, template_file, output_file, adjusted_sheet=None,
+                 template_sheet=None, default_deductible="100", use_saved_mappings=True,
+                 upload_ids=None):
+        self.job_id = uuid.uuid4().hex
+        self.adjusted_file = adjusted_file
+        self.template_file = template_file
+        self.output_file = output_file
+        self.adjusted_sheet = adjusted_sheet
+        self.template_sheet = template_sheet
+        self.default_deductible = default_deductible
+        self.use_saved_mappings = use_saved_mappings
+        # Uploads the job holds a reference to until it finishes
+        self.upload_ids = upload_ids or []
+
+        self.status = "queued"
+        self.progress = 0
+        self.message = "Queued"
+        self.error = None
+        self.result = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def to_dict(self):
+        """
+        Get a JSON-serializable view of the job.
+
+        Returns:
+            dict: Job status
+        """
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "progress": self.progress,
+            "message": self.message,
+            "error": self.error,
+            "adjusted_file": self.adjusted_file,
+            "template_file": self.template_file,
+            "rows_in": self.result["rows_in"] if self.result else None,
+            "rows_out": self.result["rows_out"] if self.result else None,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished
+        }
+
+
+class Upload:
+    """An uploaded workbook and the number of unfinished jobs that use it."""
+
+    def __init__(self, upload_id, path):
+        self.upload_id = upload_id
+        self.path = path
+        self.refs = 0
+        # Time the upload was stored or last released by a job
+        self.idle_since = time.time()
+
+
+class JobService:
+    """Local HTTP service that queues conversions onto a worker pool."""
+
+    def __init__(self, host="127.0.0.1", port=8765, work_dir=None, max_workers=2,
+                 max_queued_jobs=16, max_upload_bytes=200 * 1024 * 1024,
+                 max_concurrent_uploads=4, mapping_config_path=None, upload_ttl=DEFAULT_UPLOAD_TTL):
+        """
+        Initialize the job service.
+
+        Args:
+            host: Interface to bind (local only by default)
+            port: TCP port to listen on
+            work_dir: Directory for uploads and results
+            max_workers: Number of conversions run concurrently
+            max_queued_jobs: Jobs accepted before new submissions are rejected with 503
+            max_upload_bytes: Largest upload accepted
+            max_concurrent_uploads: Uploads streamed at the same time before rejecting with 503
+            mapping_config_path: Path to the saved mappings file (optional)
+            upload_ttl: Seconds an upload that no queued or running job uses is kept
+        """
+        self.host = host
+        self.port = port
+        self.work_dir = work_dir or os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "service_data")
+        self.upload_dir = os.path.join(self.work_dir, "uploads")
+        self.result_dir = os.path.join(self.work_dir, "results")
+        self.max_workers = max(1, max_workers)
+        self.max_queued_jobs = max(1, max_queued_jobs)
+        self.max_upload_bytes = max_upload_bytes
+        self.max_concurrent_uploads = max(1, max_concurrent_uploads)
+        self.mapping_config_path = mapping_config_path
+        self.upload_ttl = max(0, upload_ttl)
+
+        self.jobs = {}
+        self.uploads = {}
+        self._queue = None
+        self._upload_slots = 0
+        self._executor = None
+        self._server = None
+        self._workers = []
+        self._sweeper = None
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+
+        logging.info(f"JobService initialized on {self.host}:{self.port}")
+
+    async def start(self):
+        """Start listening and launch the worker tasks."""
+        os.makedirs(self.upload_dir, exist_ok=True)
+        os.makedirs(self.result_dir, exist_ok=True)
+
+        self._queue = asyncio.Queue(maxsize=self.max_queued_jobs)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                            thread_name_prefix="job-worker")
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_workers)]
+        self._sweeper = asyncio.create_task(self._sweep_uploads())
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port, limit=MAX_HEADER_BYTES)
+
+        logging.info(f"Job service listening on http://{self.host}:{self.port}")
+
+    async def stop(self):
+        """Stop accepting requests and wait for running conversions."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+        tasks = self._workers + ([self._sweeper] if self._sweeper else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._sweeper = None
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+        logging.info("Job service stopped")
+
+    async def serve_forever(self):
+        """Run the service until cancelled."""
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    # ------------------------------------------------------------------
+    # Job execution
+    # ------------------------------------------------------------------
+
+    async def _worker(self):
+        """Take jobs off the queue and run them on the thread pool."""
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            try:
+                job.status = "running"
+                job.started = time.time()
+                job.message = "Starting conversion"
+
+                def progress(message, percent, job=job):
+                    job.message = message
+                    job.progress = percent
+
+                mapping_config = MappingConfigManager(self.mapping_config_path)
+                job.result = await loop.run_in_executor(
+                    self._executor,
+                    lambda: run_conversion(
+                        job.adjusted_file,
+                        job.template_file,
+                        job.output_file,
+                        adjusted_sheet=job.adjusted_sheet,
+                        template_sheet=job.template_sheet,
+                        mapping_config=mapping_config,
+                        default_deductible=job.default_deductible,
+                        use_saved_mappings=job.use_saved_mappings,
+                        progress_callback=progress
+                    )
+                )
+                job.output_file = job.result["output_file"]
+                job.status = "done"
+                job.progress = 100
+                self._counters["completed"] += 1
+            except Exception as e:
+                logging.error(f"Job {job.job_id} failed: {str(e)}", exc_info=True)
+                job.status = "failed"
+                job.error = str(e)
+                job.message = f"Error: {str(e)}"
+                self._counters["failed"] += 1
+            finally:
+                job.finished = time.time()
+                self._release_uploads(job)
+                self._queue.task_done()
+                self._prune_finished_jobs()
+
+    def _prune_finished_jobs(self):
+        """Forget the oldest finished jobs once the history limit is reached."""
+        finished = [job for job in self.jobs.values() if job.finished is not None]
+        if len(finished) <= MAX_FINISHED_JOBS:
+            return
+        finished.sort(key=lambda job: job.finished)
+        for job in finished[:len(finished) - MAX_FINISHED_JOBS]:
+            self.jobs.pop(job.job_id, None)
+            if job.output_file and os.path.exists(job.output_file):
+                try:
+                    os.remove(job.output_file)
+                except OSError:
+                    pass
+
+    def _release_uploads(self, job):
+        """Drop a finished job's references to its uploads."""
+        now = time.time()
+        for upload_id in job.upload_ids:
+            upload = self.uploads.get(upload_id)
+            if upload is not None:
+                upload.refs -= 1
+                upload.idle_since = now
+        job.upload_ids = []
+
+    def expire_uploads(self, now=None):
+        """
+        Delete uploads that no queued or running job uses and that have been idle for upload_ttl.
+
+        An upload can be used by any number of jobs (for example one template
+        for many rate files), so it is kept while a job still refers to it and
+        for upload_ttl seconds after, for jobs submitted later.
+
+        Args:
+            now: Current time (time.time() if None)
+
+        Returns:
+            int: Number of uploads deleted
+        """
+        now = time.time() if now is None else now
+        expired = [upload for upload in self.uploads.values()
+                   if upload.refs <= 0 and now - upload.idle_since >= self.upload_ttl]
+        for upload in expired:
+            del self.uploads[upload.upload_id]
+            try:
+                os.remove(upload.path)
+            except OSError:
+                pass
+        if expired:
+            logging.info(f"Deleted {len(expired)} unused uploads")
+        return len(expired)
+
+    async def _sweep_uploads(self):
+        """Delete expired uploads periodically."""
+        while True:
+            await asyncio.sleep(min(UPLOAD_SWEEP_INTERVAL, max(self.upload_ttl, 1)))
+            self.expire_uploads()
+
+    # ------------------------------------------------------------------
+    # HTTP handling
+    # ------------------------------------------------------------------
+
+    async def _handle_connection(self, reader, writer):
+        """Serve a single HTTP request on a connection."""
+        try:
+            try:
+                method, path, query, headers = await self._read_request_head(reader)
+                await self._route(method, path, query, headers, reader, writer)
+            except HTTPError as e:
+                await self._send_json(writer, e.status, {"error": e.message}, e.headers)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                pass
+            except Exception as e:
+                logging.error(f"Unhandled error in job service: {str(e)}", exc_info=True)
+                await self._send_json(writer, 500, {"error": "Internal server error"})
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def _read_request_head(self, reader):
+        """Read the request line and headers."""
+        try:
+            request_line = (await reader.readline()).decode('latin-1').strip()
+        except (asyncio.LimitOverrunError, ValueError):
+            raise HTTPError(400, "Request line too long")
+
+        parts = request_line.split()
+        if len(parts) != 3:
+            raise HTTPError(400, "Malformed request line")
+        method, target, _ = parts
+
+        headers = {}
+        total = len(request_line)
+        while True:
+            line = (await reader.readline()).decode('latin-1')
+            total += len(line)
+            if total > MAX_HEADER_BYTES:
+                raise HTTPError(400, "Headers too large")
+            if line in ('\r\n', '\n', ''):
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        return method.upper(), url.path.rstrip('/') or '/', query, headers
+
+    async def _route(self, method, path, query, headers, reader, writer):
+        """Dispatch a request to its handler."""
+        if path == "/health" and method == "GET":
+            await self._send_json(writer, 200, self.stats())
+            return
+
+        if path == "/uploads":
+            if method != "POST":
+                raise HTTPError(405, "Use POST to upload files")
+            await self._handle_upload(query, headers, reader, writer)
+            return
+
+        if path == "/jobs":
+            if method == "POST":
+                await self._handle_submit(headers, reader, writer)
+            elif method == "GET":
+                jobs = sorted(self.jobs.values(), key=lambda job: job.created, reverse=True)
+                await self._send_json(writer, 200, {"jobs": [job.to_dict() for job in jobs]})
+            else:
+                raise HTTPError(405, "Use GET or POST")
+            return
+
+        match = re.fullmatch(r"/jobs/([0-9a-f]+)(/result)?", path)
+        if match and method == "GET":
+            job = self.jobs.get(match.group(1))
+            if job is None:
+                raise HTTPError(404, "Unknown job")
+            if match.group(2):
+                await self._send_result(job, writer)
+            else:
+                await self._send_json(writer, 200, job.to_dict())
+            return
+
+        raise HTTPError(404, "Not found")
+
+    def _content_length(self, headers, limit):
+        """Validate the Content-Length header against a size limit."""
+        if 'content-length' not in headers:
+            raise HTTPError(411, "Content-Length header is required")
+        try:
+            length = int(headers['content-length'])
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length < 0:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length > limit:
+            raise HTTPError(413, f"Request body larger than {limit} bytes")
+        return length
+
+    async def _handle_upload(self, query, headers, reader, writer):
+        """Stream an uploaded workbook to disk."""
+        length = self._content_length(headers, self.max_upload_bytes)
+
+        # Backpressure: refuse new uploads instead of buffering them
+        if self._upload_slots >= self.max_concurrent_uploads:
+            self._counters["rejected"] += 1
+            raise HTTPError(503, "Too many uploads in progress", {"Retry-After": "5"})
+
+        name = os.path.basename(query.get("name", "upload.xlsx")) or "upload.xlsx"
+        name = re.sub(r'[^A-Za-z0-9._ -]', '_', name)
+        if not name.lower().endswith(('.xlsx', '.xls')):
+            raise HTTPError(400, "Only .xlsx and .xls files can be uploaded")
+
+        upload_id = uuid.uuid4().hex
+        upload_path = os.path.join(self.upload_dir, f"{upload_id}_{name}")
+
+        self._upload_slots += 1
+        try:
+            remaining = length
+            with open(upload_path, 'wb') as f:
+                while remaining > 0:
+                    chunk = await reader.read(min(STREAM_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise HTTPError(400, "Upload ended before Content-Length bytes")
+                    f.write(chunk)
+                    remaining -= len(chunk)
+        except BaseException:
+            try:
+                os.remove(upload_path)
+            except OSError:
+                pass
+            raise
+        finally:
+            self._upload_slots -= 1
+
+        self.uploads[upload_id] = Upload(upload_id, upload_path)
+        logging.info(f"Stored upload {upload_id} ({length} bytes)")
+        await self._send_json(writer, 201, {"upload_id": upload_id, "size": length})
+
+    async def _handle_submit(self, headers, reader, writer):
+        """Queue a conversion job described by a JSON body."""
+        length = self._content_length(headers, MAX_JSON_BYTES)
+        try:
+            request = json.loads((await reader.readexactly(length)).decode('utf-8') or "{}")
+        except (ValueError, UnicodeDecodeError):
+            raise HTTPError(400, "Request body must be JSON")
+        if not isinstance(request, dict):
+            raise HTTPError(400, "Request body must be a JSON object")
+
+        adjusted_file, adjusted_upload = self._resolve_input(request, "adjusted")
+        template_file, template_upload = self._resolve_input(request, "template")
+
+        if self._queue.full():
+            self._counters["rejected"] += 1
+            raise HTTPError(503, "Job queue is full", {"Retry-After": "10"})
+
+        base_name = os.path.splitext(os.path.basename(adjusted_file))[0]
+        job = ConversionJob(
+            adjusted_file,
+            template_file,
+            output_file=None,
+            adjusted_sheet=request.get("adjusted_sheet"),
+            template_sheet=request.get("template_sheet"),
+            default_deductible=str(request.get("default_deductible", "100")),
+            use_saved_mappings=bool(request.get("use_saved_mappings", True)),
+            upload_ids=[upload_id for upload_id in (adjusted_upload, template_upload) if upload_id]
+        )
+        job.output_file = os.path.join(self.result_dir, f"{job.job_id}_{base_name}_processed.xlsx")
+
+        for upload_id in job.upload_ids:
+            self.uploads[upload_id].refs += 1
+        self.jobs[job.job_id] = job
+        self._queue.put_nowait(job)
+        self._counters["submitted"] += 1
+        logging.info(f"Queued job {job.job_id} for {adjusted_file}")
+
+        await self._send_json(writer, 202, {
+            "job_id": job.job_id,
+            "status_url": f"/jobs/{job.job_id}",
+            "result_url": f"/jobs/{job.job_id}/result"
+        })
+
+    def _resolve_input(self, request, kind):
+        """
+        Resolve an input given either as a local path or as an upload id.
+
+        Returns:
+            tuple: (file path, upload id or None)
+        """
+        upload_id = request.get(f"{kind}_upload")
+        if upload_id:
+            upload = self.uploads.get(upload_id)
+            if upload is None:
+                raise HTTPError(400, f"Unknown {kind} upload: {upload_id}")
+            return upload.path, upload_id
+
+        path = request.get(f"{kind}_file")
+        if not path:
+            raise HTTPError(400, f"Provide {kind}_file or {kind}_upload")
+        if not os.path.isfile(path):
+            raise HTTPError(400, f"{kind.capitalize()} file does not exist: {path}")
+        return path, None
+
+    async def _send_result(self, job, writer):
+        """Stream the converted workbook of a finished job."""
+        if job.status == "failed":
+            raise HTTPError(409, f"Job failed: {job.error}")
+        if job.status != "done":
+            raise HTTPError(409, f"Job is {job.status}")
+        if not job.output_file or not os.path.exists(job.output_file):
+            raise HTTPError(404, "Result file is no longer available")
+
+        size = os.path.getsize(job.output_file)
+        file_name = os.path.basename(job.output_file).split('_', 1)[-1]
+        await self._write_head(writer, 200, {
+            "Content-Type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            "Content-Length": str(size),
+            "Content-Disposition": f'attachment; filename="{file_name}"'
+        })
+        with open(job.output_file, 'rb') as f:
+            while True:
+                chunk = f.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                writer.write(chunk)
+                # Wait for the socket buffer to drain so large files are not buffered in memory
+                await writer.drain()
+
+    async def _write_head(self, writer, status, headers):
+        """Write the status line and headers of a response."""
+        lines = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}"]
+        headers = dict(headers)
+        headers.setdefault("Connection", "close")
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+        await writer.drain()
+
+    async def _send_json(self, writer, status, payload, headers=None):
+        """Send a JSON response."""
+        body = json.dumps(payload).encode('utf-8')
+        response_headers = {"Content-Type": "application/json", "Content-Length": str(len(body))}
+        response_headers.update(headers or {})
+        await self._write_head(writer, status, response_headers)
+        writer.write(body)
+        await writer.drain()
+
+    def stats(self):
+        """
+        Get service counters.
+
+        Returns:
+            dict: Queue depth, job counts and worker configuration
+        """
+        stats = dict(self._counters)
+        stats["queued"] = self._queue.qsize() if self._queue else 0
+        stats["running"] = sum(1 for job in self.jobs.values() if job.status == "running")
+        stats["uploads"] = len(self.uploads)
+        stats["max_queued_jobs"] = self.max_queued_jobs
+        stats["workers"] = self.max_workers
+        return stats
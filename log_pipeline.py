@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Log Pipeline module for Moxy Rates Template Transfer
+
+This module moves log output off the threads that do the work. Log calls put
+records on a bounded in-memory queue; a background listener thread formats them
+and writes them to the console and to a size-rotated log file whose old
+segments are gzip-compressed.
+
+When the queue is full, records below WARNING are dropped (and, above a high
+watermark, only a sample of them is kept) so that logging never stalls a
+conversion. Warnings and errors wait briefly for space before being dropped.
+A summary of dropped records is logged once space is available again.
+"""
+
+import os
+import re
+import gzip
+import time
+import queue
+import shutil
+import atexit
+import logging
+import threading
+import logging.handlers
+
+# Maximum number of records buffered between producers and the listener
+DEFAULT_QUEUE_SIZE = 10000
+
+# Rotate the log file once it reaches this size
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+
+# Number of rotated (compressed) segments kept per log file
+DEFAULT_BACKUP_COUNT = 5
+
+# Daily log files written to more recently than this may still be open in
+# another process (a watch daemon keeps the file of the day it started)
+DEFAULT_IDLE_SECONDS = 3600
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops or samples low-priority records instead of blocking."""
+
+    def __init__(self, log_queue, block_timeout=0.25, sample_watermark=0.75, sample_every=10):
+        """
+        Initialize the handler.
+
+        Args:
+            log_queue: Bounded queue.Queue shared with the listener
+            block_timeout: Seconds a WARNING or higher record may wait for space
+            sample_watermark: Queue fill ratio above which INFO/DEBUG records are sampled
+            sample_every: Keep one in this many INFO/DEBUG records above the watermark
+        """
+        super().__init__(log_queue)
+        self.block_timeout = block_timeout
+        self.sample_every = max(1, sample_every)
+        self._high_watermark = int(log_queue.maxsize * sample_watermark) if log_queue.maxsize > 0 else None
+        self._sample_counter = 0
+        self._dropped = 0
+        self._lock = threading.Lock()
+
+    @property
+    def dropped(self):
+        """Number of records dropped since the last drop summary."""
+        return self._dropped
+
+    def emit(self, record):
+        """
+        Queue a record without stalling the caller.
+
+        Whether an INFO/DEBUG record is dropped or sampled out is decided
+        before prepare() formats it, so dropped records cost no formatting.
+        """
+        try:
+            if record.levelno < logging.WARNING and not self._admit(record):
+                self._count_drop()
+                return
+            self.enqueue(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+    def _admit(self, record):
+        """Whether there is room for an INFO/DEBUG record (sampled above the high watermark)."""
+        if self.queue.full():
+            return False
+        if self._high_watermark is not None and self.queue.qsize() >= self._high_watermark:
+            with self._lock:
+                self._sample_counter += 1
+                return self._sample_counter % self.sample_every == 0
+        return True
+
+    def enqueue(self, record):
+        """Put a prepared record on the queue, dropping it if there is no room."""
+        try:
+            if record.levelno < logging.WARNING:
+                self.queue.put_nowait(record)
+            else:
+                self.queue.put(record, timeout=self.block_timeout)
+        except queue.Full:
+            self._count_drop()
+            return
+
+        if self._dropped:
+            self._report_drops()
+
+    def _count_drop(self):
+        with self._lock:
+            self._dropped += 1
+
+    def _report_drops(self):
+        """Queue one warning that summarizes the records dropped so far."""
+        with self._lock:
+            dropped, self._dropped = self._dropped, 0
+        if not dropped:
+            return
+        summary = logging.LogRecord("log_pipeline", logging.WARNING, __file__, 0,
+                                    f"Log buffer full: dropped {dropped} log records", None, None)
+        try:
+            self.queue.put_nowait(summary)
+        except queue.Full:
+            with self._lock:
+                self._dropped += dropped
+
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Size-rotated log file whose rotated segments are gzip-compressed."""
+
+    def __init__(self, filename, max_bytes=DEFAULT_MAX_BYTES, backup_count=DEFAULT_BACKUP_COUNT,
+                 encoding='utf-8'):
+        """
+        Initialize the handler.
+
+        Args:
+            filename: Path of the active log file
+            max_bytes: Size at which the file is rotated
+            backup_count: Number of compressed segments kept
+            encoding: Text encoding of the log file
+        """
+        super().__init__(filename, mode='a', maxBytes=max_bytes, backupCount=backup_count,
+                         encoding=encoding)
+        self.namer = lambda name: name + ".gz"
+        self.rotator = _gzip_rotator
+
+
+def _gzip_rotator(source, dest):
+    """
+    Compress a rotated log segment and remove the uncompressed file.
+
+    The segment is first renamed to ``<log>.<N>``, so a compression cut short
+    leaves a segment that compress_old_logs finishes later.
+    """
+    # dest is namer(<log>.<N>), i.e. <log>.<N>.gz
+    segment = dest[:-len(".gz")]
+    os.replace(source, segment)
+    _compress_segment(segment, dest)
+
+
+def _compress_segment(segment, dest):
+    """Gzip a log segment to dest and remove it."""
+    with open(segment, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    try:
+        os.remove(segment)
+    except OSError:
+        # Still open elsewhere (Windows); keep the log and compress it another time
+        os.remove(dest)
+        raise
+
+
+def compress_old_logs(log_dir, active_log=None, pattern=r"app_\d{8}\.log", idle_seconds=DEFAULT_IDLE_SECONDS):
+    """
+    Gzip-compress log files of previous days and rotated segments whose compression was interrupted.
+
+    Daily log files matching pattern are compressed unless they are the active
+    log or were written to in the last idle_seconds. Rotated segments
+    (``<log file>.<N>``, see CompressingRotatingFileHandler) are always
+    compressed. Other files in the folder are left alone, and a file whose
+    ``.gz`` already exists is skipped rather than overwriting it.
+
+    Args:
+        log_dir: Directory holding the log files
+        active_log: Path of the log file this process writes to (never compressed)
+        pattern: Regular expression of the daily log file names
+        idle_seconds: Minimum time since a daily log was last written
+
+    Returns:
+        int: Number of files compressed
+    """
+    log_name = re.compile(pattern)
+    segment_name = re.compile(rf"{pattern}\.\d+")
+    active_log = os.path.abspath(active_log) if active_log else None
+    idle_before = time.time() - idle_seconds
+    compressed = 0
+    for name in sorted(os.listdir(log_dir)):
+        path = os.path.join(log_dir, name)
+        if os.path.exists(path + ".gz"):
+            continue
+        if log_name.fullmatch(name):
+            try:
+                if os.path.abspath(path) == active_log or os.path.getmtime(path) > idle_before:
+                    continue
+            except OSError:
+                continue
+        elif not segment_name.fullmatch(name):
+            continue
+        try:
+            _compress_segment(path, path + ".gz")
+            compressed += 1
+        except OSError as e:
+            logging.warning(f"Could not compress old log file {path}: {str(e)}")
+    if compressed:
+        logging.info(f"Compressed {compressed} old log files in {log_dir}")
+    return compressed
+
+
+def setup_logging(log_file=None, level=logging.INFO, console=True, max_bytes=DEFAULT_MAX_BYTES,
+                  backup_count=DEFAULT_BACKUP_COUNT, queue_size=DEFAULT_QUEUE_SIZE):
+    """
+    Route all root logger output through a bounded queue and a background listener.
+
+    Any handlers already attached to the root logger are replaced. Calling this
+    again stops the previous listener first.
+
+    Args:
+        log_file: Path of the log file (no file output if None)
+        level: Root logger level
+        console: Whether to also log to the console
+        max_bytes: Size at which the log file is rotated
+        backup_count: Number of compressed segments kept
+        queue_size: Maximum number of buffered records
+
+    Returns:
+        QueueListener: The running listener
+    """
+    global _listener
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = []
+    if log_file:
+        file_handler = CompressingRotatingFileHandler(log_file, max_bytes=max_bytes,
+                                                      backup_count=backup_count)
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+        handlers.append(console_handler)
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+    with _listener_lock:
+        shutdown_logging()
+
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+            handler.close()
+        root.addHandler(DroppingQueueHandler(log_queue))
+        root.setLevel(level)
+
+        listener.start()
+        _listener = listener
+
+    return listener
+
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    listener, _listener = _listener, None
+    if listener is None:
+        return
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Long Export module for Moxy Rates Template Transfer
+
+This module turns filled templates (one row per rate group with a DeductN
+column per deductible) back into the long Deductible/RateCost layout, for
+audits and for systems that import rates one per row.
+
+Workbooks are read and written in chunks, so a template of any size is
+exported without holding it, or its long form, in memory as a whole.
+"""
+
+import os
+import sys
+import logging
+import argparse
+import pandas as pd
+
+from data_processor import DataProcessor
+from out_of_core import iter_sheet_chunks
+
+# Template rows unpivoted at a time when streaming a workbook
+DEFAULT_CHUNK_ROWS = 50000
+
+# Rows an Excel worksheet can hold, including the header
+EXCEL_MAX_ROWS = 1048576
+
+
+def iter_long_chunks(source, sheet_name=None, chunk_rows=DEFAULT_CHUNK_ROWS, data_processor=None):
+    """
+    Unpivot a filled template chunk by chunk.
+
+    Args:
+        source: DataFrame with DeductN columns, or path to a filled template workbook
+        sheet_name: Sheet to read from a workbook (first sheet if None)
+        chunk_rows: Maximum template rows per chunk
+        data_processor: DataProcessor that unpivots the rows (a new one if None)
+
+    Yields:
+        DataFrame: Long rows of the next chunk (see DataProcessor.unpivot_data); a
+        source without rows yields one empty chunk with the long columns
+    """
+    data_processor = data_processor or DataProcessor()
+    if isinstance(source, pd.DataFrame):
+        chunks = (source.iloc[start:start + chunk_rows] for start in range(0, len(source), chunk_rows))
+    else:
+        chunks = iter_sheet_chunks(source, sheet_name, chunk_rows)
+    empty = True
+    for chunk in chunks:
+        empty = False
+        yield data_processor.unpivot_data(chunk)
+    if empty:
+        if not isinstance(source, pd.DataFrame):
+            # A sheet with only a header row streams no chunks
+            source = pd.read_excel(source, sheet_name=sheet_name or 0, nrows=0)
+        yield data_processor.unpivot_data(source.iloc[:0])
+
+
+def export_long(source, output_file, sheet_name=None, output_sheet="Rates", chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Write a filled template in the long Deductible/RateCost layout.
+
+    Files ending in .csv are written as CSV, anything else as an Excel workbook.
+
+    Args:
+        source: DataFrame with DeductN columns, or path to a filled template workbook
+        output_file: Path of the file to create
+        sheet_name: Sheet to read from a workbook (first sheet if None)
+        output_sheet: Sheet name of an Excel output
+        chunk_rows: Maximum template rows unpivoted at a time
+
+    Returns:
+        int: Number of rates written
+
+    Raises:
+        ValueError: If the source has no DeductN columns or the rates do not fit in a worksheet
+    """
+    directory = os.path.dirname(output_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    chunks = iter_long_chunks(source, sheet_name, chunk_rows)
+    try:
+        if output_file.lower().endswith(".csv"):
+            rows = _write_csv(chunks, output_file)
+        else:
+            rows = _write_workbook(chunks, output_file, output_sheet)
+    except Exception:
+        # No half-written export is left behind
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        raise
+    logging.info(f"Exported {rows} rates in long format to {output_file}")
+    return rows
+
+
+def _write_csv(chunks, output_file):
+    """Append long chunks to a CSV file."""
+    rows = 0
+    header_written = False
+    with open(output_file, "w", newline="", encoding="utf-8") as handle:
+        for chunk in chunks:
+            chunk.to_csv(handle, index=False, header=not header_written)
+            header_written = True
+            rows += len(chunk)
+    return rows
+
+
+def _write_workbook(chunks, output_file, sheet_name):
+    """Stream long chunks into a worksheet, row by row."""
+    try:
+        import xlsxwriter
+    except ImportError:
+        xlsxwriter = None
+
+    if xlsxwriter is None:
+        import openpyxl
+        workbook = openpyxl.Workbook(write_only=True)
+        worksheet = workbook.create_sheet(sheet_name)
+
+        def write_row(row_number, values):
+            worksheet.append(values)
+
+        def close():
+            workbook.save(output_file)
+    else:
+        # constant_memory flushes every finished row to disk
+        workbook = xlsxwriter.Workbook(output_file, {'constant_memory': True})
+        worksheet = workbook.add_worksheet(sheet_name)
+
+        def write_row(row_number, values):
+            worksheet.write_row(row_number, 0, values)
+
+        close = workbook.close
+
+    rows = 0
+    header_written = False
+    try:
+        for chunk in chunks:
+            if not header_written:
+                write_row(0, [str(col) for col in chunk.columns])
+                header_written = True
+            if rows + len(chunk) >= EXCEL_MAX_ROWS:
+                raise ValueError(f"More than {EXCEL_MAX_ROWS - 1} rates do not fit in a worksheet; "
+                                 f"export to a .csv file instead")
+            # Empty cells stay empty in the worksheet
+            chunk = chunk.astype(object).where(chunk.notna() & chunk.ne(''), None)
+            for row_number, values in enumerate(chunk.itertuples(index=False, name=None), start=rows + 1):
+                write_row(row_number, values)
+            rows += len(chunk)
+    finally:
+        close()
+    return rows
+
+
+def parse_arguments(argv=None):
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Export a filled template in the long Deductible/RateCost layout")
+    parser.add_argument("workbook", help="Filled template or converted output workbook")
+    parser.add_argument("output", help="File to create (.csv or .xlsx)")
+    parser.add_argument("--sheet", default=None, help="Sheet with the rates (first sheet by default)")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS,
+                        help=f"Template rows unpivoted at a time (default {DEFAULT_CHUNK_ROWS})")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    args = parse_arguments(argv)
+    try:
+        rows = export_long(args.workbook, args.output, sheet_name=args.sheet, chunk_rows=args.chunk_rows)
+    except ValueError as e:
+        print(f"Error: {str(e)}")
+        return 1
+    print(f"{rows} rates written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
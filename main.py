@@ -6,8 +6,18 @@ Moxy Rates Template Transfer Application
 
 This application automates the process of transferring data from an Adjusted Rates
 spreadsheet into a Template spreadsheet, with intelligent column mapping and format detection.
+
+Only light modules are imported here so the window appears quickly. The
+processing modules (pandas, openpyxl and fuzzywuzzy through file_analyzer,
+mapping_system, data_processor and conversion) are imported on first use, or
+ahead of time by a background warmup thread once the window is drawn.
 """
 
+import time
+
+# Start of the time-to-first-window measurement
+STARTUP_STARTED = time.perf_counter()
+
 import os
 import sys
 import tkinter as tk
@@ -15,26 +25,30 @@ from tkinter import ttk, filedialog, messagebox, simpledialog
 import configparser
 import threading
 import queue
+import multiprocessing
 import logging
 from datetime import datetime
-import pandas as pd
 import subprocess
-from PIL import Image, ImageTk
 import re
 
-# Try to import xlsxwriter - used as fallback for Excel saving
-try:
-    import xlsxwriter
-    XLSXWRITER_AVAILABLE = True
-except ImportError:
-    XLSXWRITER_AVAILABLE = False
-    logging.warning("xlsxwriter package not found. Will use default Excel engines only.")
-
-# Import custom modules
-from file_analyzer import FileAnalyzer
-from mapping_system import MappingSystem, MappingDialog
+# Import custom modules (light ones only, see module docstring)
 from config_manager import ConfigManager, MappingConfigManager
-from data_processor import DataProcessor
+from pipeline_metrics import RunMetrics, read_recent_runs, configure_metrics
+from profiling import RunProfiler, configure_profiling, PROFILE_MODES
+from log_pipeline import setup_logging, shutdown_logging, compress_old_logs
+
+# Modules that must not be imported before the first window is drawn
+HEAVY_MODULES = ("pandas", "openpyxl", "fuzzywuzzy")
+
+# Default time-to-first-window budget ([Advanced] startup_budget_ms)
+DEFAULT_STARTUP_BUDGET_MS = 1500
+
+# Leading bytes of .xlsx (zip container) and .xls (OLE2 compound file) workbooks
+XLSX_SIGNATURE = b"PK\x03\x04"
+XLS_SIGNATURE = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+
+class ActionCancelled(Exception):
+    """Raised inside a background action once the user has cancelled it."""
 
 class Application(tk.Tk):
     """Main application window for Moxy Rates Template Transfer."""
@@ -54,8 +68,13 @@ class Application(tk.Tk):
     PROGRESS_BG = "#8DC63F"  # Moxy green for progress
     PROGRESS_TROUGH = "#1B4B8F"  # Moxy blue for progress background
     
-    def __init__(self):
-        """Initialize the application."""
+    def __init__(self, warmup=True):
+        """
+        Initialize the application.
+        
+        Args:
+            warmup: Import the processing modules in the background once the window is drawn
+        """
         super().__init__()
         
         # Set window properties for modern look
@@ -94,10 +113,25 @@ class Application(tk.Tk):
         self.config_mgr = ConfigManager()
         self.config_mgr.load_config()
         self.configure_logging()
-        self.file_analyzer = FileAnalyzer()
-        self.data_processor = DataProcessor()
-        self.mapping_system = MappingSystem(self.config_mgr)
-        self.mapping_config = MappingConfigManager()
+        
+        # Processing components are created on first use (see the properties below)
+        self._file_analyzer = None
+        self._data_processor = None
+        self._mapping_config = None
+        self._mapping_system = None
+        self._prefetcher = None
+        self._components_lock = threading.RLock()
+        
+        # (name, cancel event) of the running Analyze/Preview action, if any
+        self.background_action = None
+        
+        # Time-to-first-window, set once the window has been drawn
+        self.startup_seconds = None
+        self.startup_ok = None
+        
+        # Stage metrics of the run in progress and of the last finished run
+        self.run_metrics = None
+        self.last_run_metrics = None
         
         # Set up custom styles
         self.setup_styles()
@@ -126,6 +160,105 @@ class Application(tk.Tk):
         # Update status
         self.status_var.set("Ready")
         logging.info("Application initialized")
+        
+        # Runs after the pending geometry and drawing work of the first window
+        self.after_idle(self._on_first_window, warmup)
+    
+    @property
+    def file_analyzer(self):
+        """File analyzer, created on first use."""
+        with self._components_lock:
+            if self._file_analyzer is None:
+                from file_analyzer import FileAnalyzer
+                self._file_analyzer = FileAnalyzer()
+            return self._file_analyzer
+    
+    @property
+    def data_processor(self):
+        """Data processor, created on first use."""
+        with self._components_lock:
+            if self._data_processor is None:
+                from data_processor import DataProcessor
+                self._data_processor = DataProcessor()
+            return self._data_processor
+    
+    @property
+    def mapping_config(self):
+        """Saved mappings manager, created on first use."""
+        with self._components_lock:
+            if self._mapping_config is None:
+                self._mapping_config = MappingConfigManager()
+            return self._mapping_config
+    
+    @property
+    def mapping_system(self):
+        """Mapping system, created on first use."""
+        with self._components_lock:
+            if self._mapping_system is None:
+                from mapping_system import MappingSystem
+                self._mapping_system = MappingSystem(self.mapping_config)
+            return self._mapping_system
+    
+    @property
+    def prefetcher(self):
+        """Background parser for selected workbooks, created on first use."""
+        with self._components_lock:
+            if self._prefetcher is None:
+                from prefetch import FilePrefetcher
+                self._prefetcher = FilePrefetcher(
+                    on_sheets=lambda kind, file_path, sheets, sheet: self.msg_queue.put(
+                        ("prefetch_sheets", {"kind": kind, "file_path": file_path,
+                                             "sheets": sheets, "sheet": sheet})),
+                    on_error=lambda kind, file_path, message: self.msg_queue.put(
+                        ("prefetch_error", {"kind": kind, "file_path": file_path, "message": message}))
+                )
+            return self._prefetcher
+    
+    def _on_first_window(self, warmup):
+        """
+        Record time-to-first-window and start the background warmup.
+        
+        Args:
+            warmup: Whether to start the warmup thread
+        """
+        self.update_idletasks()
+        self.startup_seconds = time.perf_counter() - STARTUP_STARTED
+        budget_ms = self.config_mgr.get_setting("startup_budget_ms", DEFAULT_STARTUP_BUDGET_MS, section="Advanced")
+        
+        # Heavy modules loaded at this point were imported eagerly by someone
+        early_imports = [name for name in HEAVY_MODULES if name in sys.modules]
+        self.startup_ok = self.startup_seconds * 1000 <= budget_ms and not early_imports
+        
+        message = f"Time to first window: {self.startup_seconds * 1000:.0f} ms (budget {budget_ms} ms)"
+        if early_imports:
+            message += f"; imported before the window: {', '.join(early_imports)}"
+        if self.startup_ok:
+            logging.info(message)
+        else:
+            logging.warning(message)
+        
+        if warmup:
+            threading.Thread(target=self._warmup, name="warmup", daemon=True).start()
+    
+    def _warmup(self):
+        """Import the processing modules and create the components in the background."""
+        started = time.perf_counter()
+        try:
+            # Plain import statements so that PyInstaller still bundles these modules
+            import pandas  # noqa: F401
+            import openpyxl  # noqa: F401
+            import conversion  # noqa: F401
+            import prefetch  # noqa: F401
+            from mapping_system import MappingDialog  # noqa: F401
+            # Touch the properties so the components exist before first use
+            self.file_analyzer
+            self.data_processor
+            self.mapping_system
+        except Exception as e:
+            # The components are created again on first use and report the error there
+            logging.warning(f"Background warmup failed: {str(e)}")
+            return
+        logging.info(f"Warmup loaded the processing modules in {time.perf_counter() - started:.2f}s")
     
     def configure_logging(self):
         """Configure the logging system."""
@@ -137,11 +270,11 @@ class Application(tk.Tk):
             
         log_file = os.path.join(log_dir, f"app_{datetime.now().strftime('%Y%m%d')}.log")
         
-        # Force create a new log file to check write permissions
+        # Check write permissions (append, so earlier runs of the day are kept)
         try:
-            with open(log_file, 'w') as f:
-                f.write(f"Log file created at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            print(f"Successfully created log file: {log_file}")
+            with open(log_file, 'a') as f:
+                f.write(f"Log file opened at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+            print(f"Successfully opened log file: {log_file}")
         except Exception as e:
             print(f"WARNING: Could not create log file {log_file}: {str(e)}")
             # Try to create in current directory as fallback
@@ -150,26 +283,20 @@ class Application(tk.Tk):
         # Configure logging
         log_level = logging.DEBUG if self.config_mgr.get_setting("enable_logging", False) else logging.INFO
         
-        # Clear any existing handlers
-        root = logging.getLogger()
-        for handler in root.handlers[:]:
-            root.removeHandler(handler)
-            
-        # Create new handlers
-        file_handler = logging.FileHandler(log_file, mode='a')
-        console_handler = logging.StreamHandler()
-        
-        # Create formatter
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        file_handler.setFormatter(formatter)
-        console_handler.setFormatter(formatter)
-        
-        # Add handlers
-        root.addHandler(file_handler)
-        root.addHandler(console_handler)
+        # Log records are queued and written by a background thread, so file I/O
+        # never runs on the processing threads
+        setup_logging(
+            log_file,
+            log_level,
+            max_bytes=self.config_mgr.get_setting("log_max_mb", 10, section="Advanced") * 1024 * 1024,
+            backup_count=self.config_mgr.get_setting("log_backup_count", 5, section="Advanced"),
+            queue_size=self.config_mgr.get_setting("log_queue_size", 10000, section="Advanced")
+        )
         
-        # Set log level
-        root.setLevel(log_level)
+        # Compress the logs of previous days and segments left by an interrupted rotation
+        if self.config_mgr.get_setting("compress_old_logs", True, section="Advanced"):
+            threading.Thread(target=compress_old_logs, args=(log_dir, log_file),
+                             name="log-compress", daemon=True).start()
         
         # Test logging
         logging.info("Logging configured successfully")
@@ -364,6 +491,7 @@ class Application(tk.Tk):
                                                style="Dark.TCombobox",
                                                state="readonly")
         self.adjusted_sheet_combo.pack(side=tk.TOP, fill=tk.X, pady=(0, 5))
+        self.adjusted_sheet_combo.bind("<<ComboboxSelected>>", lambda e: self.update_adjusted_sheets())
         
         ttk.Label(sheet_frame, text="Template Sheet:",
                  style="TLabel").pack(side=tk.TOP, anchor=tk.W, pady=(0, 2))
@@ -373,6 +501,7 @@ class Application(tk.Tk):
                                               style="Dark.TCombobox",
                                               state="readonly")
         self.template_sheet_combo.pack(side=tk.TOP, fill=tk.X)
+        self.template_sheet_combo.bind("<<ComboboxSelected>>", lambda e: self.update_template_sheets())
         
         # Right side - Default Deductible
         deduct_frame = ttk.Frame(bottom_frame, style="TFrame")
@@ -434,6 +563,31 @@ class Application(tk.Tk):
                               width=15)
         preview_btn.pack(side=tk.LEFT, padx=5)
         
+        # Cancel button stops a running analysis or mapping preview
+        self.cancel_btn = tk.Button(left_buttons, text="Cancel", 
+                              command=self.cancel_background_action,
+                              bg=self.BUTTON_BG,
+                              fg='#FFFFFF',
+                              font=("Segoe UI", 9, "bold"),
+                              relief='flat',
+                              activebackground=self.BUTTON_HOVER_BG,
+                              activeforeground='#FFFFFF',
+                              state=tk.DISABLED,
+                              width=15)
+        self.cancel_btn.pack(side=tk.LEFT, padx=5)
+        
+        # Diagnostics button shows stage timings of recent runs
+        diagnostics_btn = tk.Button(left_buttons, text="Diagnostics", 
+                              command=self.show_diagnostics,
+                              bg=self.BUTTON_BG,
+                              fg='#FFFFFF',
+                              font=("Segoe UI", 9, "bold"),
+                              relief='flat',
+                              activebackground=self.BUTTON_HOVER_BG,
+                              activeforeground='#FFFFFF',
+                              width=15)
+        diagnostics_btn.pack(side=tk.LEFT, padx=5)
+        
         # Right side buttons
         right_buttons = ttk.Frame(button_frame, style="TFrame")
         right_buttons.pack(side=tk.RIGHT)
@@ -603,34 +757,49 @@ class Application(tk.Tk):
             self.output_var.set(filename)
     
     def update_adjusted_sheets(self):
-        """Update the available sheets in adjusted rates file."""
-        try:
-            filename = self.adjusted_rates_var.get()
-            if filename and os.path.exists(filename):
-                sheets = self.file_analyzer.get_sheet_names(filename)
-                self.adjusted_sheet_combo['values'] = sheets
-                
-                # Set to first sheet if current selection not in list
-                if self.adjusted_sheet_var.get() not in sheets and sheets:
-                    self.adjusted_sheet_var.set(sheets[0])
-        except Exception as e:
-            logging.error(f"Error updating adjusted sheets: {str(e)}")
-            messagebox.showerror("Error", f"Error reading sheets: {str(e)}")
+        """
+        Start reading the adjusted rates file in the background.
+        
+        The sheet list is filled in when the prefetch reports it (see
+        apply_prefetched_sheets); the structure analysis and data load continue
+        in the background for the next processing run.
+        """
+        from prefetch import ADJUSTED
+        filename = self.adjusted_rates_var.get()
+        if filename and os.path.exists(filename):
+            self.prefetcher.request(ADJUSTED, filename, self.adjusted_sheet_var.get(),
+                                    auto_detect=self.auto_detect_var.get())
     
     def update_template_sheets(self):
-        """Update the available sheets in template file."""
-        try:
-            filename = self.template_var.get()
-            if filename and os.path.exists(filename):
-                sheets = self.file_analyzer.get_sheet_names(filename)
-                self.template_sheet_combo['values'] = sheets
-                
-                # Set to first sheet if current selection not in list
-                if self.template_sheet_var.get() not in sheets and sheets:
-                    self.template_sheet_var.set(sheets[0])
-        except Exception as e:
-            logging.error(f"Error updating template sheets: {str(e)}")
-            messagebox.showerror("Error", f"Error reading sheets: {str(e)}")
+        """Start reading the template file in the background (see update_adjusted_sheets)."""
+        from prefetch import TEMPLATE
+        filename = self.template_var.get()
+        if filename and os.path.exists(filename):
+            self.prefetcher.request(TEMPLATE, filename, self.template_sheet_var.get())
+    
+    def apply_prefetched_sheets(self, kind, file_path, sheets, sheet):
+        """
+        Fill a sheet list once the prefetch has read the workbook.
+        
+        Args:
+            kind: "adjusted" or "template"
+            file_path: Workbook the sheets belong to
+            sheets: Sheet names
+            sheet: Sheet chosen by the prefetch (auto-detected if the current one is missing)
+        """
+        if kind == "adjusted":
+            file_var, sheet_var, combo = self.adjusted_rates_var, self.adjusted_sheet_var, self.adjusted_sheet_combo
+        else:
+            file_var, sheet_var, combo = self.template_var, self.template_sheet_var, self.template_sheet_combo
+        
+        # Ignore results for a file that is no longer selected
+        if file_var.get() != file_path:
+            return
+        
+        combo['values'] = sheets
+        if sheet_var.get() not in sheets:
+            sheet_var.set(sheet)
+            logging.info(f"Selected {kind} sheet: {sheet}")
     
     def validate_inputs(self):
         """Validate input parameters before processing."""
@@ -665,14 +834,18 @@ class Application(tk.Tk):
             messagebox.showerror("Error", f"Template file does not exist: {template_file}")
             return False
         
-        # Validate input files are valid Excel files
-        try:
-            # Try to read at least one row from each file to validate format
-            pd.read_excel(adjusted_file, nrows=1)
-            pd.read_excel(template_file, nrows=1)
-        except Exception as e:
-            messagebox.showerror("Error", f"Invalid Excel file format: {str(e)}")
-            return False
+        # Validate input files are Excel workbooks from their signature only; this
+        # runs on the Tk thread, so parse errors are left to the background read
+        for label, path in (("Adjusted Rates", adjusted_file), ("Template", template_file)):
+            try:
+                with open(path, 'rb') as f:
+                    signature = f.read(len(XLS_SIGNATURE))
+            except OSError as e:
+                messagebox.showerror("Error", f"Cannot open {label} file: {str(e)}")
+                return False
+            if not signature.startswith((XLSX_SIGNATURE, XLS_SIGNATURE)):
+                messagebox.showerror("Error", f"Invalid Excel file format: {label} file is not an Excel workbook")
+                return False
         
         # Check if output directory exists
         output_dir = os.path.dirname(output_file)
@@ -708,6 +881,11 @@ class Application(tk.Tk):
     
     def process_files(self):
         """Process the files with current settings."""
+        if self.background_action is not None:
+            messagebox.showinfo("Busy", f"{self.background_action[0]} is still running. "
+                                        f"Cancel it or wait for it to finish.")
+            return
+        
         if not self.validate_inputs():
             return
         
@@ -728,6 +906,7 @@ class Application(tk.Tk):
     
     def process_files_worker(self):
         """Worker thread for file processing."""
+        import pandas as pd
         try:
             adjusted_file = self.adjusted_rates_var.get()
             template_file = self.template_var.get()
@@ -735,16 +914,31 @@ class Application(tk.Tk):
             adjusted_sheet = self.adjusted_sheet_var.get()
             template_sheet = self.template_sheet_var.get()
             
+            # Stage timings for this run, completed in continue_processing
+            if self.run_metrics is not None:
+                # Previous run stopped at the mapping dialog
+                self.run_metrics.finish("cancelled")
+            self.run_metrics = RunMetrics(source_file=adjusted_file)
+            stage = self.run_metrics.start_stage("analyze")
+            
             # Update progress - Step 1: Loading files
             self.update_status("Loading and analyzing template file...", 5)
             
-            # First analyze the template file to determine required fields
-            template_structure = self.file_analyzer.analyze_file_structure(
-                template_file, template_sheet)
-            
-            # Extract template columns
-            template_df = pd.read_excel(template_file, sheet_name=template_sheet)
-            template_columns = template_df.columns.tolist()
+            # Files parsed in the background since they were selected are used as is
+            from prefetch import ADJUSTED, TEMPLATE
+            prefetched_template = self.prefetcher.get(TEMPLATE, template_file, template_sheet)
+            prefetched_adjusted = self.prefetcher.get(ADJUSTED, adjusted_file, adjusted_sheet)
+            for prefetched in (prefetched_template, prefetched_adjusted):
+                if prefetched is not None:
+                    logging.info(f"Using prefetched {prefetched.kind} workbook {prefetched.file_path}")
+                    self.run_metrics.stages.extend(prefetched.stages)
+            
+            if prefetched_template is not None:
+                template_columns = prefetched_template.template_columns
+            else:
+                # Only the header is read; the conversion below reuses it from the cache
+                from template_spec import TemplateSpec
+                template_columns = list(TemplateSpec.from_file(template_file, template_sheet).columns)
             
             # Step 2: Building required fields
             self.update_status("Analyzing template structure...", 10)
@@ -759,8 +953,12 @@ class Application(tk.Tk):
             self.update_status("Loading adjusted rates file...", 15)
             
             # Analyze adjusted rates file
-            adjusted_structure = self.file_analyzer.analyze_file_structure(
-                adjusted_file, adjusted_sheet)
+            if prefetched_adjusted is not None:
+                # Copied because enhanced detection adds a flag to it below
+                adjusted_structure = dict(prefetched_adjusted.structure)
+            else:
+                adjusted_structure = self.file_analyzer.analyze_file_structure(
+                    adjusted_file, adjusted_sheet)
             
             # Get column names
             if isinstance(adjusted_structure, dict) and 'columns' in adjusted_structure:
@@ -770,6 +968,9 @@ class Application(tk.Tk):
                 adjusted_df = pd.read_excel(adjusted_file, sheet_name=adjusted_sheet)
                 source_columns = adjusted_df.columns.tolist()
             
+            self.run_metrics.end_stage(stage)
+            stage = self.run_metrics.start_stage("map")
+            
             # Step 4: Generating mapping - more granular progress
             self.update_status(f"Generating column mapping for {len(source_columns)} columns...", 20)
             
@@ -790,6 +991,7 @@ class Application(tk.Tk):
             # Add special handling for Deductible and RateCost columns
             # We need these for pivoting but they're not part of the required mapping fields
             self.detect_pivot_columns(source_columns, mapping, adjusted_structure)
+            self.run_metrics.end_stage(stage)
             
             # Step 6: Check mapping confidence
             self.update_status("Validating mapping confidence...", 30)
@@ -839,22 +1041,25 @@ class Application(tk.Tk):
     def continue_processing(self, adjusted_file, template_file, output_file, 
                            adjusted_sheet, template_sheet, mapping):
         """Continue processing after mapping is confirmed."""
+        from conversion import convert, ConversionOptions, TemplateSpec
+        metrics = self.run_metrics or RunMetrics(source_file=adjusted_file)
+        self.run_metrics = None
+        profiler = RunProfiler(label=os.path.splitext(os.path.basename(adjusted_file))[0])
+        profiler.start()
         try:
             # Step 7: Preparing for data processing
             self.update_status("Preparing for data transformation...", 45)
             
             # Make sure data processor has the default deductible value
             default_deductible = self.config_mgr.get_setting("default_deductible", "100")
-            self.data_processor.default_deductible = default_deductible
             logging.info(f"Using default deductible for processing: {default_deductible}")
             
             # Ensure Deductible and RateCost columns are in the mapping
             if "Deductible" not in mapping or "RateCost" not in mapping:
                 self.update_status("Detecting required pivot columns...", 50)
                 # Try to detect them one more time from the source data
-                adjusted_df = self.data_processor.load_excel_file(adjusted_file, adjusted_sheet)
                 adjusted_structure = self.file_analyzer.analyze_file_structure(adjusted_file, adjusted_sheet)
-                self.detect_pivot_columns(adjusted_df.columns.tolist(), mapping, adjusted_structure)
+                self.detect_pivot_columns(list(adjusted_structure['columns'].keys()), mapping, adjusted_structure)
                 
                 # Log the results of pivot column detection
                 if "Deductible" in mapping and "RateCost" in mapping:
@@ -866,13 +1071,32 @@ class Application(tk.Tk):
             
             # Step 8: Loading data with progress updates
             self.update_status("Loading source data...", 55)
-            adjusted_df = self.data_processor.load_excel_file(adjusted_file, adjusted_sheet)
+            from prefetch import ADJUSTED, TEMPLATE
+            prefetched_adjusted = self.prefetcher.get(ADJUSTED, adjusted_file, adjusted_sheet)
+            prefetched_template = self.prefetcher.get(TEMPLATE, template_file, template_sheet)
+            if prefetched_adjusted is not None:
+                out_of_core = bool(prefetched_adjusted.structure.get('out_of_core'))
+            else:
+                from out_of_core import sheet_needs_streaming
+                out_of_core = sheet_needs_streaming(adjusted_file, adjusted_sheet)[0]
+            stage = metrics.start_stage("load")
+            if out_of_core:
+                # Too large to load; convert streams it through spill files instead
+                adjusted_df = None
+            elif prefetched_adjusted is not None and prefetched_adjusted.data is not None:
+                adjusted_df = prefetched_adjusted.data
+            else:
+                adjusted_df = self.data_processor.load_excel_file(adjusted_file, adjusted_sheet)
             
             self.update_status("Loading template data...", 58)
-            template_df = self.data_processor.load_excel_file(template_file, template_sheet)
+            if prefetched_template is not None:
+                template_spec = prefetched_template.template_spec
+            else:
+                template_spec = TemplateSpec.from_file(template_file, template_sheet)
+            metrics.end_stage(stage, rows_out=None if adjusted_df is None else len(adjusted_df))
             
             # Check if we have data
-            if adjusted_df.empty:
+            if adjusted_df is not None and adjusted_df.empty:
                 self.update_status("Error: Adjusted rates file contains no data", 0)
                 self.msg_queue.put(("show_error", {
                     "title": "Empty Data",
@@ -882,15 +1106,20 @@ class Application(tk.Tk):
             
             # Log information about mapping
             logging.info(f"Using mapping: {mapping}")
-            logging.info(f"Adjusted dataframe columns: {adjusted_df.columns.tolist()}")
-            logging.info(f"Adjusted dataframe shape: {adjusted_df.shape}")
+            if adjusted_df is not None:
+                logging.info(f"Adjusted dataframe columns: {adjusted_df.columns.tolist()}")
+                logging.info(f"Adjusted dataframe shape: {adjusted_df.shape}")
             
             # Step 9: Transforming data with detailed progress
-            row_count = len(adjusted_df)
-            self.update_status(f"Transforming data ({row_count} rows)...", 60)
+            if adjusted_df is None:
+                self.update_status("Transforming data out of core...", 60)
+            else:
+                self.update_status(f"Transforming data ({len(adjusted_df)} rows)...", 60)
             
             # Before calling transform_data, add detailed logging for Deductible and RateCost
-            if "Deductible" in mapping and "RateCost" in mapping:
+            if adjusted_df is None:
+                logging.info("Pivot columns are checked while streaming the adjusted rates sheet")
+            elif "Deductible" in mapping and "RateCost" in mapping:
                 logging.info(f"Pivot columns found in mapping before transformation:")
                 logging.info(f"  Deductible column: {mapping['Deductible']}")
                 logging.info(f"  RateCost column: {mapping['RateCost']}")
@@ -914,36 +1143,25 @@ class Application(tk.Tk):
             # Step 10: Performing data transformation
             self.update_status("Applying column mapping and transforming data...", 70)
             
-            # Transform data directly with adjusted dataframe and mapping
-            transformed_df = self.data_processor.transform_data(adjusted_df, mapping)
-            
-            # Check if transformation returned data
-            if transformed_df.empty:
-                self.update_status("Error: No data after transformation", 0)
+            # Transform and integrate with the stateless conversion API
+            try:
+                result = convert(adjusted_file if out_of_core else adjusted_df, template_spec, mapping,
+                                 ConversionOptions(default_deductible=default_deductible,
+                                                   adjusted_sheet=adjusted_sheet,
+                                                   out_of_core=out_of_core),
+                                 metrics=metrics)
+            except ValueError as e:
+                self.update_status(f"Error: {str(e)}", 0)
                 self.msg_queue.put(("show_error", {
                     "title": "Transformation Error",
-                    "message": "The data transformation process resulted in no data. Check the logs for details."
+                    "message": f"{str(e)} Check the logs for details."
                 }))
                 return
             
-            logging.info(f"Transformed data shape: {transformed_df.shape}")
-            output_row_count = len(transformed_df)
-            
-            # Step 11: Integrating with template
-            self.update_status(f"Integrating with template ({output_row_count} transformed rows)...", 80)
-            
-            # Integrate with template
-            final_df = self.data_processor.integrate_with_template(transformed_df, template_df)
-            
-            # Check if final data is empty
-            if final_df.empty and not transformed_df.empty:
-                self.update_status("Warning: Template integration produced no data, using transformed data", 85)
-                self.msg_queue.put(("show_error", {
-                    "title": "Integration Warning",
-                    "message": "The template integration process resulted in no data. Using transformed data instead."
-                }))
-                # Use transformed data if integration failed
-                final_df = transformed_df
+            final_df = result.data
+            row_count = result.rows_in
+            mapping.update(result.mapping)
+            self.update_status(f"Integrated with template ({result.rows_out} rows)...", 85)
             
             final_row_count = len(final_df)
             logging.info(f"Final data shape: {final_df.shape} with {final_row_count} rows")
@@ -958,7 +1176,11 @@ class Application(tk.Tk):
             
             try:
                 # Use the new save_excel_file method from DataProcessor
-                self.data_processor.save_excel_file(final_df, output_file, sheet_name=template_sheet)
+                with metrics.stage("save", rows_in=final_row_count):
+                    self.data_processor.save_excel_file(final_df, output_file, sheet_name=template_sheet)
+                # Lets quoting tools look up rates without reading the workbook (when enabled)
+                from rate_index import write_index_for
+                write_index_for(final_df, output_file)
                 success = True
             except Exception as e:
                 error_msg = f"Error saving file: {str(e)}"
@@ -970,6 +1192,9 @@ class Application(tk.Tk):
                 }))
                 return
             
+            metrics.finish()
+            logging.info(metrics.format_summary())
+            
             # Finish processing with success message
             self.update_status(f"Processing complete! Created file with {final_row_count} rows", 100)
             
@@ -987,12 +1212,21 @@ class Application(tk.Tk):
                 
         except Exception as e:
             logging.error(f"Error in continue_processing: {str(e)}", exc_info=True)
+            metrics.finish("failed", e)
             self.update_status(f"Error: {str(e)}", 0)
             self.msg_queue.put(("show_error", {
                 "title": "Processing Error",
                 "message": f"Error during processing: {str(e)}"
             }))
         finally:
+            profiler.close()
+            
+            # Record the run metrics next to the logs
+            if metrics.status == "running":
+                metrics.finish("failed")
+            metrics.write()
+            self.last_run_metrics = metrics
+            
             # Re-enable controls
             self.msg_queue.put(("enable_controls", {}))
     
@@ -1001,68 +1235,92 @@ class Application(tk.Tk):
         if not self.validate_inputs():
             return
         
-        adjusted_file = self.adjusted_rates_var.get()
-        adjusted_sheet = self.adjusted_sheet_var.get()
-        template_file = self.template_var.get()
-        template_sheet = self.template_sheet_var.get()
+        params = {
+            "adjusted_file": self.adjusted_rates_var.get(),
+            "adjusted_sheet": self.adjusted_sheet_var.get(),
+            "template_file": self.template_var.get(),
+            "template_sheet": self.template_sheet_var.get(),
+            "use_saved": self.use_saved_var.get(),
+            "auto_detect": self.auto_detect_var.get()
+        }
+        self.run_background_action("Preview mapping", self._preview_mapping_worker, params,
+                                   self._show_preview_mapping)
+    
+    def _preview_mapping_worker(self, params, cancel_event):
+        """
+        Read both files and generate the suggested mapping (runs off the Tk thread).
         
-        try:
-            # First load the template file to extract columns
-            logging.info(f"Loading template file: {template_file}, sheet: {template_sheet}")
-            template_df = pd.read_excel(template_file, sheet_name=template_sheet)
-            
-            # Get all columns from template
-            template_columns = template_df.columns.tolist()
-            logging.info(f"Found {len(template_columns)} columns in template: {template_columns}")
-            
-            # Build dynamic required fields from template columns
-            required_fields = self.extract_required_fields_from_template(template_columns)
-            logging.info(f"Extracted required fields: {required_fields}")
-            
-            # Update mapping system with dynamic required fields
-            self.mapping_system.set_required_fields(required_fields)
-            
-            # Load the adjusted rates file
-            logging.info(f"Loading adjusted rates file: {adjusted_file}, sheet: {adjusted_sheet}")
-            adjusted_df = pd.read_excel(adjusted_file, sheet_name=adjusted_sheet)
-            source_columns = adjusted_df.columns.tolist()
-            logging.info(f"Found {len(source_columns)} columns in adjusted rates file")
-            
-            # Analyze the source file for structure
-            adjusted_structure = self.file_analyzer.analyze_file_structure(
-                adjusted_file, adjusted_sheet)
-            
-            # Generate mapping suggestions 
-            use_saved = self.use_saved_var.get()
-            mapping = self.mapping_system.generate_mapping(source_columns, use_saved_mappings=use_saved)
-            logging.info(f"Generated mapping with {len(mapping)} fields mapped")
-            
-            # Add special handling for Deductible and RateCost columns
-            # These should be identified automatically but not shown in the mapping dialog
-            self.detect_pivot_columns(source_columns, mapping, adjusted_structure)
-            
-            # Add a note to explain the special handling
-            if "Deductible" in mapping and "RateCost" in mapping:
-                deduct_col = mapping["Deductible"]
-                rate_col = mapping["RateCost"]
-                special_note = (f"Note: The columns '{deduct_col}' and '{rate_col}' will be used to populate "
-                               f"the deductible columns (Deduct0, Deduct50, etc.) in the template. "
-                               f"They are handled automatically and don't need to be mapped.")
-                logging.info(special_note)
-                
-                # Show this explanation to the user before showing mapping dialog
-                messagebox.showinfo("Special Column Handling", special_note)
-            
-            # Show mapping dialog with dynamic fields
-            self.show_mapping_dialog(
-                source_columns=source_columns,
-                mapping=mapping,
-                required_fields=required_fields
-            )
+        Args:
+            params: Selections captured on the Tk thread
+            cancel_event: Set when the user cancels
             
-        except Exception as e:
-            logging.error(f"Error previewing mapping: {str(e)}", exc_info=True)
-            messagebox.showerror("Error", f"An error occurred while previewing mapping: {str(e)}")
+        Returns:
+            dict: Source columns, mapping and required fields for the mapping dialog
+        """
+        from prefetch import ADJUSTED, TEMPLATE
+        
+        # First load the template file to extract columns
+        self.update_status("Loading template file...", 10)
+        template = self._get_prefetched(TEMPLATE, params["template_file"], params["template_sheet"],
+                                        cancel_event)
+        template_columns = template.template_columns
+        logging.info(f"Found {len(template_columns)} columns in template: {template_columns}")
+        
+        # Build dynamic required fields from template columns
+        required_fields = self.extract_required_fields_from_template(template_columns)
+        logging.info(f"Extracted required fields: {required_fields}")
+        
+        # Update mapping system with dynamic required fields
+        self.mapping_system.set_required_fields(required_fields)
+        
+        # Analyze the adjusted rates file for structure
+        self.update_status("Analyzing adjusted rates file...", 30)
+        adjusted = self._get_prefetched(ADJUSTED, params["adjusted_file"], params["adjusted_sheet"],
+                                        cancel_event, auto_detect=params["auto_detect"], structure_only=True)
+        adjusted_structure = adjusted.structure
+        source_columns = list(adjusted_structure['columns'].keys())
+        logging.info(f"Found {len(source_columns)} columns in adjusted rates file")
+        self._check_cancelled(cancel_event)
+        
+        # Generate mapping suggestions 
+        self.update_status("Generating mapping suggestions...", 70)
+        mapping = self.mapping_system.generate_mapping(source_columns, use_saved_mappings=params["use_saved"])
+        logging.info(f"Generated mapping with {len(mapping)} fields mapped")
+        
+        # Add special handling for Deductible and RateCost columns
+        # These should be identified automatically but not shown in the mapping dialog
+        self.detect_pivot_columns(source_columns, mapping, adjusted_structure)
+        self.update_status("Mapping preview ready", 100)
+        
+        return {"source_columns": source_columns, "mapping": mapping, "required_fields": required_fields}
+    
+    def _show_preview_mapping(self, result):
+        """
+        Show the mapping dialog for a finished preview (Tk thread).
+        
+        Args:
+            result: Return value of _preview_mapping_worker
+        """
+        mapping = result["mapping"]
+        
+        # Add a note to explain the special handling
+        if "Deductible" in mapping and "RateCost" in mapping:
+            deduct_col = mapping["Deductible"]
+            rate_col = mapping["RateCost"]
+            special_note = (f"Note: The columns '{deduct_col}' and '{rate_col}' will be used to populate "
+                           f"the deductible columns (Deduct0, Deduct50, etc.) in the template. "
+                           f"They are handled automatically and don't need to be mapped.")
+            logging.info(special_note)
+            
+            # Show this explanation to the user before showing mapping dialog
+            messagebox.showinfo("Special Column Handling", special_note)
+        
+        # Show mapping dialog with dynamic fields
+        self.show_mapping_dialog(
+            source_columns=result["source_columns"],
+            mapping=mapping,
+            required_fields=result["required_fields"]
+        )
 
     def extract_required_fields_from_template(self, template_columns):
         """
@@ -1074,45 +1332,7 @@ class Application(tk.Tk):
         Returns:
             list: Required fields for mapping
         """
-        required_fields = []
-        deductible_columns = []
-        
-        # Ensure template_columns is a list
-        if not isinstance(template_columns, list):
-            template_columns = list(template_columns)
-        
-        logging.info(f"Extracting required fields from {len(template_columns)} template columns")
-        
-        # Define essential columns that should always be included if present
-        essential_columns = ['CompanyCode', 'Term', 'Miles', 'FromMiles', 'ToMiles', 
-                           'Coverage', 'State', 'Class', 'PlanDeduct']
-        
-        # Process each column from template
-        for col in template_columns:
-            col_str = str(col).lower()
-            
-            # Special handling for deductible columns (Deduct0, Deduct50, etc.)
-            if col_str.startswith('deduct'):
-                deductible_columns.append(col)
-                continue
-            
-            # Skip PlanDeduct as it's handled separately
-            if col_str == 'plandeduct':
-                continue
-            
-            # Add all other template columns as required fields
-            required_fields.append(col)
-        
-        # Ensure essential columns are included in the required fields
-        for essential_col in essential_columns:
-            if essential_col not in required_fields and essential_col.lower() not in [f.lower() for f in required_fields]:
-                required_fields.append(essential_col)
-        
-        # Log the fields we extracted
-        logging.info(f"Extracted {len(required_fields)} required fields from template")
-        logging.info(f"Found {len(deductible_columns)} deductible columns that will be auto-populated")
-        
-        return required_fields
+        return self.mapping_system.extract_required_fields(template_columns)
 
     def show_mapping_dialog(self, source_columns, mapping, required_fields=None):
         """
@@ -1132,7 +1352,7 @@ class Application(tk.Tk):
             # Validate source_columns is a list
             if not isinstance(source_columns, list):
                 logging.warning(f"source_columns is not a list, converting from {type(source_columns)}")
-                if isinstance(source_columns, (pd.Index, pd.Series)):
+                if hasattr(source_columns, 'tolist'):
                     source_columns = source_columns.tolist()
                 else:
                     source_columns = list(source_columns) if hasattr(source_columns, '__iter__') else []
@@ -1150,7 +1370,7 @@ class Application(tk.Tk):
             # Ensure required_fields is a list
             if not isinstance(required_fields, list):
                 logging.warning(f"required_fields is not a list, converting from {type(required_fields)}")
-                if isinstance(required_fields, (pd.Index, pd.Series)):
+                if hasattr(required_fields, 'tolist'):
                     required_fields = required_fields.tolist()
                 else:
                     required_fields = list(required_fields) if hasattr(required_fields, '__iter__') else []
@@ -1159,6 +1379,7 @@ class Application(tk.Tk):
             logging.info(f"Source columns (first 5): {source_columns[:5] if len(source_columns) > 5 else source_columns}")
             
             # Create dialog with validated parameters
+            from mapping_system import MappingDialog
             dialog = MappingDialog(
                 self, 
                 source_columns=source_columns,
@@ -1176,7 +1397,6 @@ class Application(tk.Tk):
                 # Get default deductible from the UI field
                 default_deductible = self.default_deduct_var.get()
                 self.config_mgr.set_setting("default_deductible", default_deductible)
-                self.data_processor.default_deductible = default_deductible
                 logging.info(f"Using default deductible from UI: {default_deductible}")
                 
                 # Save mapping if requested
@@ -1214,6 +1434,47 @@ class Application(tk.Tk):
         # TO DO: Implement advanced options dialog
         messagebox.showinfo("Not Implemented", "Advanced Options will be implemented in a future version.")
     
+    def show_diagnostics(self):
+        """Show per-stage timings and throughput of recent runs."""
+        dialog = tk.Toplevel(self)
+        dialog.title("Diagnostics")
+        dialog.geometry("720x480")
+        dialog.configure(background=self.DARK_BG)
+        dialog.transient(self)
+        
+        text = tk.Text(dialog, bg=self.DARKER_BG, fg='#FFFFFF', font=("Consolas", 9),
+                       relief='flat', wrap=tk.NONE)
+        text.pack(fill=tk.BOTH, expand=True, padx=10, pady=(10, 5))
+        
+        def refresh():
+            text.configure(state=tk.NORMAL)
+            text.delete("1.0", tk.END)
+            if self.last_run_metrics is not None:
+                text.insert(tk.END, "Last run\n")
+                text.insert(tk.END, self.last_run_metrics.format_summary() + "\n\n")
+            
+            runs = read_recent_runs(limit=10)
+            if not runs:
+                text.insert(tk.END, "No runs recorded yet.\n")
+            else:
+                text.insert(tk.END, "Recent runs\n")
+                for run in runs:
+                    source = os.path.basename(run.get("source_file") or "")
+                    stages = ", ".join(f"{stage['stage']} {stage['wall_seconds']:.2f}s"
+                                       for stage in run.get("stages", []))
+                    text.insert(tk.END, f"{run['started_at']}  {run['status']:<7}{run['total_seconds']:>8.2f}s  "
+                                        f"{source}\n    {stages}\n")
+            text.configure(state=tk.DISABLED)
+        
+        button_frame = ttk.Frame(dialog, style="TFrame")
+        button_frame.pack(fill=tk.X, padx=10, pady=(0, 10))
+        tk.Button(button_frame, text="Close", command=dialog.destroy, bg=self.BUTTON_BG, fg='#FFFFFF',
+                  font=("Segoe UI", 9, "bold"), relief='flat', width=10).pack(side=tk.RIGHT)
+        tk.Button(button_frame, text="Refresh", command=refresh, bg=self.BUTTON_BG, fg='#FFFFFF',
+                  font=("Segoe UI", 9, "bold"), relief='flat', width=10).pack(side=tk.RIGHT, padx=5)
+        
+        refresh()
+    
     def update_status(self, message, progress):
         """
         Update status message and progress bar.
@@ -1259,6 +1520,23 @@ class Application(tk.Tk):
                 elif action == "open_file":
                     self.open_file(params["file_path"])
                     
+                elif action == "background_done":
+                    params["callback"](params["result"])
+                    
+                elif action == "background_finished":
+                    self.background_action = None
+                    self.cancel_btn.config(state=tk.DISABLED)
+                    
+                elif action == "prefetch_sheets":
+                    self.apply_prefetched_sheets(params["kind"], params["file_path"],
+                                                 params["sheets"], params["sheet"])
+                    
+                elif action == "prefetch_error":
+                    selected = self.adjusted_rates_var.get() if params["kind"] == "adjusted" else self.template_var.get()
+                    if selected == params["file_path"]:
+                        logging.error(f"Error reading sheets: {params['message']}")
+                        messagebox.showerror("Error", f"Error reading sheets: {params['message']}")
+                    
                 elif action == "show_mapping_dialog":
                     try:
                         # Initialize with defaults
@@ -1289,7 +1567,7 @@ class Application(tk.Tk):
                         # Ensure source_columns is a list
                         if not isinstance(source_columns, list):
                             logging.info(f"Converting source_columns from {type(source_columns)} to list")
-                            if isinstance(source_columns, (pd.Index, pd.Series)):
+                            if hasattr(source_columns, 'tolist'):
                                 source_columns = source_columns.tolist()
                             else:
                                 source_columns = list(source_columns) if hasattr(source_columns, '__iter__') else []
@@ -1362,140 +1640,241 @@ class Application(tk.Tk):
         self.save_settings()
         
         logging.info("Application exiting")
+        if self._prefetcher is not None:
+            self._prefetcher.shutdown()
+        shutdown_logging()
         self.destroy()
 
     def analyze_files(self):
         """Analyze the selected files for format detection without processing."""
         adjusted_file = self.adjusted_rates_var.get()
-        adjusted_sheet = self.adjusted_sheet_var.get()
-        template_file = self.template_var.get()
-        template_sheet = self.template_sheet_var.get()
         
         if not adjusted_file or not os.path.exists(adjusted_file):
             messagebox.showerror("Error", "Please select a valid Adjusted Rates file.")
             return
         
-        try:
-            # Update status
-            self.status_var.set("Analyzing files...")
-            self.progress_var.set(10)
-            
-            # Analyze adjusted rates file
-            adjusted_structure = self.file_analyzer.analyze_file_structure(
-                adjusted_file, adjusted_sheet)
-            
-            # Extract key information from the analysis
-            col_count = adjusted_structure.get('column_count', 0)
-            row_count = adjusted_structure.get('row_count', 0)
-            patterns = adjusted_structure.get('patterns', {})
-            
-            # Update format detection status
-            format_msg = f"Adjusted Rates: {col_count} columns, {row_count} rows."
-            
-            # Add info about deductible pattern if detected
-            if patterns.get('has_deductible_data', False):
-                deduct_pattern = patterns.get('pattern', 'unknown')
-                deduct_values = patterns.get('values', [])
-                format_msg += f" Deductibles: {deduct_pattern} ({', '.join(map(str, deduct_values))})"
-            
-            self.format_detection_var.set(format_msg)
-            
-            # If template file is provided, analyze it too
-            if template_file and os.path.exists(template_file):
-                self.progress_var.set(30)
-                template_structure = self.file_analyzer.analyze_file_structure(
-                    template_file, template_sheet)
-                
-                template_col_count = template_structure.get('column_count', 0)
-                template_row_count = template_structure.get('row_count', 0)
-                
-                # Update status with template info
-                self.status_var.set(f"Analyzed both files. Template: {template_col_count} columns, {template_row_count} rows.")
-            
-            # Generate mapping
-            self.progress_var.set(50)
-            use_saved = self.use_saved_var.get()
-            use_enhanced = self.enhanced_format_var.get()
-            
-            # If using enhanced detection, modify the structure to use additional heuristics
-            if use_enhanced:
-                adjusted_structure['use_enhanced_detection'] = True
+        params = {
+            "adjusted_file": adjusted_file,
+            "adjusted_sheet": self.adjusted_sheet_var.get(),
+            "template_file": self.template_var.get(),
+            "template_sheet": self.template_sheet_var.get(),
+            "use_saved": self.use_saved_var.get(),
+            "use_enhanced": self.enhanced_format_var.get(),
+            "auto_detect": self.auto_detect_var.get()
+        }
+        self.run_background_action("File analysis", self._analyze_files_worker, params,
+                                   self._show_analysis_results)
+    
+    def _analyze_files_worker(self, params, cancel_event):
+        """
+        Analyze both files and generate a mapping (runs off the Tk thread).
+        
+        Args:
+            params: Selections captured on the Tk thread
+            cancel_event: Set when the user cancels
             
-            # Get column names as a list
-            if isinstance(adjusted_structure, dict) and 'columns' in adjusted_structure:
-                source_columns = list(adjusted_structure['columns'].keys())
+        Returns:
+            dict: Analysis summary for _show_analysis_results
+        """
+        from prefetch import ADJUSTED, TEMPLATE
+        
+        self.update_status("Analyzing files...", 10)
+        
+        # Analyze adjusted rates file
+        adjusted = self._get_prefetched(ADJUSTED, params["adjusted_file"], params["adjusted_sheet"],
+                                        cancel_event, auto_detect=params["auto_detect"], structure_only=True)
+        # Copied because enhanced detection adds a flag to it below
+        adjusted_structure = dict(adjusted.structure)
+        
+        # Extract key information from the analysis
+        col_count = adjusted_structure.get('column_count', 0)
+        row_count = adjusted_structure.get('row_count', 0)
+        patterns = adjusted_structure.get('patterns', {})
+        
+        # Update format detection status
+        format_msg = f"Adjusted Rates: {col_count} columns, {row_count} rows."
+        
+        # Add info about deductible pattern if detected
+        if patterns.get('has_deductible_data', False):
+            deduct_pattern = patterns.get('pattern', 'unknown')
+            deduct_values = patterns.get('values', [])
+            format_msg += f" Deductibles: {deduct_pattern} ({', '.join(map(str, deduct_values))})"
+        
+        # If template file is provided, analyze it too
+        template_msg = None
+        template_file = params["template_file"]
+        if template_file and os.path.exists(template_file):
+            self.update_status("Analyzing template file...", 30)
+            template = self._get_prefetched(TEMPLATE, template_file, params["template_sheet"],
+                                            cancel_event, structure_only=True)
+            template_structure = template.structure
+            
+            template_col_count = template_structure.get('column_count', 0)
+            template_row_count = template_structure.get('row_count', 0)
+            template_msg = f"Analyzed both files. Template: {template_col_count} columns, {template_row_count} rows."
+        self._check_cancelled(cancel_event)
+        
+        # Generate mapping
+        self.update_status("Generating mapping...", 50)
+        
+        # If using enhanced detection, modify the structure to use additional heuristics
+        if params["use_enhanced"]:
+            adjusted_structure['use_enhanced_detection'] = True
+        
+        source_columns = list(adjusted_structure['columns'].keys())
+        mapping = self.mapping_system.generate_mapping(
+            source_columns, use_saved_mappings=params["use_saved"])
+        self.update_status("File analysis complete", 100)
+        
+        return {
+            "format_msg": format_msg,
+            "template_msg": template_msg,
+            "col_count": col_count,
+            "row_count": row_count,
+            "source_columns": source_columns,
+            "mapping": mapping,
+            "mapping_confidence": dict(self.mapping_system.mapping_confidence),
+            "required_fields": list(self.mapping_system.required_fields)
+        }
+    
+    def _show_analysis_results(self, result):
+        """
+        Show the results of a finished file analysis (Tk thread).
+        
+        Args:
+            result: Return value of _analyze_files_worker
+        """
+        self.format_detection_var.set(result["format_msg"])
+        if result["template_msg"]:
+            self.status_var.set(result["template_msg"])
+        
+        # Update mapping confidence indicator
+        confidence_values = list(result["mapping_confidence"].values())
+        if confidence_values:
+            # Calculate average confidence
+            avg_confidence = sum(confidence_values) / len(confidence_values)
+            self.mapping_confidence_var.set(int(avg_confidence))
+            self.mapping_confidence_label.config(text=f"{int(avg_confidence)}%")
+            
+            # Color code based on confidence
+            if avg_confidence < 60:
+                self.mapping_confidence_label.config(foreground="red")
+            elif avg_confidence < 80:
+                self.mapping_confidence_label.config(foreground="orange")
             else:
-                # Read the file directly to get column names
-                adjusted_df = pd.read_excel(adjusted_file, sheet_name=adjusted_sheet)
-                source_columns = adjusted_df.columns.tolist()
-            
-            mapping = self.mapping_system.generate_mapping(
-                source_columns, use_saved_mappings=use_saved)
-            
-            # Update mapping confidence indicator
-            if self.mapping_system.mapping_confidence:
-                # Calculate average confidence
-                confidence_values = list(self.mapping_system.mapping_confidence.values())
-                if confidence_values:
-                    avg_confidence = sum(confidence_values) / len(confidence_values)
-                    self.mapping_confidence_var.set(int(avg_confidence))
-                    self.mapping_confidence_label.config(text=f"{int(avg_confidence)}%")
-                    
-                    # Color code based on confidence
-                    if avg_confidence < 60:
-                        self.mapping_confidence_label.config(foreground="red")
-                    elif avg_confidence < 80:
-                        self.mapping_confidence_label.config(foreground="orange")
-                    else:
-                        self.mapping_confidence_label.config(foreground="green")
-            
-            # Show a summary
-            self.progress_var.set(100)
-            
-            # Count mapped fields
-            mapped_count = len(mapping)
-            required_count = len(self.mapping_system.required_fields)
-            
-            # Show mapping analysis dialog
-            message = f"File Analysis Complete\n\n"
-            message += f"Adjusted Rates: {col_count} columns, {row_count} rows\n"
-            message += f"Mapping: {mapped_count} of {required_count} required fields mapped\n\n"
-            
-            # Add warning for low confidence
-            low_confidence = any(conf < 70 for conf in self.mapping_system.mapping_confidence.values())
-            if low_confidence:
-                message += "⚠️ Some fields have low mapping confidence.\n"
-                message += "You may need to manually map columns during processing.\n\n"
-            
-            # Add message about proceeding
-            message += "Do you want to see the current mapping details?"
-            
-            if messagebox.askyesno("Analysis Complete", message):
-                # Get column names as a list for the dialog
-                if isinstance(adjusted_structure, dict) and 'columns' in adjusted_structure:
-                    # Extract column names from structure
-                    source_columns = list(adjusted_structure['columns'].keys())
-                    logging.info(f"Extracted {len(source_columns)} columns from structure for mapping dialog")
-                else:
-                    # Read the file directly to get column names if needed
-                    logging.info(f"Reading source columns directly from file for mapping dialog")
-                    adjusted_df = pd.read_excel(adjusted_file, sheet_name=adjusted_sheet)
-                    source_columns = adjusted_df.columns.tolist()
-                
-                # Show mapping dialog with correct parameters
-                self.show_mapping_dialog(
-                    source_columns=source_columns,
-                    mapping=mapping,
-                    required_fields=self.mapping_system.required_fields
-                )
-            
-            self.status_var.set("File analysis complete")
+                self.mapping_confidence_label.config(foreground="green")
+        
+        # Count mapped fields
+        mapped_count = len(result["mapping"])
+        required_count = len(result["required_fields"])
+        
+        # Show mapping analysis dialog
+        message = f"File Analysis Complete\n\n"
+        message += f"Adjusted Rates: {result['col_count']} columns, {result['row_count']} rows\n"
+        message += f"Mapping: {mapped_count} of {required_count} required fields mapped\n\n"
+        
+        # Add warning for low confidence
+        low_confidence = any(conf < 70 for conf in confidence_values)
+        if low_confidence:
+            message += "⚠️ Some fields have low mapping confidence.\n"
+            message += "You may need to manually map columns during processing.\n\n"
+        
+        # Add message about proceeding
+        message += "Do you want to see the current mapping details?"
+        
+        if messagebox.askyesno("Analysis Complete", message):
+            # Show mapping dialog with correct parameters
+            self.show_mapping_dialog(
+                source_columns=result["source_columns"],
+                mapping=result["mapping"],
+                required_fields=result["required_fields"]
+            )
+        
+        self.status_var.set("File analysis complete")
+    
+    def run_background_action(self, name, worker, params, on_done):
+        """
+        Run a slow action off the Tk thread with progress updates and cancellation.
+        
+        The worker reports progress with update_status and should call
+        _check_cancelled between steps. Its return value is passed to on_done
+        on the Tk thread unless the action was cancelled or failed.
+        
+        Args:
+            name: Action name for status messages
+            worker: Callable(params, cancel_event) returning the action's result
+            params: Values captured from the Tk variables
+            on_done: Callable(result) run on the Tk thread
+        """
+        if self.background_action is not None:
+            messagebox.showinfo("Busy", f"{self.background_action[0]} is still running. "
+                                        f"Cancel it or wait for it to finish.")
+            return
+        
+        cancel_event = threading.Event()
+        self.background_action = (name, cancel_event)
+        self.cancel_btn.config(state=tk.NORMAL)
+        self.update_status(f"{name}...", 5)
+        
+        def run():
+            try:
+                result = worker(params, cancel_event)
+                self._check_cancelled(cancel_event)
+                self.msg_queue.put(("background_done", {"callback": on_done, "result": result}))
+            except ActionCancelled:
+                logging.info(f"{name} cancelled")
+                self.update_status(f"{name} cancelled", 0)
+            except Exception as e:
+                logging.error(f"Error in {name.lower()}: {str(e)}", exc_info=True)
+                self.update_status(f"Error: {str(e)}", 0)
+                self.msg_queue.put(("show_error", {
+                    "title": "Error",
+                    "message": f"An error occurred during {name.lower()}: {str(e)}"
+                }))
+            finally:
+                self.msg_queue.put(("background_finished", {}))
+        
+        threading.Thread(target=run, name=name.lower().replace(" ", "-"), daemon=True).start()
+    
+    def cancel_background_action(self):
+        """Ask the running background action to stop."""
+        if self.background_action is not None:
+            name, cancel_event = self.background_action
+            cancel_event.set()
+            self.status_var.set(f"Cancelling {name.lower()}...")
+    
+    def _check_cancelled(self, cancel_event):
+        """Stop a background action between steps once it has been cancelled."""
+        if cancel_event.is_set():
+            raise ActionCancelled()
+    
+    def _get_prefetched(self, kind, file_path, sheet_name, cancel_event, auto_detect=True, structure_only=False):
+        """
+        Get a parsed workbook from the prefetcher, starting the prefetch if needed.
+        
+        Going through the prefetcher means a following Process run reuses the
+        parse instead of reading the file again.
+        
+        Args:
+            kind: ADJUSTED or TEMPLATE
+            file_path: Path of the workbook
+            sheet_name: Sheet to read
+            cancel_event: Set when the user cancels
+            auto_detect: Auto-detect the rate sheet if sheet_name is missing
+            structure_only: Return once the structure analysis is available
             
-        except Exception as e:
-            logging.error(f"Error analyzing files: {str(e)}", exc_info=True)
-            self.status_var.set(f"Error: {str(e)}")
-            self.progress_var.set(0)
-            messagebox.showerror("Error", f"Error analyzing files: {str(e)}")
+        Returns:
+            PrefetchResult: Parsed workbook
+        """
+        self.prefetcher.request(kind, file_path, sheet_name, auto_detect=auto_detect)
+        result = self.prefetcher.get(kind, file_path, sheet_name, cancel_event=cancel_event,
+                                     structure_only=structure_only)
+        self._check_cancelled(cancel_event)
+        if result is None:
+            # The prefetch failed; reading directly reports the underlying error
+            self.file_analyzer.analyze_file_structure(file_path, sheet_name)
+            raise ValueError(f"Could not read {os.path.basename(file_path)}")
+        return result
 
     def setup_styles(self):
         """Set up the ttk styles for the modern Moxy theme."""
@@ -1709,89 +2088,7 @@ class Application(tk.Tk):
             mapping: Dictionary of field -> column mappings
             adjusted_structure: Structure of the adjusted rates file
         """
-        logging.info("Detecting pivot columns for Deductible and RateCost")
-        
-        # First check if they're already in the mapping
-        has_deductible = "Deductible" in mapping
-        has_rate_cost = "RateCost" in mapping
-        
-        if has_deductible and has_rate_cost:
-            logging.info("Both Deductible and RateCost are already mapped")
-            return
-        
-        # Try to find columns if they're not mapped yet
-        # Search patterns for deductible columns
-        deductible_patterns = ["deductible", "deduct", "ded", "deduc"]
-        rate_cost_patterns = ["ratecost", "rate cost", "cost", "price", "premium", "rate"]
-        
-        if not has_deductible:
-            # Look for deductible column
-            for col in source_columns:
-                col_lower = str(col).lower()
-                if any(pattern in col_lower for pattern in deductible_patterns):
-                    mapping["Deductible"] = col
-                    logging.info(f"Auto-detected Deductible column: {col}")
-                    has_deductible = True
-                    break
-                    
-        if not has_rate_cost:
-            # Look for rate cost column
-            for col in source_columns:
-                col_lower = str(col).lower()
-                if any(pattern in col_lower for pattern in rate_cost_patterns):
-                    mapping["RateCost"] = col
-                    logging.info(f"Auto-detected RateCost column: {col}")
-                    has_rate_cost = True
-                    break
-        
-        # If we still haven't found them, try using structure analysis
-        if (not has_deductible or not has_rate_cost) and isinstance(adjusted_structure, dict):
-            columns_info = adjusted_structure.get('columns', {})
-            patterns = adjusted_structure.get('patterns', {})
-            
-            # Check if file analysis found likely deductible column
-            if not has_deductible and patterns.get('has_deductible_data', False):
-                deduct_col = patterns.get('deductible_column')
-                if deduct_col and deduct_col in source_columns:
-                    mapping["Deductible"] = deduct_col
-                    logging.info(f"Found Deductible column from structure analysis: {deduct_col}")
-                    has_deductible = True
-            
-            # Check for likely rate cost column based on numeric analysis
-            if not has_rate_cost:
-                # Look for column with numeric values that might be costs
-                number_cols = []
-                for col, info in columns_info.items():
-                    if info.get('data_type') == 'numeric' and col in source_columns:
-                        number_cols.append(col)
-                
-                # If we have just one numeric column left, use it
-                if len(number_cols) == 1:
-                    mapping["RateCost"] = number_cols[0]
-                    logging.info(f"Using single numeric column as RateCost: {number_cols[0]}")
-                    has_rate_cost = True
-                
-                # Try to find based on column statistics
-                elif len(number_cols) > 1:
-                    # Look for columns with values that look like costs (decimals, reasonable ranges)
-                    for col in number_cols:
-                        col_info = columns_info.get(col, {})
-                        min_val = col_info.get('min_value', 0)
-                        max_val = col_info.get('max_value', 0)
-                        
-                        # Typical rate costs are positive and in a reasonable range
-                        if min_val >= 0 and max_val < 10000:
-                            mapping["RateCost"] = col
-                            logging.info(f"Selected likely RateCost column based on value range: {col}")
-                            has_rate_cost = True
-                            break
-        
-        # Log error if we still couldn't find them
-        if not has_deductible:
-            logging.warning("Could not auto-detect Deductible column. User will need to specify it.")
-        
-        if not has_rate_cost:
-            logging.warning("Could not auto-detect RateCost column. User will need to specify it.")
+        self.mapping_system.detect_pivot_columns(source_columns, mapping, adjusted_structure)
 
     def add_mapping_field(self, field):
         """
@@ -1847,9 +2144,311 @@ class Application(tk.Tk):
         
         return tooltip
 
-def main():
+def parse_arguments(argv=None):
+    """
+    Parse command line arguments.
+    
+    Args:
+        argv: Argument list (defaults to sys.argv)
+        
+    Returns:
+        Namespace: Parsed arguments
+    """
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Moxy Rates Template Transfer")
+    parser.add_argument("--watch", metavar="DIR",
+                        help="Run headless and convert workbooks dropped into DIR")
+    parser.add_argument("--template", metavar="FILE",
+                        help="Template file used for unattended conversions")
+    parser.add_argument("--template-sheet", metavar="NAME",
+                        help="Template sheet name (defaults to the first sheet)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of concurrent conversions")
+    parser.add_argument("--batch", metavar="DIR",
+                        help="Convert every workbook in DIR as a resumable batch, then exit")
+    parser.add_argument("--queue-db", metavar="FILE",
+                        help="Job queue database shared by batch workers (defaults to DIR/jobs.sqlite)")
+    parser.add_argument("--serve", type=int, metavar="PORT", nargs="?", const=8765, default=None,
+                        help="Run the local job service API on PORT (default 8765)")
+    parser.add_argument("--host", default=None,
+                        help="Interface for the job service (defaults to 127.0.0.1)")
+    parser.add_argument("--profile", nargs="?", const="cprofile", choices=PROFILE_MODES, default=None,
+                        help="Profile each conversion and write the results to logs/ "
+                             "(cprofile by default, or sampling for low overhead)")
+    parser.add_argument("--track-memory", action="store_true",
+                        help="Trace peak memory and top allocation sites per pipeline stage")
+    parser.add_argument("--trace-rows", action="store_true",
+                        help="Log every pivoted row (diagnostics only; very verbose on large files)")
+    parser.add_argument("--out-of-core", choices=("auto", "on", "off"), default=None,
+                        help="Stream adjusted rates sheets through spill files on disk "
+                             "(auto: only sheets larger than out_of_core_memory_mb)")
+    parser.add_argument("--transform-workers", type=int, default=None, metavar="N",
+                        help="Pivot large adjusted rates tables on N worker processes "
+                             "(0: one per CPU, 1: off)")
+    parser.add_argument("--fixed-point-rates", action="store_true",
+                        help="Hold rates as exact integer cents and write them with two decimals")
+    parser.add_argument("--rate-index", action="store_true",
+                        help="Write a rate lookup index (.rateidx) next to every output workbook")
+    parser.add_argument("--startup-check", action="store_true",
+                        help="Open the window, report time-to-first-window and exit "
+                             "(exit status 1 when over the startup budget)")
+    return parser.parse_args(argv)
+
+def run_watch_folder(args):
+    """
+    Run the drop-folder daemon until interrupted.
+    
+    Args:
+        args: Parsed command line arguments
+    """
+    from folder_watcher import FolderWatcher
+    
+    config_mgr = ConfigManager()
+    
+    template_file = args.template or config_mgr.get_setting("template_file", "", section="Watch")
+    if not template_file or not os.path.exists(template_file):
+        logging.error("A template file is required for watch mode (use --template)")
+        sys.exit(2)
+    
+    watcher = FolderWatcher(
+        args.watch,
+        template_file,
+        template_sheet=args.template_sheet or config_mgr.get_setting("template_sheet", None, section="Watch"),
+        max_workers=args.workers or config_mgr.get_setting("max_workers", 2, section="Watch"),
+        max_pending=config_mgr.get_setting("max_pending", 8, section="Watch"),
+        settle_seconds=config_mgr.get_setting("settle_seconds", 2.0, section="Watch"),
+        poll_interval=config_mgr.get_setting("poll_interval", 1.0, section="Watch"),
+        default_deductible=config_mgr.get_setting("default_deductible", "100"),
+        mapping_config=MappingConfigManager()
+    )
+    watcher.run_forever()
+
+def run_batch_conversion(args):
+    """
+    Convert a folder of workbooks through the durable job queue.
+    
+    Args:
+        args: Parsed command line arguments
+    """
+    from job_queue import JobQueue, run_batch
+    
+    config_mgr = ConfigManager()
+    
+    template_file = args.template or config_mgr.get_setting("template_file", "", section="Batch")
+    if not template_file or not os.path.exists(template_file):
+        logging.error("A template file is required for batch mode (use --template)")
+        sys.exit(2)
+    
+    batch_dir = os.path.abspath(args.batch)
+    input_files = sorted(
+        os.path.join(batch_dir, name) for name in os.listdir(batch_dir)
+        if name.lower().endswith(('.xlsx', '.xls')) and not name.startswith(('~$', '.'))
+    )
+    
+    queue = JobQueue(
+        args.queue_db or os.path.join(batch_dir, "jobs.sqlite"),
+        lease_seconds=config_mgr.get_setting("lease_seconds", 600, section="Batch"),
+        max_attempts=config_mgr.get_setting("max_attempts", 3, section="Batch")
+    )
+    counts = run_batch(
+        queue,
+        input_files,
+        template_file,
+        os.path.join(batch_dir, "output"),
+        batch_id=batch_dir,
+        template_sheet=args.template_sheet or config_mgr.get_setting("template_sheet", None, section="Batch"),
+        default_deductible=config_mgr.get_setting("default_deductible", "100"),
+        max_workers=args.workers or config_mgr.get_setting("max_workers", 2, section="Batch"),
+        mapping_config_path=MappingConfigManager().config_path
+    )
+    # Claimed jobs were left by a worker that is still running elsewhere or stopped mid-run
+    if counts.get("failed") or counts.get("pending") or counts.get("claimed"):
+        sys.exit(1)
+
+def run_job_service(args):
+    """
+    Run the local job service API until interrupted.
+    
+    Args:
+        args: Parsed command line arguments
+    """
+    import asyncio
+    from job_service import JobService
+    
+    config_mgr = ConfigManager()
+    
+    service = JobService(
+        host=args.host or config_mgr.get_setting("host", "127.0.0.1", section="Service"),
+        port=args.serve,
+        work_dir=config_mgr.get_setting("work_dir", None, section="Service"),
+        max_workers=args.workers or config_mgr.get_setting("max_workers", 2, section="Service"),
+        max_queued_jobs=config_mgr.get_setting("max_queued_jobs", 16, section="Service"),
+        max_upload_bytes=config_mgr.get_setting("max_upload_mb", 200, section="Service") * 1024 * 1024,
+        max_concurrent_uploads=config_mgr.get_setting("max_concurrent_uploads", 4, section="Service"),
+        mapping_config_path=MappingConfigManager().config_path,
+        upload_ttl=config_mgr.get_setting("upload_ttl_minutes", 60, section="Service") * 60
+    )
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        logging.info("Interrupted, shutting down job service")
+
+def setup_diagnostics(args):
+    """
+    Enable profiling, memory tracking and row tracing from the command line or the [Advanced] settings.
+    
+    Args:
+        args: Parsed command line arguments
+    """
+    config_mgr = ConfigManager()
+    mode = args.profile or config_mgr.get_setting("profile_mode", "off", section="Advanced")
+    if mode not in PROFILE_MODES:
+        logging.warning(f"Unknown profile_mode '{mode}' in config, profiling disabled")
+        mode = "off"
+    configure_profiling(
+        mode,
+        top_n=config_mgr.get_setting("profile_top_n", 25, section="Advanced"),
+        sample_interval=config_mgr.get_setting("profile_sample_interval_ms", 5.0, section="Advanced") / 1000.0
+    )
+    configure_metrics(
+        track_memory=args.track_memory or config_mgr.get_setting("track_memory", False, section="Advanced"),
+        top_sites=config_mgr.get_setting("memory_top_sites", 5, section="Advanced")
+    )
+    if args.trace_rows or config_mgr.get_setting("trace_rows", False, section="Advanced"):
+        # Off is the default, so the data processor is only imported when tracing is wanted
+        from data_processor import set_row_tracing
+        set_row_tracing(True)
+
+def setup_out_of_core(args):
+    """
+    Apply the out-of-core transform settings from the command line or the [Advanced] settings.
+    
+    Args:
+        args: Parsed command line arguments
+    """
+    config_mgr = ConfigManager()
+    mode = args.out_of_core or config_mgr.get_setting("out_of_core", "auto", section="Advanced")
+    memory_budget_mb = config_mgr.get_setting("out_of_core_memory_mb", 512, section="Advanced")
+    spill_dir = config_mgr.get_setting("spill_dir", "", section="Advanced")
+    if mode not in ("auto", "on", "off"):
+        logging.warning(f"Unknown out_of_core mode '{mode}' in config, using auto")
+        mode = "auto"
+    if (mode, memory_budget_mb, spill_dir) == ("auto", 512, ""):
+        # The defaults are built in, so the module is only imported when they change
+        return
+    from out_of_core import configure_out_of_core
+    configure_out_of_core(mode, memory_budget_mb=memory_budget_mb, spill_dir=spill_dir)
+
+def setup_parallel_transform(args):
+    """
+    Apply the parallel transform settings from the command line or the [Advanced] settings.
+    
+    Args:
+        args: Parsed command line arguments
+    """
+    config_mgr = ConfigManager()
+    workers = args.transform_workers
+    if workers is None:
+        workers = config_mgr.get_setting("transform_workers", 1, section="Advanced")
+    min_rows = config_mgr.get_setting("parallel_min_rows", 100000, section="Advanced")
+    if workers < 0:
+        logging.warning(f"Invalid transform_workers value {workers}, transforming in one process")
+        workers = 1
+    if (workers, min_rows) == (1, 100000):
+        # The defaults are built in, so the module is only imported when they change
+        return
+    from parallel_transform import configure_parallel_transform
+    configure_parallel_transform(workers=workers, min_rows=min_rows)
+
+def setup_fixed_point_rates(args):
+    """
+    Enable fixed-point rates from the command line or the [Advanced] settings.
+    
+    Args:
+        args: Parsed command line arguments
+    """
+    config_mgr = ConfigManager()
+    if args.fixed_point_rates or config_mgr.get_setting("fixed_point_rates", False, section="Advanced"):
+        from data_processor import configure_fixed_point_rates
+        configure_fixed_point_rates(True, decimals=config_mgr.get_setting("rate_decimals", 2, section="Advanced"))
+
+def setup_rate_index(args):
+    """
+    Enable rate index files from the command line or the [Advanced] settings.
+    
+    Args:
+        args: Parsed command line arguments
+    """
+    config_mgr = ConfigManager()
+    if args.rate_index or config_mgr.get_setting("write_rate_index", False, section="Advanced"):
+        from rate_index import configure_rate_index
+        configure_rate_index(write_index=True)
+
+def configure_headless_logging():
+    """Log to the console and to the daily log file when running without the GUI."""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    log_dir = os.path.join(script_dir, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    log_file = os.path.join(log_dir, f"app_{datetime.now().strftime('%Y%m%d')}.log")
+    
+    setup_logging(log_file, logging.INFO)
+    config_mgr = ConfigManager()
+    if config_mgr.get_setting("enable_logging", False):
+        logging.getLogger().setLevel(logging.DEBUG)
+
+def run_startup_check():
+    """
+    Measure time-to-first-window and close the application.
+    
+    Returns:
+        int: 0 when the window appeared within the startup budget without
+        importing the processing modules, 1 otherwise
+    """
+    app = Application(warmup=False)
+    # Queued behind the first-window measurement
+    app.after_idle(app.quit)
+    app.mainloop()
+    app.destroy()
+    
+    early_imports = [name for name in HEAVY_MODULES if name in sys.modules]
+    print(f"Time to first window: {app.startup_seconds * 1000:.0f} ms")
+    if early_imports:
+        print(f"Imported before the window: {', '.join(early_imports)}")
+    print("Startup check passed" if app.startup_ok else "Startup check FAILED")
+    return 0 if app.startup_ok else 1
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    
+    # Headless modes set up logging before anything else logs; the GUI does it in Application
+    if args.watch or args.batch or args.serve is not None:
+        configure_headless_logging()
+    setup_diagnostics(args)
+    setup_out_of_core(args)
+    setup_parallel_transform(args)
+    setup_fixed_point_rates(args)
+    setup_rate_index(args)
+    
+    if args.watch:
+        run_watch_folder(args)
+        return
+    
+    if args.batch:
+        run_batch_conversion(args)
+        return
+    
+    if args.serve is not None:
+        run_job_service(args)
+        return
+    
+    if args.startup_check:
+        sys.exit(run_startup_check())
+    
     app = Application()
     app.mainloop()
 
 if __name__ == "__main__":
+    # Frozen Windows builds start the transform workers through this executable
+    multiprocessing.freeze_support()
     main() 
\ No newline at end of file
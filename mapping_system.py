@@ -15,6 +15,10 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import pandas as pd
 
+import template_spec
+from template_spec import STANDARD_TEMPLATE_COLUMNS
+
+
 class MappingSystem:
     """Handles mapping between different column naming conventions."""
     
@@ -28,12 +32,8 @@ class MappingSystem:
         self.config_manager = config_manager
         self.current_mapping = {}
         self.mapping_confidence = {}
-        self.required_fields = [
-            'CompanyCode', 'Term', 'Miles', 'FromMiles', 'ToMiles', 'Coverage', 'State', 'Class',
-            'PlanDeduct', 'Deduct0', 'Deduct50', 'Deduct100', 'Deduct200', 'Deduct250', 'Deduct500',
-            'Markup', 'New/Used', 'MaxYears', 'SurchargeCode', 'PlanCode', 'RateCardCode',
-            'ClassListCode', 'MinYear', 'IncScCode', 'IncScAmt'
-        ]
+        # Until a template is chosen, every column of the standard template
+        self.required_fields = list(STANDARD_TEMPLATE_COLUMNS)
         
         logging.info("MappingSystem initialized")
     
@@ -70,6 +70,16 @@ class MappingSystem:
                 'column_mapping_suggestions': {}
             }
         
+        # Reuse a mapping saved for the same file layout if allowed
+        if use_saved_mappings:
+            saved_mapping = self.get_saved_mapping(source_columns)
+            if saved_mapping:
+                mapping = {field: col for field, col in saved_mapping.items() if col in source_cols}
+                self.current_mapping = mapping
+                self.mapping_confidence = {field: 100 for field in mapping}
+                logging.info(f"Using saved mapping with {len(mapping)} fields mapped")
+                return mapping
+        
         # STEP 2: Use high confidence suggestions if available
         if 'column_mapping_suggestions' in source_structure:
             suggestions = source_structure['column_mapping_suggestions']
@@ -231,16 +241,158 @@ class MappingSystem:
         logging.info(f"Saved mapping with signature {file_signature}" + 
                     (f" and name '{mapping_name}'" if mapping_name else ""))
     
+    def get_saved_mapping(self, source_structure):
+        """
+        Look up a previously saved mapping for a source file layout.
+        
+        Both the full structure signature and the column-only signature are
+        tried, since mappings saved from the dialog only know the column names.
+        
+        Args:
+            source_structure: File structure analysis result or list of column names
+            
+        Returns:
+            dict: Saved field -> column mapping, or None if not found
+        """
+        if not hasattr(self.config_manager, 'get_saved_mapping'):
+            return None
+        
+        if isinstance(source_structure, dict) and 'columns' in source_structure:
+            column_names = list(source_structure['columns'].keys())
+        else:
+            column_names = list(source_structure)
+        
+        signatures = [self._generate_file_signature(source_structure),
+                      self._generate_file_signature(column_names)]
+        
+        for signature in dict.fromkeys(signatures):
+            saved = self.config_manager.get_saved_mapping(signature)
+            if isinstance(saved, dict):
+                return {field: col for field, col in saved.items() if field != 'metadata'}
+        
+        return None
+    
+    @staticmethod
+    def extract_required_fields(template_columns):
+        """
+        Extract required fields from template columns.
+        
+        Args:
+            template_columns: List or pandas Index of column names from template
+            
+        Returns:
+            list: Required fields for mapping (see template_spec.extract_required_fields)
+        """
+        return template_spec.extract_required_fields(template_columns)
+    
+    @staticmethod
+    def detect_pivot_columns(source_columns, mapping, adjusted_structure):
+        """
+        Detect and add Deductible and RateCost columns to the mapping.
+        
+        Args:
+            source_columns: List of column names from source file
+            mapping: Dictionary of field -> column mappings (updated in place)
+            adjusted_structure: Structure of the adjusted rates file
+        """
+        logging.info("Detecting pivot columns for Deductible and RateCost")
+        
+        # First check if they're already in the mapping
+        has_deductible = "Deductible" in mapping
+        has_rate_cost = "RateCost" in mapping
+        
+        if has_deductible and has_rate_cost:
+            logging.info("Both Deductible and RateCost are already mapped")
+            return
+        
+        # Try to find columns if they're not mapped yet
+        # Search patterns for deductible columns
+        deductible_patterns = ["deductible", "deduct", "ded", "deduc"]
+        rate_cost_patterns = ["ratecost", "rate cost", "cost", "price", "premium", "rate"]
+        
+        if not has_deductible:
+            # Look for deductible column
+            for col in source_columns:
+                col_lower = str(col).lower()
+                if any(pattern in col_lower for pattern in deductible_patterns):
+                    mapping["Deductible"] = col
+                    logging.info(f"Auto-detected Deductible column: {col}")
+                    has_deductible = True
+                    break
+                    
+        if not has_rate_cost:
+            # Look for rate cost column
+            for col in source_columns:
+                col_lower = str(col).lower()
+                if any(pattern in col_lower for pattern in rate_cost_patterns):
+                    mapping["RateCost"] = col
+                    logging.info(f"Auto-detected RateCost column: {col}")
+                    has_rate_cost = True
+                    break
+        
+        # If we still haven't found them, try using structure analysis
+        if (not has_deductible or not has_rate_cost) and isinstance(adjusted_structure, dict):
+            columns_info = adjusted_structure.get('columns', {})
+            patterns = adjusted_structure.get('patterns', {})
+            
+            # Check if file analysis found likely deductible column
+            if not has_deductible and patterns.get('has_deductible_data', False):
+                deduct_col = patterns.get('deductible_column')
+                if deduct_col and deduct_col in source_columns:
+                    mapping["Deductible"] = deduct_col
+                    logging.info(f"Found Deductible column from structure analysis: {deduct_col}")
+                    has_deductible = True
+            
+            # Check for likely rate cost column based on numeric analysis
+            if not has_rate_cost:
+                # Look for column with numeric values that might be costs
+                number_cols = []
+                for col, info in columns_info.items():
+                    if info.get('data_type') == 'numeric' and col in source_columns:
+                        number_cols.append(col)
+                
+                # If we have just one numeric column left, use it
+                if len(number_cols) == 1:
+                    mapping["RateCost"] = number_cols[0]
+                    logging.info(f"Using single numeric column as RateCost: {number_cols[0]}")
+                    has_rate_cost = True
+                
+                # Try to find based on column statistics
+                elif len(number_cols) > 1:
+                    # Look for columns with values that look like costs (decimals, reasonable ranges)
+                    for col in number_cols:
+                        col_info = columns_info.get(col, {})
+                        min_val = col_info.get('min_value', 0)
+                        max_val = col_info.get('max_value', 0)
+                        
+                        # Typical rate costs are positive and in a reasonable range
+                        if min_val >= 0 and max_val < 10000:
+                            mapping["RateCost"] = col
+                            logging.info(f"Selected likely RateCost column based on value range: {col}")
+                            has_rate_cost = True
+                            break
+        
+        # Log error if we still couldn't find them
+        if not has_deductible:
+            logging.warning("Could not auto-detect Deductible column. User will need to specify it.")
+        
+        if not has_rate_cost:
+            logging.warning("Could not auto-detect RateCost column. User will need to specify it.")
+    
     def _generate_file_signature(self, structure):
         """
         Generate a unique signature for a file structure.
         
         Args:
-            structure: File structure analysis result
+            structure: File structure analysis result or list of column names
             
         Returns:
             str: MD5 hash signature of the file structure
         """
+        # A plain list of column names carries no type information
+        if not isinstance(structure, dict):
+            structure = {'columns': {col: {} for col in structure}}
+        
         # Create a signature based on column names, order, and data types
         columns = sorted(list(structure.get('columns', {}).keys()))
         data_types = [structure.get('columns', {}).get(col, {}).get('data_type', 'unknown') 
@@ -0,0 +1,538 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Out-of-Core module for Moxy Rates Template Transfer
+
+This module transforms Adjusted Rates sheets that are too large to load into
+memory at once. The sheet is streamed in chunks and every row is written to one
+of several spill files on local disk, chosen by a hash of its rate group key,
+so all rows of a group land in the same file. Each spill file is then pivoted
+on its own with DataProcessor.transform_data and the results are concatenated
+in the order the groups first appear in the sheet.
+
+Chunk and partition sizes are derived from a memory budget, so the working set
+stays bounded whatever the input size. Only the pivoted output (one row per
+rate group) is held in memory as a whole.
+"""
+
+import os
+import math
+import pickle
+import shutil
+import logging
+import tempfile
+import functools
+
+import openpyxl
+import numpy as np
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+from data_processor import DataProcessor
+from rate_table import deductible_amount
+
+OUT_OF_CORE_MODES = ("auto", "on", "off")
+
+# Default memory budget of a conversion ([Advanced] out_of_core_memory_mb)
+DEFAULT_MEMORY_BUDGET_MB = 512
+
+# Estimated memory per source cell while loading and pivoting in memory
+# (measured at about 75 bytes; rounded up for string-heavy sheets)
+BYTES_PER_CELL = 100
+
+# Share of the budget for the chunk being read and for the partition being pivoted
+CHUNK_BUDGET_SHARE = 0.25
+PARTITION_BUDGET_SHARE = 0.5
+
+MIN_CHUNK_ROWS = 1000
+MAX_PARTITIONS = 512
+
+# Partition count used when the sheet does not record its size
+DEFAULT_PARTITIONS = 64
+
+# Source row number carried through the spill files to restore the sheet order
+ROW_COLUMN = "__source_row__"
+
+# Process-wide defaults, set once at startup from the CLI flag or config.ini
+_defaults = {"mode": "auto", "memory_budget_mb": DEFAULT_MEMORY_BUDGET_MB, "spill_dir": None}
+
+
+def configure_out_of_core(mode="auto", memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, spill_dir=None):
+    """
+    Set the out-of-core defaults used by every conversion in this process.
+
+    Args:
+        mode: "auto" (stream sheets estimated to exceed the budget), "on" or "off"
+        memory_budget_mb: Memory budget of one conversion in megabytes
+        spill_dir: Directory for spill files (system temp directory if None)
+    """
+    if mode not in OUT_OF_CORE_MODES:
+        raise ValueError(f"Unknown out-of-core mode: {mode}")
+    _defaults.update(mode=mode, memory_budget_mb=memory_budget_mb, spill_dir=spill_dir or None)
+
+
+def sheet_dimensions(file_path, sheet_name=None):
+    """
+    Read the size a sheet records for itself, without loading its rows.
+
+    Args:
+        file_path: Path to the Excel file
+        sheet_name: Sheet name (first sheet if None)
+
+    Returns:
+        tuple: (data rows, columns), or (None, None) if the sheet does not record its size
+    """
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+        if sheet.max_row is None or sheet.max_column is None:
+            return None, None
+        return max(sheet.max_row - 1, 0), sheet.max_column
+    finally:
+        workbook.close()
+
+
+def estimate_memory(row_count, column_count):
+    """
+    Estimate the memory needed to load and pivot a sheet in memory.
+
+    Args:
+        row_count: Number of data rows
+        column_count: Number of columns
+
+    Returns:
+        int: Estimated bytes
+    """
+    return row_count * column_count * BYTES_PER_CELL
+
+
+def use_out_of_core(row_count, column_count, mode=None, memory_budget_mb=None):
+    """
+    Decide whether a sheet should be transformed out of core.
+
+    Args:
+        row_count: Number of data rows (None if unknown)
+        column_count: Number of columns (None if unknown)
+        mode: "auto", "on" or "off" (process default if None)
+        memory_budget_mb: Memory budget in megabytes (process default if None)
+
+    Returns:
+        bool: True if the sheet should be streamed through spill files
+    """
+    mode = mode or _defaults["mode"]
+    if mode != "auto":
+        return mode == "on"
+    if not row_count or not column_count:
+        return False
+    budget = (memory_budget_mb or _defaults["memory_budget_mb"]) * 1024 * 1024
+    return estimate_memory(row_count, column_count) > budget
+
+
+def sheet_needs_streaming(file_path, sheet_name=None):
+    """
+    Decide from the size a sheet records for itself whether to transform it out of core.
+
+    Args:
+        file_path: Path to the Excel file
+        sheet_name: Sheet name (first sheet if None)
+
+    Returns:
+        tuple: (whether to stream the sheet, data rows or None if unknown)
+    """
+    if _defaults["mode"] == "off":
+        return False, None
+    try:
+        row_count, column_count = sheet_dimensions(file_path, sheet_name)
+    except Exception as e:
+        # Not an xlsx workbook openpyxl can open; the normal loader reports real errors
+        logging.debug(f"Could not read the dimensions of {file_path}: {str(e)}")
+        row_count, column_count = None, None
+    return use_out_of_core(row_count, column_count), row_count
+
+
+def _convert_cell(cell):
+    """Convert an openpyxl cell the way pandas.read_excel does."""
+    if cell.value is None:
+        return ""
+    if cell.data_type == "e":
+        return float("nan")
+    if cell.data_type == "n":
+        value = int(cell.value)
+        return value if value == cell.value else float(cell.value)
+    return cell.value
+
+
+def iter_sheet_chunks(file_path, sheet_name=None, chunk_rows=100000):
+    """
+    Stream a sheet as DataFrames of at most chunk_rows rows.
+
+    Cells are parsed like DataProcessor.load_excel_file parses them (empty cells
+    stay empty strings). Column types are inferred per chunk; see
+    unify_chunk_dtypes for making them consistent across chunks.
+
+    Args:
+        file_path: Path to the Excel file
+        sheet_name: Sheet name (first sheet if None)
+        chunk_rows: Maximum rows per chunk
+
+    Yields:
+        DataFrame: Next chunk of the sheet
+    """
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+        sheet.reset_dimensions()
+        rows = sheet.iter_rows()
+
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [_convert_cell(cell) for cell in header]
+        while header and header[-1] == "":
+            header.pop()
+        width = len(header)
+
+        def parse(data):
+            return TextParser([header] + data, header=0, keep_default_na=False, na_values=[],
+                              skip_blank_lines=False).read()
+
+        data = []
+        blank_rows = 0
+        for row in rows:
+            values = [_convert_cell(cell) for cell in row[:width]]
+            values += [""] * (width - len(values))
+            if all(value == "" for value in values):
+                # Trailing blank rows are dropped, as pandas does
+                blank_rows += 1
+                continue
+            data.extend([[""] * width for _ in range(blank_rows)])
+            blank_rows = 0
+            data.append(values)
+            if len(data) >= chunk_rows:
+                yield parse(data)
+                data = []
+        if data:
+            yield parse(data)
+    finally:
+        workbook.close()
+
+
+def _merge_dtype(current, dtype):
+    """Combine the dtypes a column had in two chunks into the dtype of the whole column."""
+    if current is None or current == dtype:
+        return dtype
+    if pd.api.types.is_numeric_dtype(current) and pd.api.types.is_numeric_dtype(dtype) \
+            and not pd.api.types.is_bool_dtype(current) and not pd.api.types.is_bool_dtype(dtype):
+        return "float64"
+    return "object"
+
+
+def _restore_integers(value):
+    """Undo the float conversion of whole numbers in a column that pandas keeps as objects."""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def unify_chunk_dtypes(df, dtypes):
+    """
+    Cast a chunk to the dtypes its columns have across the whole sheet.
+
+    Args:
+        df: Chunk from iter_sheet_chunks
+        dtypes: Column -> dtype merged over all chunks
+
+    Returns:
+        DataFrame: Chunk with the same column types a full read_excel would give
+    """
+    for col, dtype in dtypes.items():
+        if col not in df.columns or df[col].dtype == dtype:
+            continue
+        if dtype == "object":
+            values = df[col].astype(object)
+            if pd.api.types.is_float_dtype(df[col].dtype):
+                # Built directly because Series.map would infer float64 again
+                values = pd.Series([_restore_integers(value) for value in values],
+                                   index=df.index, dtype=object)
+            df[col] = values
+        else:
+            df[col] = df[col].astype(dtype)
+    return df
+
+
+def _key_text(value):
+    """Text of a group key value that is the same whatever dtype its chunk inferred."""
+    if pd.isna(value):
+        return ""
+    return str(_restore_integers(value))
+
+
+def _key_texts(column):
+    """Key text of every value in a column, converting each distinct value once."""
+    codes, uniques = pd.factorize(column, use_na_sentinel=False)
+    texts = np.array([_key_text(value) for value in uniques], dtype=object)
+    return texts[codes]
+
+
+def _join_keys(columns):
+    """Join per-column key text into one key per row, like transform_data does."""
+    if not columns:
+        return None
+    return functools.reduce(lambda left, right: left + "||" + right, columns)
+
+
+def pivot_partition(data_processor, part_df, inverse_mapping, key_sources):
+    """
+    Pivot one partition and tag each output row with its group's first source row.
+
+    Rows of the same group must all be in the partition. ROW_COLUMN of the
+    result is the sheet row at which transform_data would have created the
+    group, so concatenated partitions sorted by it are in single-pass order.
+    Rates are kept as read, with NaN where a group has none: pass the
+    concatenated partitions to DataProcessor.format_pivoted_rates and then
+    DataProcessor.finish_transform.
+
+    Args:
+        data_processor: DataProcessor that pivots the rows
+        part_df: All source rows of the partition, in sheet order, with ROW_COLUMN
+        inverse_mapping: Template field -> source column (with Deductible and RateCost)
+        key_sources: Source columns that make up the group key
+
+    Returns:
+        DataFrame: Pivoted rows with ROW_COLUMN, or None if nothing could be pivoted
+    """
+    renamed_df = data_processor.rename_for_pivot(part_df, inverse_mapping)
+    group_cols = [col for col in renamed_df.columns if col not in ('Deductible', 'RateCost', 'PlanDeduct')]
+    result = data_processor.pivot_rows(renamed_df, group_cols, keep_rates=True)[0]
+    if result.empty:
+        return None
+
+    # transform_data creates a group at its first row with a deductible, so
+    # its output follows the first such row of every group
+    deductibles = part_df[inverse_mapping['Deductible']].fillna('').astype(str).str.strip()
+    valid = part_df[(deductibles != '') & (deductibles.str.lower() != 'nan')]
+    keys = _join_keys([valid[source].map(_key_text) for source in key_sources])
+    if keys is None:
+        first_rows = valid[ROW_COLUMN].iloc[:1]
+    else:
+        first_rows = valid[ROW_COLUMN][~keys.duplicated().to_numpy()]
+
+    if len(first_rows) != len(result):
+        logging.warning(f"Could not match {len(result)} pivoted rows to their source rows; "
+                        f"keeping the partition order")
+        first_rows = valid[ROW_COLUMN].iloc[:1].repeat(len(result))
+    result[ROW_COLUMN] = first_rows.to_numpy()
+    return result
+
+
+class SpillPartitions:
+    """Hash partitions of a sheet, appended to spill files on local disk."""
+
+    def __init__(self, partition_count, spill_dir=None):
+        """
+        Create the spill files.
+
+        Args:
+            partition_count: Number of partitions
+            spill_dir: Parent directory for the spill files (system temp directory if None)
+        """
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        self.partition_count = partition_count
+        self.directory = tempfile.mkdtemp(prefix="moxy_spill_", dir=spill_dir)
+        self.paths = [os.path.join(self.directory, f"part_{i:04d}.pkl") for i in range(partition_count)]
+        self.row_counts = [0] * partition_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, df, partition_ids):
+        """
+        Append the rows of a chunk to their partitions.
+
+        Args:
+            df: Chunk of the sheet
+            partition_ids: Partition number of every row
+        """
+        for partition, rows in df.groupby(partition_ids, sort=False):
+            with open(self.paths[partition], 'ab') as f:
+                pickle.dump(rows, f, protocol=pickle.HIGHEST_PROTOCOL)
+            self.row_counts[partition] += len(rows)
+
+    def read(self, partition):
+        """
+        Read the pieces of one partition back.
+
+        Args:
+            partition: Partition number
+
+        Returns:
+            list: DataFrames in the order they were added
+        """
+        pieces = []
+        if not self.row_counts[partition]:
+            return pieces
+        with open(self.paths[partition], 'rb') as f:
+            while True:
+                try:
+                    pieces.append(pickle.load(f))
+                except EOFError:
+                    break
+        return pieces
+
+    @property
+    def bytes_written(self):
+        """Total size of the spill files."""
+        return sum(os.path.getsize(path) for path in self.paths if os.path.exists(path))
+
+    def close(self):
+        """Delete the spill files."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class ChunkedTransformer:
+    """Transforms an Adjusted Rates sheet through hash-partitioned spill files."""
+
+    def __init__(self, data_processor=None, memory_budget_mb=None, spill_dir=None):
+        """
+        Initialize the transformer.
+
+        Args:
+            data_processor: DataProcessor that pivots each partition (a new one if None)
+            memory_budget_mb: Memory budget in megabytes (process default if None)
+            spill_dir: Directory for spill files (process default if None)
+        """
+        self.data_processor = data_processor or DataProcessor()
+        self.memory_budget_mb = memory_budget_mb or _defaults["memory_budget_mb"]
+        self.spill_dir = spill_dir or _defaults["spill_dir"]
+        # Statistics of the last transform
+        self.rows_in = 0
+        self.chunk_rows = None
+        self.partition_count = None
+        self.spilled_bytes = 0
+
+    def plan(self, row_count, column_count):
+        """
+        Choose the chunk size and partition count for a sheet.
+
+        Args:
+            row_count: Number of data rows (None if unknown)
+            column_count: Number of columns
+
+        Returns:
+            tuple: (rows per chunk, number of partitions)
+        """
+        budget = self.memory_budget_mb * 1024 * 1024
+        row_bytes = max(column_count, 1) * BYTES_PER_CELL
+        chunk_rows = max(int(budget * CHUNK_BUDGET_SHARE // row_bytes), MIN_CHUNK_ROWS)
+        if row_count is None:
+            partitions = DEFAULT_PARTITIONS
+        else:
+            partition_rows = max(int(budget * PARTITION_BUDGET_SHARE // row_bytes), 1)
+            partitions = math.ceil(row_count / partition_rows)
+        return chunk_rows, min(max(partitions, 1), MAX_PARTITIONS)
+
+    def transform(self, file_path, sheet_name, mapping):
+        """
+        Transform a sheet without loading it into memory as a whole.
+
+        Gives the same rows as loading the sheet with DataProcessor.load_excel_file
+        and calling transform_data, except that a sheet without a single valid
+        deductible row gives an empty result. A sheet that already has a column
+        per deductible is mapped chunk by chunk, without spilling.
+
+        Args:
+            file_path: Path to the Adjusted Rates Excel file
+            sheet_name: Sheet to read (first sheet if None)
+            mapping (dict): The mapping from template fields to source columns;
+                auto-detected pivot columns are added to it
+
+        Returns:
+            DataFrame: Transformed data
+        """
+        row_count, column_count = sheet_dimensions(file_path, sheet_name)
+        self.chunk_rows, self.partition_count = self.plan(row_count, column_count or 1)
+        logging.info(f"Out-of-core transform of {file_path}: about {row_count} rows, "
+                     f"{self.chunk_rows} rows per chunk, {self.partition_count} partitions, "
+                     f"{self.memory_budget_mb} MB budget")
+
+        self.rows_in = 0
+        dtypes = {}
+        inverse_mapping = None
+        wide_columns = None
+        results = []
+        with SpillPartitions(self.partition_count, self.spill_dir) as partitions:
+            # Pass 1: stream the sheet into the spill files
+            for chunk in iter_sheet_chunks(file_path, sheet_name, self.chunk_rows):
+                if wide_columns is None:
+                    wide_columns = self.data_processor.wide_deductible_columns(chunk.columns, mapping)
+                if wide_columns:
+                    # A column per deductible needs no pivot: map every chunk on its own, nothing is spilled
+                    self.rows_in += len(chunk)
+                    results.append(self.data_processor.transform_wide(chunk, mapping, wide_columns))
+                    continue
+
+                if inverse_mapping is None:
+                    inverse_mapping = self.data_processor.resolve_pivot_mapping(chunk.columns, mapping)
+                    if inverse_mapping is None:
+                        raise ValueError("Cannot transform out of core without Deductible and RateCost columns")
+                    key_sources = [source for field, source in inverse_mapping.items()
+                                   if field not in ('Deductible', 'RateCost', 'PlanDeduct')]
+
+                for col in chunk.columns:
+                    dtypes[col] = _merge_dtype(dtypes.get(col), chunk[col].dtype)
+                chunk[ROW_COLUMN] = range(self.rows_in, self.rows_in + len(chunk))
+                self.rows_in += len(chunk)
+
+                if not key_sources:
+                    partition_ids = [0] * len(chunk)
+                else:
+                    keys = pd.DataFrame({source: _key_texts(chunk[source]) for source in key_sources})
+                    hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+                    partition_ids = hashes % self.partition_count
+                partitions.add(chunk, partition_ids)
+            self.spilled_bytes = partitions.bytes_written
+
+            if wide_columns:
+                result_df = pd.concat(results, ignore_index=True).fillna('')
+                logging.info(f"Out-of-core transform mapped {self.rows_in} rows with a column per deductible "
+                             f"into {len(result_df)} rows")
+                return result_df
+
+            if inverse_mapping is None:
+                logging.warning("Adjusted rates sheet is empty")
+                return pd.DataFrame()
+
+            # Pass 2: pivot every partition on its own
+            for partition in range(self.partition_count):
+                pieces = partitions.read(partition)
+                if not pieces:
+                    continue
+                part_df = pd.concat([unify_chunk_dtypes(piece, dtypes) for piece in pieces])
+                del pieces
+                result = pivot_partition(self.data_processor, part_df, inverse_mapping, key_sources)
+                if result is not None:
+                    results.append(result)
+
+        logging.info(f"Out-of-core transform spilled {self.spilled_bytes / (1024 * 1024):.1f} MB "
+                     f"for {self.rows_in} rows")
+        if not results:
+            logging.warning("Out-of-core pivot produced no data")
+            return pd.DataFrame()
+
+        # Groups in the order they first appear in the sheet, as transform_data gives them
+        result_df = pd.concat(results, ignore_index=True)
+        result_df = result_df.sort_values(ROW_COLUMN, kind='stable').drop(columns=[ROW_COLUMN])
+        result_df = result_df.reset_index(drop=True)
+
+        # Rates are formatted over the whole table, not per partition
+        deduct_cols = [col for col in result_df.columns if deductible_amount(col) is not None]
+        result_df = self.data_processor.format_pivoted_rates(result_df, deduct_cols)
+        group_fields = [field for field in inverse_mapping if field not in ('Deductible', 'RateCost', 'PlanDeduct')]
+        result_df = self.data_processor.finish_transform(result_df, group_fields)
+        logging.info(f"Out-of-core transform produced {len(result_df)} rows")
+        return result_df
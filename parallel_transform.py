@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Parallel Transform module for Moxy Rates Template Transfer
+
+This module spreads the pivot (DataProcessor.transform_data) over a pool of
+worker processes. Rows are partitioned by a hash of their rate group key, so
+every group is pivoted by exactly one worker, and the partial tables are merged
+in the order the groups first appear in the source. Rates are formatted and the
+PlanDeduct column is added once, on the merged table, so the result is
+identical to a single-process run.
+
+The mapped source columns are factorized into integer codes and placed in one
+shared memory block. Workers read their rows from it directly; only the
+distinct values of each column are pickled, once per worker.
+"""
+
+import os
+import logging
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+
+from data_processor import DataProcessor
+from out_of_core import ROW_COLUMN, pivot_partition, _key_text
+from rate_table import deductible_amount
+
+# Default number of worker processes ([Advanced] transform_workers; 1 disables the pool)
+DEFAULT_WORKERS = 1
+
+# Smallest table worth starting worker processes for ([Advanced] parallel_min_rows)
+DEFAULT_MIN_ROWS = 100000
+
+# Partitions per worker, so that uneven partitions still keep every worker busy
+PARTITIONS_PER_WORKER = 4
+
+# Process-wide defaults, set once at startup from the CLI flag or config.ini
+_defaults = {"workers": DEFAULT_WORKERS, "min_rows": DEFAULT_MIN_ROWS}
+
+# State of a worker process, set by _init_worker
+_worker = {}
+
+
+def configure_parallel_transform(workers=DEFAULT_WORKERS, min_rows=DEFAULT_MIN_ROWS):
+    """
+    Set the parallel transform defaults used by every conversion in this process.
+
+    Args:
+        workers: Number of worker processes (0 for one per CPU, 1 to disable)
+        min_rows: Smallest number of source rows transformed in parallel
+    """
+    _defaults.update(workers=workers, min_rows=min_rows)
+
+
+def transform_workers(row_count, workers=None):
+    """
+    Get the number of worker processes to use for a table.
+
+    Args:
+        row_count: Number of source rows
+        workers: Requested workers (process default if None; 0 for one per CPU)
+
+    Returns:
+        int: Number of workers; 1 means transform in this process
+    """
+    workers = _defaults["workers"] if workers is None else workers
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or row_count < _defaults["min_rows"]:
+        return 1
+    return workers
+
+
+def filled_object_columns(df, sources):
+    """
+    List the source columns that ``fillna('')`` turns into object columns.
+
+    A partition without missing values would otherwise keep the numeric dtype
+    its column has in the whole table, and print its values differently.
+
+    Args:
+        df: Source data
+        sources: Source columns to check
+
+    Returns:
+        list: Column names
+    """
+    return [source for source in sources
+            if df[source].dtype != object and df[source].dtype != "str" and df[source].isna().any()]
+
+
+def _init_worker(shm_name, shape, sources, uniques, object_sources, inverse_mapping, key_sources,
+                 template_spec, default_deductible, rate_decimals):
+    """Attach a worker process to the shared code matrix."""
+    # Workers share the parent's resource tracker, so the parent alone unlinks the block
+    shm = shared_memory.SharedMemory(name=shm_name)
+    data_processor = DataProcessor(template_spec)
+    data_processor.default_deductible = default_deductible
+    data_processor.rate_decimals = rate_decimals
+    _worker.update(
+        shm=shm,
+        codes=np.ndarray(shape, dtype=np.int64, buffer=shm.buf),
+        sources=sources,
+        uniques=uniques,
+        object_sources=object_sources,
+        inverse_mapping=inverse_mapping,
+        key_sources=key_sources,
+        data_processor=data_processor
+    )
+
+
+def _transform_partition(start, stop):
+    """Pivot rows start:stop of the shared code matrix (see pivot_partition)."""
+    codes = _worker["codes"]
+    part_df = pd.DataFrame({source: pd.Series(values.take(codes[i, start:stop]))
+                            for i, (source, values) in enumerate(zip(_worker["sources"], _worker["uniques"]))})
+    for source in _worker["object_sources"]:
+        part_df[source] = part_df[source].astype(object)
+    part_df[ROW_COLUMN] = codes[-1, start:stop]
+
+    return pivot_partition(_worker["data_processor"], part_df, _worker["inverse_mapping"], _worker["key_sources"])
+
+
+def transform_parallel(source_df, mapping, workers=None, default_deductible="100",
+                       add_plan_deduct=False, data_processor=None):
+    """
+    Transform data on a pool of worker processes.
+
+    Gives the same result as ``transform_data`` (followed by
+    ``_add_plan_deduct_column`` when add_plan_deduct is set) in this process.
+
+    Args:
+        source_df (DataFrame): The source data
+        mapping (dict): The mapping from template fields to source columns;
+            auto-detected pivot columns are added to it
+        workers: Number of worker processes (process default if None; 0 for one per CPU)
+        default_deductible: Preferred deductible for the PlanDeduct column
+        add_plan_deduct: Also add the PlanDeduct column
+        data_processor: DataProcessor used when the table is transformed in this process
+
+    Returns:
+        DataFrame: Transformed data
+    """
+    data_processor = data_processor or DataProcessor()
+    data_processor.default_deductible = default_deductible
+    workers = transform_workers(len(source_df), workers)
+    if workers > 1 and data_processor.wide_deductible_columns(source_df.columns, mapping):
+        # Sources with a column per deductible are only renamed; worker processes would not help
+        workers = 1
+    inverse_mapping = None if workers == 1 else data_processor.resolve_pivot_mapping(source_df.columns, mapping)
+
+    def single_process():
+        result = data_processor.transform_data(source_df, mapping)
+        return data_processor._add_plan_deduct_column(result) if add_plan_deduct else result
+
+    if inverse_mapping is None:
+        return single_process()
+
+    sources = list(dict.fromkeys(inverse_mapping.values()))
+    key_sources = [source for field, source in inverse_mapping.items()
+                   if field not in ('Deductible', 'RateCost', 'PlanDeduct')]
+    partition_count = workers * PARTITIONS_PER_WORKER
+    row_count = len(source_df)
+
+    # Factorize the mapped columns; equal group keys get equal canonical codes
+    codes = np.empty((len(sources) + 1, row_count), dtype=np.int64)
+    uniques = []
+    key_codes = {}
+    for i, source in enumerate(sources):
+        codes[i], values = source_df[source].factorize(use_na_sentinel=False)
+        uniques.append(values)
+        if source in key_sources:
+            canonical = pd.factorize(np.array([_key_text(value) for value in values], dtype=object))[0]
+            key_codes[source] = canonical[codes[i]]
+
+    if key_codes:
+        hashes = pd.util.hash_pandas_object(pd.DataFrame(key_codes), index=False).to_numpy()
+        partition_ids = hashes % partition_count
+    else:
+        partition_ids = np.zeros(row_count, dtype=np.uint64)
+
+    # Rows of a partition are contiguous and keep their source order
+    order = np.argsort(partition_ids, kind='stable')
+    bounds = np.searchsorted(partition_ids[order], np.arange(partition_count + 1))
+    codes[:-1] = codes[:-1, order]
+    codes[-1] = order
+
+    logging.info(f"Transforming {row_count} rows on {workers} processes in {partition_count} partitions")
+
+    shm = shared_memory.SharedMemory(create=True, size=max(codes.nbytes, 1))
+    try:
+        shared = np.ndarray(codes.shape, dtype=np.int64, buffer=shm.buf)
+        shared[:] = codes
+        del codes
+
+        tasks = [(bounds[i], bounds[i + 1]) for i in range(partition_count) if bounds[i] < bounds[i + 1]]
+        initargs = (shm.name, shared.shape, sources, uniques, filled_object_columns(source_df, sources),
+                    inverse_mapping, key_sources, data_processor.template_spec,
+                    data_processor.default_deductible, data_processor.rate_decimals)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as executor:
+            results = [result for result in executor.map(_transform_partition, *zip(*tasks))
+                       if result is not None]
+        del shared
+    finally:
+        shm.close()
+        shm.unlink()
+
+    if not results:
+        # Nothing could be pivoted; the single pass reports it the usual way
+        return single_process()
+
+    # Groups in the order they first appear in the source, as a single pass gives them
+    result_df = pd.concat(results, ignore_index=True)
+    result_df = result_df.sort_values(ROW_COLUMN, kind='stable').drop(columns=[ROW_COLUMN])
+    result_df = result_df.reset_index(drop=True)
+
+    # Rates are formatted over the whole table, not per partition
+    deduct_cols = [col for col in result_df.columns if deductible_amount(col) is not None]
+    result_df = data_processor.format_pivoted_rates(result_df, deduct_cols)
+    group_fields = [field for field in inverse_mapping if field not in ('Deductible', 'RateCost', 'PlanDeduct')]
+    result_df = data_processor.finish_transform(result_df, group_fields)
+    if add_plan_deduct:
+        result_df = data_processor._add_plan_deduct_column(result_df)
+    logging.info(f"Parallel transform produced {len(result_df)} rows")
+    return result_df
@@ -0,0 +1,463 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Pipeline Metrics module for Moxy Rates Template Transfer
+
+This module provides stage timers for the conversion pipeline. Each stage
+records wall time, CPU time, rows in and out and throughput, and a finished run
+is written as one JSON line next to the application logs.
+
+Memory is tracked at stage boundaries: process RSS is recorded for every stage,
+and when memory tracking is enabled tracemalloc attributes the peak Python
+allocation to the stage that caused it, along with the source lines that grew
+the most during the stage.
+"""
+
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+# Try to import psutil - gives RSS on every platform
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+# Default directory for metrics files (same folder as the application logs; ignored by git)
+DEFAULT_LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+
+# Serializes appends to the metrics file from concurrent conversions
+_write_lock = threading.Lock()
+
+# tracemalloc tracing started by RunMetrics: whether this module started it and
+# how many unfinished runs use it. Tracing started by anything else (a benchmark,
+# a profiler) is never stopped here.
+_tracing = {"owned": False, "runs": 0}
+_tracing_lock = threading.Lock()
+
+# Seconds between RSS samples of a stage when peak RSS is sampled
+RSS_SAMPLE_INTERVAL = 0.005
+
+# Process-wide defaults, set once at startup from the CLI flag or config.ini
+_defaults = {"track_memory": False, "top_sites": 5, "sample_rss": False}
+
+
+def configure_metrics(track_memory=False, top_sites=5, sample_rss=False):
+    """
+    Set the memory tracking defaults used by every run in this process.
+
+    tracemalloc slows allocation-heavy code down noticeably, so it is off by
+    default. Its peaks are process-wide: attribution is exact when one
+    conversion runs at a time.
+
+    Args:
+        track_memory: Whether to trace Python allocations per stage
+        top_sites: Number of top allocation sites recorded per stage
+        sample_rss: Whether to sample RSS while each stage runs to find its peak
+    """
+    _defaults.update(track_memory=track_memory, top_sites=top_sites, sample_rss=sample_rss)
+
+
+def current_rss():
+    """
+    Get the resident set size of this process.
+
+    Returns:
+        int: RSS in bytes, or None if it cannot be determined
+    """
+    if PSUTIL_AVAILABLE:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class RssSampler:
+    """Background thread that records the highest RSS seen while it runs."""
+
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL):
+        """
+        Initialize the sampler.
+
+        Args:
+            interval: Seconds between samples
+        """
+        self.interval = interval
+        self.peak = None
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def start(self):
+        """Start sampling."""
+        self._sample()
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop sampling.
+
+        Returns:
+            int: Highest RSS seen in bytes, or None if RSS is unavailable
+        """
+        self._stop_event.set()
+        self._thread.join()
+        self._sample()
+        return self.peak
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        rss = current_rss()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+
+def _mb(value):
+    """Convert bytes to megabytes for display."""
+    return None if value is None else round(value / (1024 * 1024), 2)
+
+
+class StageMetrics:
+    """Measurements for one pipeline stage."""
+
+    def __init__(self, name, rows_in=None):
+        """
+        Initialize the stage measurements.
+
+        Args:
+            name: Stage name (load, analyze, map, transform, integrate, save, ...)
+            rows_in: Number of rows entering the stage (optional)
+        """
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.rss_start = None
+        self.rss_end = None
+        self.rss_peak = None
+        self.traced_peak = None
+        self.traced_delta = None
+        self.top_sites = []
+        self._wall_start = None
+        self._cpu_start = None
+        self._traced_start = None
+        self._snapshot = None
+        self._sampler = None
+
+    @property
+    def rows_per_second(self):
+        """Throughput based on rows in (or rows out when no input count is known)."""
+        rows = self.rows_in if self.rows_in is not None else self.rows_out
+        if not rows or self.wall_seconds <= 0:
+            return None
+        return rows / self.wall_seconds
+
+    @property
+    def rss_high(self):
+        """Highest RSS seen in the stage: the sampled peak if RSS was sampled, else RSS at exit."""
+        values = [value for value in (self.rss_peak, self.rss_end) if value is not None]
+        return max(values) if values else None
+
+    def to_dict(self):
+        """
+        Get a JSON-serializable view of the stage.
+
+        Returns:
+            dict: Stage measurements
+        """
+        rate = self.rows_per_second
+        return {
+            "stage": self.name,
+            "wall_seconds": round(self.wall_seconds, 6),
+            "cpu_seconds": round(self.cpu_seconds, 6),
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "rows_per_second": round(rate, 1) if rate is not None else None,
+            "rss_start_mb": _mb(self.rss_start),
+            "rss_end_mb": _mb(self.rss_end),
+            "rss_peak_mb": _mb(self.rss_peak),
+            "traced_peak_mb": _mb(self.traced_peak),
+            "traced_delta_mb": _mb(self.traced_delta),
+            "top_sites": self.top_sites
+        }
+
+
+class RunMetrics:
+    """Collects stage measurements for one conversion run."""
+
+    def __init__(self, source_file=None, run_id=None, track_memory=None, sample_rss=None):
+        """
+        Initialize the run metrics.
+
+        Args:
+            source_file: Adjusted rates file being converted (optional)
+            run_id: Identifier of the run (generated if None)
+            track_memory: Trace Python allocations per stage (process default if None)
+            sample_rss: Sample RSS on a background thread while each stage runs,
+                so transient peaks are seen (process default if None)
+        """
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.source_file = source_file
+        self.started_at = datetime.now()
+        self.stages = []
+        self.status = "running"
+        self.error = None
+        self._start_wall = time.perf_counter()
+        self._total_wall = None
+
+        self.track_memory = _defaults["track_memory"] if track_memory is None else track_memory
+        self.sample_rss = _defaults["sample_rss"] if sample_rss is None else sample_rss
+        self._started_tracing = False
+        if self.track_memory:
+            with _tracing_lock:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    _tracing["owned"] = True
+                if _tracing["owned"]:
+                    _tracing["runs"] += 1
+                    self._started_tracing = True
+
+    def start_stage(self, name, rows_in=None):
+        """
+        Start timing a pipeline stage.
+
+        CPU time is measured for the calling thread only, so concurrent runs do
+        not inflate each other's numbers; start and end a stage on the same thread.
+
+        Args:
+            name: Stage name
+            rows_in: Number of rows entering the stage (optional)
+
+        Returns:
+            StageMetrics: Measurements of the running stage
+        """
+        record = StageMetrics(name, rows_in)
+        record.rss_start = current_rss()
+        if self.sample_rss:
+            record._sampler = RssSampler()
+            record._sampler.start()
+        if self.track_memory and tracemalloc.is_tracing():
+            record._snapshot = tracemalloc.take_snapshot() if _defaults["top_sites"] else None
+            tracemalloc.reset_peak()
+            record._traced_start = tracemalloc.get_traced_memory()[0]
+        record._wall_start = time.perf_counter()
+        record._cpu_start = time.thread_time()
+        return record
+
+    def end_stage(self, record, rows_out=None):
+        """
+        Stop timing a stage and add it to the run.
+
+        Args:
+            record: StageMetrics returned by start_stage
+            rows_out: Number of rows leaving the stage (optional)
+        """
+        record.wall_seconds = time.perf_counter() - record._wall_start
+        record.cpu_seconds = time.thread_time() - record._cpu_start
+        record.rss_end = current_rss()
+        if record._sampler is not None:
+            record.rss_peak = record._sampler.stop()
+            record._sampler = None
+        if record._traced_start is not None and tracemalloc.is_tracing():
+            traced_current, traced_peak = tracemalloc.get_traced_memory()
+            # Peak above what was already allocated when the stage started
+            record.traced_peak = max(traced_peak - record._traced_start, 0)
+            record.traced_delta = traced_current - record._traced_start
+            if record._snapshot is not None:
+                record.top_sites = self._top_sites(record._snapshot)
+        record._snapshot = None
+        if rows_out is not None:
+            record.rows_out = rows_out
+        self.stages.append(record)
+        logging.debug(f"Stage {record.name} took {record.wall_seconds:.3f}s")
+
+    def _top_sites(self, start_snapshot):
+        """List the source lines whose allocations grew most since the stage started."""
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)])
+        sites = []
+        for stat in snapshot.compare_to(start_snapshot, 'lineno')[:_defaults["top_sites"]]:
+            if stat.size_diff <= 0:
+                break
+            frame = stat.traceback[0]
+            sites.append({"site": f"{os.path.basename(frame.filename)}:{frame.lineno}",
+                          "size_mb": _mb(stat.size_diff), "blocks": stat.count_diff})
+        return sites
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        """
+        Time a pipeline stage for the duration of a with-block.
+
+        Set ``rows_out`` (and ``rows_in`` if not known up front) on the yielded
+        object inside the block.
+
+        Args:
+            name: Stage name
+            rows_in: Number of rows entering the stage (optional)
+
+        Yields:
+            StageMetrics: Measurements of the running stage
+        """
+        record = self.start_stage(name, rows_in)
+        try:
+            yield record
+        finally:
+            self.end_stage(record)
+
+    def finish(self, status="ok", error=None):
+        """
+        Mark the run as finished.
+
+        Args:
+            status: Final status ("ok" or "failed")
+            error: Error message for failed runs (optional)
+        """
+        self.status = status
+        self.error = str(error) if error is not None else None
+        self._total_wall = time.perf_counter() - self._start_wall
+        if self._started_tracing:
+            self._started_tracing = False
+            with _tracing_lock:
+                # Stop only when the last run relying on our tracing is done
+                _tracing["runs"] -= 1
+                if _tracing["runs"] == 0 and _tracing["owned"]:
+                    _tracing["owned"] = False
+                    tracemalloc.stop()
+
+    @property
+    def peak_stage(self):
+        """Stage with the highest memory peak (traced peak if available, else RSS growth)."""
+        traced = [stage for stage in self.stages if stage.traced_peak is not None]
+        if traced:
+            return max(traced, key=lambda stage: stage.traced_peak)
+        with_rss = [stage for stage in self.stages if stage.rss_start is not None and stage.rss_high is not None]
+        if with_rss:
+            return max(with_rss, key=lambda stage: stage.rss_high - stage.rss_start)
+        return None
+
+    @property
+    def total_seconds(self):
+        """Wall time of the whole run so far."""
+        if self._total_wall is not None:
+            return self._total_wall
+        return time.perf_counter() - self._start_wall
+
+    def to_dict(self):
+        """
+        Get a JSON-serializable view of the run.
+
+        Returns:
+            dict: Run record with one entry per stage
+        """
+        return {
+            "run_id": self.run_id,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "source_file": self.source_file,
+            "status": self.status,
+            "error": self.error,
+            "total_seconds": round(self.total_seconds, 6),
+            "peak_stage": self.peak_stage.name if self.peak_stage else None,
+            "peak_rss_mb": _mb(max((stage.rss_high for stage in self.stages if stage.rss_high is not None),
+                                   default=None)),
+            "stages": [stage.to_dict() for stage in self.stages]
+        }
+
+    def format_summary(self):
+        """
+        Format the stage table for logs and the diagnostics panel.
+
+        Returns:
+            str: Multi-line summary
+        """
+        lines = [f"Run {self.run_id} ({self.status}) - {self.total_seconds:.2f}s total",
+                 f"{'Stage':<12}{'Wall s':>10}{'CPU s':>10}{'Rows in':>10}{'Rows out':>10}{'Rows/s':>12}"
+                 f"{'Max RSS':>10}{'Traced MB':>10}"]
+        for stage in self.stages:
+            rate = stage.rows_per_second
+            rss = _mb(stage.rss_high)
+            peak = _mb(stage.traced_peak)
+            lines.append(
+                f"{stage.name:<12}{stage.wall_seconds:>10.3f}{stage.cpu_seconds:>10.3f}"
+                f"{'' if stage.rows_in is None else stage.rows_in:>10}"
+                f"{'' if stage.rows_out is None else stage.rows_out:>10}"
+                f"{'' if rate is None else f'{rate:,.0f}':>12}"
+                f"{'' if rss is None else f'{rss:.1f}':>10}"
+                f"{'' if peak is None else f'{peak:.1f}':>10}"
+            )
+        peak_stage = self.peak_stage
+        if peak_stage is not None:
+            lines.append(f"Peak memory in stage: {peak_stage.name}")
+            for site in peak_stage.top_sites:
+                lines.append(f"    {site['size_mb']:>8.2f} MB  {site['site']}")
+        return "\n".join(lines)
+
+    def write(self, log_dir=None):
+        """
+        Append the run record to the daily metrics file as one JSON line.
+
+        Args:
+            log_dir: Directory for the metrics file (defaults to the logs folder)
+
+        Returns:
+            str: Path of the metrics file, or None if it could not be written
+        """
+        log_dir = log_dir or DEFAULT_LOG_DIR
+        path = os.path.join(log_dir, f"metrics_{self.started_at.strftime('%Y%m%d')}.jsonl")
+        try:
+            os.makedirs(log_dir, exist_ok=True)
+            line = json.dumps(self.to_dict())
+            with _write_lock:
+                with open(path, 'a') as f:
+                    f.write(line + "\n")
+            return path
+        except OSError as e:
+            logging.warning(f"Could not write run metrics to {path}: {str(e)}")
+            return None
+
+
+def read_recent_runs(log_dir=None, limit=20):
+    """
+    Read the most recent run records from the metrics files.
+
+    Args:
+        log_dir: Directory holding the metrics files (defaults to the logs folder)
+        limit: Maximum number of runs returned
+
+    Returns:
+        list: Run records, newest first
+    """
+    log_dir = log_dir or DEFAULT_LOG_DIR
+    if not os.path.isdir(log_dir):
+        return []
+
+    runs = []
+    files = sorted((name for name in os.listdir(log_dir)
+                    if name.startswith("metrics_") and name.endswith(".jsonl")), reverse=True)
+    for name in files:
+        try:
+            with open(os.path.join(log_dir, name), 'r') as f:
+                lines = f.readlines()
+        except OSError:
+            continue
+        for line in reversed(lines):
+            try:
+                runs.append(json.loads(line))
+            except ValueError:
+                continue
+            if len(runs) >= limit:
+                return runs
+    return runs
@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Prefetch module for Moxy Rates Template Transfer
+
+This module parses workbooks in the background as soon as they are selected.
+The sheet names, structure analysis and loaded data are kept so that a later
+processing run can use them instead of reading the files again.
+
+Each kind of input (adjusted rates or template) has at most one prefetch. A new
+selection cancels the previous one, and results are only handed out while the
+file on disk is unchanged and matches the requested sheet.
+
+The GUI imports this module on the Tk thread, so the readers (and pandas with
+them) are only imported by the prefetch threads.
+"""
+
+import os
+import logging
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from pipeline_metrics import RunMetrics
+
+ADJUSTED = "adjusted"
+TEMPLATE = "template"
+
+
+def file_signature(file_path):
+    """
+    Identify the current contents of a file by path, size and modification time.
+
+    Args:
+        file_path: Path to the file
+
+    Returns:
+        tuple: (absolute path, size, mtime in ns), or None if the file cannot be read
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+
+
+class PrefetchCancelled(Exception):
+    """Raised inside a prefetch when its selection has been replaced."""
+
+
+class PrefetchResult:
+    """Parsed workbook handed from the prefetcher to a processing run."""
+
+    def __init__(self, kind, file_path, signature):
+        """
+        Initialize an empty result.
+
+        Args:
+            kind: ADJUSTED or TEMPLATE
+            file_path: Path of the workbook
+            signature: file_signature of the workbook when the prefetch started
+        """
+        self.kind = kind
+        self.file_path = file_path
+        self.signature = signature
+        self.sheet_names = None
+        self.sheet_name = None
+        # Result of FileAnalyzer.analyze_file_structure
+        self.structure = None
+        # Adjusted rates only: DataFrame from DataProcessor.load_excel_file
+        # (None for sheets that are transformed out of core)
+        self.data = None
+        # Template only: header columns and TemplateSpec
+        self.template_columns = None
+        self.template_spec = None
+        # StageMetrics of the prefetch, for the processing run's metrics
+        self.stages = []
+
+
+class _PrefetchTask:
+    """One running or finished prefetch."""
+
+    def __init__(self, kind, file_path, sheet_name, auto_detect):
+        self.kind = kind
+        self.file_path = file_path
+        self.requested_sheet = sheet_name
+        self.auto_detect = auto_detect
+        self.result = PrefetchResult(kind, file_path, file_signature(file_path))
+        self.error = None
+        self.cancelled = threading.Event()
+        # Set once the structure analysis is available (or the task has ended)
+        self.analyzed = threading.Event()
+        self.done = threading.Event()
+
+    def check_cancelled(self):
+        """Stop the prefetch between steps once it has been cancelled."""
+        if self.cancelled.is_set():
+            raise PrefetchCancelled()
+
+
+class FilePrefetcher:
+    """Parses selected workbooks in the background, one prefetch per input kind."""
+
+    def __init__(self, on_sheets=None, on_error=None, max_workers=2):
+        """
+        Initialize the prefetcher.
+
+        The callbacks run on a prefetch thread; GUI code should hand their
+        arguments to the Tk thread (for example through a queue).
+
+        Args:
+            on_sheets: Optional callable(kind, file_path, sheet_names, sheet_name)
+                called once the sheets are known and a sheet has been chosen
+            on_error: Optional callable(kind, file_path, message) called when the
+                workbook cannot be opened
+            max_workers: Number of prefetch threads (one per input kind is enough)
+        """
+        self.on_sheets = on_sheets
+        self.on_error = on_error
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def request(self, kind, file_path, sheet_name=None, auto_detect=True):
+        """
+        Start prefetching a workbook, cancelling the previous prefetch of the same kind.
+
+        A request for the selection already being prefetched is ignored.
+
+        Args:
+            kind: ADJUSTED or TEMPLATE
+            file_path: Path of the workbook
+            sheet_name: Preferred sheet (used if the workbook has it)
+            auto_detect: Pick the rate sheet automatically when the preferred
+                sheet is missing (adjusted rates only)
+        """
+        with self._lock:
+            current = self._tasks.get(kind)
+            if (current is not None and not current.cancelled.is_set()
+                    and current.file_path == file_path
+                    and current.requested_sheet in (sheet_name, current.result.sheet_name)
+                    and current.result.signature == file_signature(file_path)):
+                return
+            if current is not None:
+                current.cancelled.set()
+
+            task = _PrefetchTask(kind, file_path, sheet_name, auto_detect)
+            self._tasks[kind] = task
+            self._executor.submit(self._run, task)
+        logging.info(f"Prefetching {kind} workbook {file_path}")
+
+    def cancel(self, kind=None):
+        """
+        Cancel prefetches and drop their results.
+
+        Args:
+            kind: ADJUSTED or TEMPLATE (all kinds if None)
+        """
+        with self._lock:
+            kinds = [kind] if kind else list(self._tasks)
+            for name in kinds:
+                task = self._tasks.pop(name, None)
+                if task is not None:
+                    task.cancelled.set()
+
+    def get(self, kind, file_path, sheet_name=None, timeout=None, cancel_event=None, structure_only=False):
+        """
+        Get the prefetched result for a selection, waiting for it if still running.
+
+        Args:
+            kind: ADJUSTED or TEMPLATE
+            file_path: Path of the workbook
+            sheet_name: Sheet the caller is about to read (any sheet if None)
+            timeout: Maximum seconds to wait for a running prefetch (no limit if None)
+            cancel_event: Optional threading.Event that stops the wait when set
+            structure_only: Return as soon as the structure analysis is available,
+                without waiting for the data load
+
+        Returns:
+            PrefetchResult: The result, or None if there is no usable prefetch
+        """
+        with self._lock:
+            task = self._tasks.get(kind)
+        if task is None or task.file_path != file_path:
+            return None
+
+        # Finishing the parse already under way is faster than starting over
+        ready = task.analyzed if structure_only else task.done
+        if not self._wait(ready, timeout, cancel_event):
+            return None
+        if task.cancelled.is_set() or task.error is not None or task.result.structure is None:
+            return None
+
+        result = task.result
+        if sheet_name and result.sheet_name != sheet_name:
+            return None
+        if result.signature is None or result.signature != file_signature(file_path):
+            logging.info(f"Prefetched {kind} workbook changed on disk, reading it again")
+            return None
+        return result
+
+    @staticmethod
+    def _wait(event, timeout, cancel_event):
+        """Wait for an event, giving up early when cancel_event is set."""
+        if cancel_event is None:
+            return event.wait(timeout)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not cancel_event.is_set():
+            remaining = 0.1 if deadline is None else min(0.1, deadline - time.monotonic())
+            if remaining <= 0:
+                return event.is_set()
+            if event.wait(remaining):
+                return True
+        return False
+
+    def shutdown(self):
+        """Cancel all prefetches and stop the worker threads."""
+        self.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, task):
+        """Run one prefetch, recording errors instead of raising them."""
+        try:
+            self._prefetch(task)
+            logging.info(f"Prefetched {task.kind} workbook {task.file_path} (sheet {task.result.sheet_name})")
+        except PrefetchCancelled:
+            logging.debug(f"Prefetch of {task.file_path} cancelled")
+        except Exception as e:
+            # The processing run reads the file itself and reports the error there
+            task.error = e
+            logging.info(f"Prefetch of {task.file_path} failed: {str(e)}")
+        finally:
+            task.analyzed.set()
+            task.done.set()
+
+    def _prefetch(self, task):
+        """Parse the workbook the same way the processing run does, checking for cancellation between steps."""
+        from file_analyzer import FileAnalyzer
+        from data_processor import DataProcessor
+        from template_spec import TemplateSpec
+
+        result = task.result
+        file_analyzer = FileAnalyzer()
+        # Memory tracing is process-wide and would be misattributed from this thread
+        metrics = RunMetrics(source_file=task.file_path, track_memory=False)
+
+        task.check_cancelled()
+        with metrics.stage("prefetch_sheets"):
+            try:
+                sheet_names = file_analyzer.get_sheet_names(task.file_path)
+            except ValueError as e:
+                if self.on_error and not task.cancelled.is_set():
+                    self.on_error(task.kind, task.file_path, str(e))
+                raise
+            if not sheet_names:
+                raise ValueError("No sheets found in Excel file")
+
+            if task.requested_sheet in sheet_names:
+                sheet_name = task.requested_sheet
+            elif task.kind == ADJUSTED and task.auto_detect and len(sheet_names) > 1:
+                # Profile all tabs and select the one that looks like rate data
+                sheet_name = file_analyzer.analyze_workbook(task.file_path)["main_sheet"]
+            else:
+                sheet_name = sheet_names[0]
+        result.sheet_names = sheet_names
+        result.sheet_name = sheet_name
+
+        task.check_cancelled()
+        if self.on_sheets:
+            self.on_sheets(task.kind, task.file_path, sheet_names, sheet_name)
+
+        with metrics.stage("prefetch_analyze") as stage:
+            result.structure = file_analyzer.analyze_file_structure(task.file_path, sheet_name)
+            stage.rows_in = result.structure.get('row_count')
+        task.analyzed.set()
+
+        task.check_cancelled()
+        if task.kind == ADJUSTED and result.structure.get('out_of_core'):
+            # Too large to hold in memory; the processing run streams it instead
+            logging.info(f"Not prefetching the data of {task.file_path}, it is transformed out of core")
+        elif task.kind == ADJUSTED:
+            with metrics.stage("prefetch_load") as stage:
+                result.data = DataProcessor().load_excel_file(task.file_path, sheet_name)
+                stage.rows_out = len(result.data)
+        else:
+            with metrics.stage("prefetch_load"):
+                result.template_spec = TemplateSpec.from_file(task.file_path, sheet_name)
+                result.template_columns = list(result.template_spec.columns)
+
+        task.check_cancelled()
+        result.stages = metrics.stages
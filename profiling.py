@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Profiling module for Moxy Rates Template Transfer
+
+This module wraps a conversion run in a profiler and writes the results to the
+logs folder. Two modes are available:
+
+    cprofile  Deterministic profile with cProfile; writes a .pstats file and a
+              top-N hotspot summary. Adds noticeable overhead.
+    sampling  Low-overhead statistical profile; a background thread samples the
+              running thread's stack at a fixed interval and writes a top-N
+              summary plus collapsed stacks (flame graph input). Cheap enough to
+              leave on in production.
+"""
+
+import os
+import io
+import sys
+import time
+import pstats
+import cProfile
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+
+# Default directory for profile output (same folder as the application logs)
+DEFAULT_LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+
+PROFILE_MODES = ("off", "cprofile", "sampling")
+
+# Process-wide defaults, set once at startup from the CLI flag or config.ini
+_defaults = {"mode": "off", "top_n": 25, "sample_interval": 0.005}
+
+
+def configure_profiling(mode="off", top_n=25, sample_interval=0.005):
+    """
+    Set the profiling defaults used by every conversion in this process.
+
+    Args:
+        mode: "cprofile", "sampling" or "off"
+        top_n: Number of hotspots listed in the summary
+        sample_interval: Seconds between stack samples in sampling mode
+    """
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode: {mode}. Use one of {', '.join(PROFILE_MODES)}")
+    _defaults.update(mode=mode, top_n=top_n, sample_interval=sample_interval)
+    if mode != "off":
+        logging.info(f"Profiling enabled ({mode}), output written to {DEFAULT_LOG_DIR}")
+
+
+class RunProfiler:
+    """Profiles the thread that runs a conversion."""
+
+    def __init__(self, mode=None, log_dir=None, top_n=None, sample_interval=None, label="run"):
+        """
+        Initialize the profiler.
+
+        Args:
+            mode: "cprofile", "sampling" or "off" (process default if None)
+            log_dir: Directory for profile output (defaults to the logs folder)
+            top_n: Number of hotspots listed in the summary (process default if None)
+            sample_interval: Seconds between stack samples in sampling mode (process default if None)
+            label: Short name included in the output file names
+        """
+        mode = mode or _defaults["mode"]
+        top_n = top_n or _defaults["top_n"]
+        sample_interval = sample_interval or _defaults["sample_interval"]
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {mode}. Use one of {', '.join(PROFILE_MODES)}")
+
+        self.mode = mode
+        self.log_dir = log_dir or DEFAULT_LOG_DIR
+        self.top_n = top_n
+        self.sample_interval = sample_interval
+        self.label = "".join(c if c.isalnum() or c in "-_" else "_" for c in str(label))[:40] or "run"
+        self.output_files = []
+
+        self._profile = None
+        self._sampler = None
+        self._stop_sampling = threading.Event()
+        self._target_thread = None
+        self._samples = Counter()
+        self._stacks = Counter()
+        self._sample_count = 0
+        self._started = None
+
+    @property
+    def enabled(self):
+        """Whether the profiler records anything."""
+        return self.mode != "off"
+
+    def start(self):
+        """Start profiling the calling thread."""
+        if not self.enabled:
+            return
+        self._started = time.perf_counter()
+
+        if self.mode == "cprofile":
+            self._profile = cProfile.Profile()
+            try:
+                self._profile.enable()
+            except ValueError as e:
+                # Another profiler is already active on this thread
+                logging.warning(f"Could not start cProfile: {str(e)}")
+                self._started = None
+        else:
+            self._target_thread = threading.get_ident()
+            self._stop_sampling.clear()
+            self._sampler = threading.Thread(target=self._sample_loop, name="profile-sampler", daemon=True)
+            self._sampler.start()
+
+    def stop(self):
+        """
+        Stop profiling and write the results.
+
+        Returns:
+            list: Paths of the files written
+        """
+        if not self.enabled or self._started is None:
+            return []
+        elapsed = time.perf_counter() - self._started
+        self._started = None
+
+        if self.mode == "cprofile":
+            self._profile.disable()
+            files = self._write_cprofile(elapsed)
+        else:
+            self._stop_sampling.set()
+            self._sampler.join()
+            files = self._write_samples(elapsed)
+
+        self.output_files = files
+        for path in files:
+            logging.info(f"Profile written to {path}")
+        return files
+
+    def close(self):
+        """Stop profiling, logging instead of raising if the output cannot be written."""
+        try:
+            self.stop()
+        except Exception as e:
+            # Profiling must never turn a successful run into a failed one
+            logging.warning(f"Could not write profile: {str(e)}")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def _output_base(self):
+        """Build the common path prefix for this run's output files."""
+        os.makedirs(self.log_dir, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        return os.path.join(self.log_dir, f"profile_{stamp}_{self.label}")
+
+    def _write_cprofile(self, elapsed):
+        """Write the .pstats file and the top-N hotspot summary."""
+        base = self._output_base()
+        pstats_file = base + ".pstats"
+        summary_file = base + ".txt"
+
+        self._profile.dump_stats(pstats_file)
+
+        buffer = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=buffer).strip_dirs()
+        buffer.write(f"cProfile of {self.label}: {elapsed:.3f}s wall\n\n")
+        buffer.write(f"Top {self.top_n} by cumulative time\n")
+        stats.sort_stats("cumulative").print_stats(self.top_n)
+        buffer.write(f"Top {self.top_n} by internal time\n")
+        stats.sort_stats("tottime").print_stats(self.top_n)
+
+        with open(summary_file, 'w') as f:
+            f.write(buffer.getvalue())
+        return [pstats_file, summary_file]
+
+    def _sample_loop(self):
+        """Record the target thread's stack until stopped."""
+        while not self._stop_sampling.wait(self.sample_interval):
+            frame = sys._current_frames().get(self._target_thread)
+            if frame is None:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            stack.reverse()
+
+            self._sample_count += 1
+            # Leaf frame counts self time; the full stack feeds inclusive time and flame graphs
+            self._samples[stack[-1]] += 1
+            self._stacks[";".join(stack)] += 1
+
+    def _write_samples(self, elapsed):
+        """Write the sampled hotspot summary and collapsed stacks."""
+        base = self._output_base()
+        summary_file = base + ".samples.txt"
+        folded_file = base + ".folded"
+
+        total = self._sample_count or 1
+        inclusive = Counter()
+        for stack, count in self._stacks.items():
+            for function in set(stack.split(";")):
+                inclusive[function] += count
+
+        lines = [f"Sampling profile of {self.label}: {elapsed:.3f}s wall, "
+                 f"{self._sample_count} samples every {self.sample_interval * 1000:.1f}ms", "",
+                 f"Top {self.top_n} by self samples"]
+        for function, count in self._samples.most_common(self.top_n):
+            lines.append(f"{count:>8} {count / total:>7.1%}  {function}")
+        lines.extend(["", f"Top {self.top_n} by inclusive samples"])
+        for function, count in inclusive.most_common(self.top_n):
+            lines.append(f"{count:>8} {count / total:>7.1%}  {function}")
+
+        with open(summary_file, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        with open(folded_file, 'w') as f:
+            for stack, count in self._stacks.items():
+                f.write(f"{stack} {count}\n")
+        return [summary_file, folded_file]
+
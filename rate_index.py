@@ -0,0 +1,448 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Rate Index module for Moxy Rates Template Transfer
+
+This module builds a lookup index over converted rates, so that a rate for
+(Coverage, Term, Miles, Class, Deductible) can be found without reading the
+output workbook again.
+
+Rows are grouped into segments by (Coverage, Class), found through a hash
+table, and sorted by Term and Miles inside each segment, so exact keys and
+term or mileage ranges are found by binary search. An index is saved as a
+single file that is memory-mapped when it is opened, so opening it costs the
+same whatever the number of rates.
+"""
+
+import os
+import sys
+import json
+import mmap
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+
+from rate_table import deductible_amount
+
+# First bytes of an index file, followed by the header length and a JSON header
+MAGIC = b"MOXYRIX1"
+
+# Index files are written next to the output workbook with this extension
+INDEX_EXTENSION = ".rateidx"
+
+# Arrays start on this boundary inside the file
+ALIGNMENT = 64
+
+# Process-wide defaults, set once at startup from the CLI flag or config.ini
+_defaults = {"write_index": False}
+
+
+def configure_rate_index(write_index=False):
+    """
+    Set whether conversions write a rate index next to their output workbook.
+
+    Args:
+        write_index: Write <output>.rateidx after saving the workbook
+    """
+    _defaults["write_index"] = bool(write_index)
+
+
+def index_path(output_file):
+    """
+    Get the path of the rate index of an output workbook.
+
+    Args:
+        output_file: Path of the output workbook
+
+    Returns:
+        str: Path of the index file
+    """
+    return os.path.splitext(output_file)[0] + INDEX_EXTENSION
+
+
+def write_index_for(final_df, output_file):
+    """
+    Write the rate index of a conversion if enabled (see configure_rate_index).
+
+    A failure is logged and does not fail the conversion.
+
+    Args:
+        final_df (DataFrame): Converted data as saved to the workbook
+        output_file: Path of the output workbook
+
+    Returns:
+        str: Path of the index file, or None if none was written
+    """
+    if not _defaults["write_index"]:
+        return None
+    try:
+        return RateIndex.build(final_df).save(index_path(output_file))
+    except Exception as e:
+        logging.warning(f"Could not write rate index for {output_file}: {str(e)}")
+        return None
+
+
+class RateIndex:
+    """Rates sorted by (Coverage, Class, Term, Miles) with a hash table over the segments."""
+
+    def __init__(self, coverages, classes, deductibles, segments, term, miles, rates, source_row):
+        """
+        Initialize an index from its arrays (see build and open).
+
+        Args:
+            coverages: Coverage names (segment codes index into them)
+            classes: Class names
+            deductibles: Deductible amounts (digit strings), one per rate column
+            segments: Integer array of (coverage code, class code, start, stop) rows
+            term: Float array of terms, sorted within each segment
+            miles: Float array of mileage bands, sorted within each term
+            rates: Float array (rows x deductibles); NaN where there is no rate
+            source_row: Row number of each rate in the converted data
+        """
+        self.coverages = list(coverages)
+        self.classes = list(classes)
+        self.deductibles = [str(amount) for amount in deductibles]
+        self.segments = segments
+        self.term = term
+        self.miles = miles
+        self.rates = rates
+        self.source_row = source_row
+        # Mapping of the index file the arrays are views of (see open)
+        self._mmap = None
+        self._segments = {(self.coverages[int(cov)], self.classes[int(cls)]): (int(start), int(stop))
+                          for cov, cls, start, stop in np.asarray(segments)}
+        self._deductible_index = {amount: j for j, amount in enumerate(self.deductibles)}
+
+    @classmethod
+    def build(cls, df):
+        """
+        Build an index from converted data.
+
+        Rows whose Term or Miles is not a number cannot be looked up and are left out.
+
+        Args:
+            df (DataFrame): Output of transform_data or integrate_with_template
+
+        Returns:
+            RateIndex: The index
+
+        Raises:
+            ValueError: If the data has no Coverage, Term, Miles or Class column, or no DeductN columns
+        """
+        missing = [col for col in ('Coverage', 'Term', 'Miles', 'Class') if col not in df.columns]
+        if missing:
+            raise ValueError(f"Cannot index rates without the columns: {', '.join(missing)}")
+        deduct_cols = sorted((col for col in df.columns if deductible_amount(col) is not None),
+                             key=lambda col: int(deductible_amount(col)))
+        if not deduct_cols:
+            raise ValueError("Cannot index rates without DeductN columns")
+
+        term = pd.to_numeric(df['Term'], errors='coerce').to_numpy(dtype=np.float64)
+        miles = pd.to_numeric(df['Miles'], errors='coerce').to_numpy(dtype=np.float64)
+        usable = ~(np.isnan(term) | np.isnan(miles))
+        if not usable.all():
+            logging.warning(f"{int((~usable).sum())} rows without a numeric Term or Miles are not indexed")
+
+        coverage_codes, coverages = pd.factorize(df['Coverage'].fillna('').astype(str))
+        class_codes, classes = pd.factorize(df['Class'].fillna('').astype(str))
+        rates = np.column_stack([pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64)
+                                 for col in deduct_cols])
+
+        # Sort by segment, Term, Miles; equal keys keep their order in the data
+        rows = np.flatnonzero(usable)
+        order = rows[np.lexsort((rows, miles[rows], term[rows], class_codes[rows], coverage_codes[rows]))]
+        segment_codes = coverage_codes[order].astype(np.int64) * max(len(classes), 1) + class_codes[order]
+        starts = np.flatnonzero(np.diff(segment_codes, prepend=-1))
+        stops = np.append(starts[1:], len(order)) if len(order) else starts
+        segments = np.column_stack([coverage_codes[order][starts], class_codes[order][starts],
+                                    starts, stops]).astype(np.int64).reshape(-1, 4)
+
+        logging.info(f"Indexed {len(order)} rates in {len(segments)} coverage/class segments")
+        return cls(coverages, classes, [deductible_amount(col) for col in deduct_cols], segments,
+                   term[order], miles[order], np.ascontiguousarray(rates[order]), order.astype(np.int64))
+
+    @classmethod
+    def from_workbook(cls, file_path, sheet_name=0):
+        """
+        Build an index from an output workbook.
+
+        Args:
+            file_path: Path of the workbook
+            sheet_name: Sheet with the converted rates (first sheet by default)
+
+        Returns:
+            RateIndex: The index
+        """
+        return cls.build(pd.read_excel(file_path, sheet_name=sheet_name, dtype=str, keep_default_na=False))
+
+    def save(self, path):
+        """
+        Save the index to a file that open() memory-maps.
+
+        Args:
+            path: Path of the index file
+
+        Returns:
+            str: The path
+        """
+        arrays = {
+            "segments": np.ascontiguousarray(self.segments, dtype=np.int64),
+            "term": np.ascontiguousarray(self.term, dtype=np.float64),
+            "miles": np.ascontiguousarray(self.miles, dtype=np.float64),
+            "rates": np.ascontiguousarray(self.rates, dtype=np.float64),
+            "source_row": np.ascontiguousarray(self.source_row, dtype=np.int64)
+        }
+        header = {
+            "version": 1,
+            "coverages": self.coverages,
+            "classes": self.classes,
+            "deductibles": self.deductibles,
+            "arrays": {}
+        }
+        # Offsets are relative to the end of the header, so they do not depend on its length
+        offset = 0
+        for name, array in arrays.items():
+            offset = -(-offset // ALIGNMENT) * ALIGNMENT
+            header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+            offset += array.nbytes
+        header_bytes = json.dumps(header).encode("utf-8")
+        data_start = -(-(len(MAGIC) + 8 + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(len(header_bytes).to_bytes(8, "little"))
+            f.write(header_bytes)
+            for name, array in arrays.items():
+                f.seek(data_start + header["arrays"][name]["offset"])
+                f.write(array.tobytes())
+        # Readers never see a half-written index
+        os.replace(temp_path, path)
+        logging.info(f"Saved rate index with {len(self.term)} rates to {path}")
+        return path
+
+    @classmethod
+    def open(cls, path):
+        """
+        Open a saved index; the file is memory-mapped once and its arrays are views of the mapping.
+
+        The mapping is held until close() is called (or the with block ends).
+        On Windows a mapped file cannot be replaced, so close an index before
+        saving a new one to the same path.
+
+        Args:
+            path: Path of the index file
+
+        Returns:
+            RateIndex: The index
+
+        Raises:
+            ValueError: If the file is not a rate index
+        """
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a rate index file")
+            header_length = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(header_length).decode("utf-8"))
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        data_start = -(-(len(MAGIC) + 8 + header_length) // ALIGNMENT) * ALIGNMENT
+
+        arrays = {}
+        for name, spec in header["arrays"].items():
+            shape = tuple(spec["shape"])
+            if 0 in shape:
+                # Empty arrays may start past the end of the file
+                arrays[name] = np.zeros(shape, dtype=spec["dtype"])
+                continue
+            # Plain array views of the mapping; memmap slices are slower to search
+            arrays[name] = np.frombuffer(mapping, dtype=spec["dtype"], count=int(np.prod(shape)),
+                                         offset=data_start + spec["offset"]).reshape(shape)
+        index = cls(header["coverages"], header["classes"], header["deductibles"], arrays["segments"],
+                    arrays["term"], arrays["miles"], arrays["rates"], arrays["source_row"])
+        index._mmap = mapping
+        return index
+
+    def close(self):
+        """
+        Unmap the index file of an opened index; the index cannot be used afterwards.
+
+        Arrays taken from the index by the caller keep the mapping alive; the
+        file is then unmapped once they are released.
+        """
+        mapping, self._mmap = self._mmap, None
+        self.segments = self.term = self.miles = self.rates = self.source_row = None
+        self._segments = {}
+        if mapping is None:
+            return
+        try:
+            mapping.close()
+        except BufferError:
+            logging.warning("Rate index arrays are still in use; the index file is unmapped once they are released")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def __len__(self):
+        return 0 if self.term is None else len(self.term)
+
+    def lookup(self, coverage, term, miles, class_code, deductible):
+        """
+        Look up the rate of an exact key.
+
+        When the data has several rows with the same key (for example for
+        different vehicle years), the first one is used.
+
+        Args:
+            coverage: Coverage name
+            term: Term in months
+            miles: Mileage band (the Miles column)
+            class_code: Vehicle class
+            deductible: Deductible amount or DeductN column name
+
+        Returns:
+            float: The rate, or None if there is none
+        """
+        row = self._find(coverage, class_code, term, miles)
+        return None if row is None else self._rate(row, deductible)
+
+    def lookup_band(self, coverage, term, miles, class_code, deductible):
+        """
+        Look up the rate of the shortest term and smallest mileage band that cover a vehicle.
+
+        Args:
+            coverage: Coverage name
+            term: Required term in months (the smallest Term at least this long is used)
+            miles: Required mileage (the smallest Miles band at least this high is used)
+            class_code: Vehicle class
+            deductible: Deductible amount or DeductN column name
+
+        Returns:
+            dict: {"term", "miles", "rate"} of the band (rate None if the band has
+            no rate for the deductible), or None if no band covers the vehicle
+        """
+        segment = self._segments.get((str(coverage), str(class_code)))
+        if segment is None:
+            return None
+        start, stop = segment
+        terms = self.term[start:stop]
+        first = int(terms.searchsorted(term, side="left"))
+        while first < len(terms):
+            last = int(terms.searchsorted(terms[first], side="right"))
+            band = first + int(self.miles[start + first:start + last].searchsorted(miles, side="left"))
+            if band < last:
+                row = start + band
+                return {"term": float(self.term[row]), "miles": float(self.miles[row]),
+                        "rate": self._rate(row, deductible)}
+            first = last
+        return None
+
+    def query(self, coverage, class_code, terms=None, miles=None):
+        """
+        List the rates of a coverage and class within term and mileage ranges.
+
+        Args:
+            coverage: Coverage name
+            class_code: Vehicle class
+            terms: Optional (low, high) inclusive range of terms
+            miles: Optional (low, high) inclusive range of mileage bands
+
+        Returns:
+            list: {"term", "miles", "rates": {DeductN: rate}} per row, by Term then Miles
+        """
+        segment = self._segments.get((str(coverage), str(class_code)))
+        if segment is None:
+            return []
+        start, stop = segment
+        if terms is not None:
+            segment_terms = self.term[start:stop]
+            start, stop = (start + int(segment_terms.searchsorted(terms[0], side="left")),
+                           start + int(segment_terms.searchsorted(terms[1], side="right")))
+        results = []
+        for row in range(start, stop):
+            if miles is not None and not miles[0] <= self.miles[row] <= miles[1]:
+                continue
+            results.append({
+                "term": float(self.term[row]),
+                "miles": float(self.miles[row]),
+                "rates": {f"Deduct{amount}": float(self.rates[row, j])
+                          for j, amount in enumerate(self.deductibles) if not np.isnan(self.rates[row, j])}
+            })
+        return results
+
+    def _find(self, coverage, class_code, term, miles):
+        """Row of the first rate with an exact key, or None."""
+        segment = self._segments.get((str(coverage), str(class_code)))
+        if segment is None:
+            return None
+        start, stop = segment
+        terms = self.term[start:stop]
+        first = int(terms.searchsorted(term, side="left"))
+        last = int(terms.searchsorted(term, side="right"))
+        band = first + int(self.miles[start + first:start + last].searchsorted(miles, side="left"))
+        if band < last and self.miles[start + band] == miles:
+            return start + band
+        return None
+
+    def _rate(self, row, deductible):
+        """Rate of a row for a deductible, or None."""
+        j = self._deductible_index.get(deductible_amount(deductible) or str(deductible))
+        if j is None:
+            return None
+        rate = self.rates[row, j]
+        return None if np.isnan(rate) else float(rate)
+
+
+def parse_arguments(argv=None):
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Build and query rate indexes of converted workbooks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Index an output workbook")
+    build.add_argument("workbook", help="Converted output workbook")
+    build.add_argument("--sheet", default=0, help="Sheet with the rates (first sheet by default)")
+    build.add_argument("--output", help=f"Index file (default: next to the workbook, {INDEX_EXTENSION})")
+
+    lookup = commands.add_parser("lookup", help="Look up one rate")
+    lookup.add_argument("index", help="Index file")
+    lookup.add_argument("--coverage", required=True)
+    lookup.add_argument("--term", type=float, required=True)
+    lookup.add_argument("--miles", type=float, required=True)
+    lookup.add_argument("--class", dest="class_code", required=True)
+    lookup.add_argument("--deductible", required=True)
+    lookup.add_argument("--band", action="store_true",
+                        help="Use the shortest term and smallest mileage band that cover the vehicle")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    args = parse_arguments(argv)
+    if args.command == "build":
+        index = RateIndex.from_workbook(args.workbook, args.sheet)
+        print(index.save(args.output or index_path(args.workbook)))
+        return 0
+
+    with RateIndex.open(args.index) as index:
+        if args.band:
+            result = index.lookup_band(args.coverage, args.term, args.miles, args.class_code, args.deductible)
+        else:
+            rate = index.lookup(args.coverage, args.term, args.miles, args.class_code, args.deductible)
+            result = None if rate is None else {"rate": rate}
+    if result is None:
+        print("No rate found")
+        return 1
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
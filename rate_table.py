@@ -0,0 +1,475 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Rate Table module for Moxy Rates Template Transfer
+
+This module provides RateTable, a compact in-memory form of pivoted rates.
+Group key columns are held as integer codes into their distinct values, and
+the rates as a dense rows x deductibles float matrix with a validity mask,
+instead of one Python dict or DataFrame row per group.
+"""
+
+import logging
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Decimal places of fixed-point rates (cents)
+DEFAULT_RATE_DECIMALS = 2
+
+
+def deductible_amount(column):
+    """
+    Get the deductible amount of a DeductN column name.
+
+    Args:
+        column: Column name
+
+    Returns:
+        str: The digits of the amount, or None if the column is not a deductible column
+    """
+    column = str(column)
+    if column.startswith('Deduct') and column[6:].isdigit():
+        return column[6:]
+    return None
+
+
+def is_rate(value):
+    """Whether a value can be held in the rate matrix (a real number, not a bool)."""
+    return isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, (bool, np.bool_))
+
+
+def to_fixed_point(values, decimals=DEFAULT_RATE_DECIMALS):
+    """
+    Parse rates into integers scaled by 10 ** decimals (cents for 2 decimals).
+
+    Numbers and numeric text are accepted; rates with more decimals are
+    rounded to the nearest unit.
+
+    Args:
+        values: Array or Series of rates
+        decimals: Number of decimal places kept
+
+    Returns:
+        tuple: (int64 array of scaled rates, boolean array marking the values
+        that are numbers, number of values that had to be rounded)
+    """
+    scale = 10 ** decimals
+    values = np.asarray(values)
+    if values.dtype.kind in 'iu':
+        return values.astype(np.int64) * scale, np.ones(len(values), dtype=bool), 0
+    if values.dtype.kind == 'f':
+        numbers = values
+    else:
+        numbers = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=np.float64, copy=True)
+        # Booleans and empty text are not rates
+        numbers[[isinstance(value, (bool, np.bool_)) for value in values]] = np.nan
+    parsed = ~np.isnan(numbers)
+    scaled = np.rint(np.where(parsed, numbers, 0) * scale)
+    rounded = int((np.abs(np.where(parsed, numbers, 0) * scale - scaled) > 1e-6).sum())
+    return scaled.astype(np.int64), parsed, rounded
+
+
+def format_fixed_point(scaled, decimals=DEFAULT_RATE_DECIMALS):
+    """
+    Format scaled integer rates as decimal text, e.g. 41406 -> "414.06".
+
+    Args:
+        scaled: int64 array of scaled rates
+        decimals: Number of decimal places the values are scaled by
+
+    Returns:
+        ndarray: Object array of text
+    """
+    scaled = np.asarray(scaled, dtype=np.int64)
+    magnitude = np.abs(scaled)
+    whole = (magnitude // 10 ** decimals).astype(str).astype(object)
+    if decimals:
+        fraction = np.char.zfill((magnitude % 10 ** decimals).astype(str), decimals).astype(object)
+        whole = whole + '.' + fraction
+    return np.where(scaled < 0, '-' + whole, whole)
+
+
+class RateTable:
+    """Pivoted rates: coded group keys and a rows x deductibles rate matrix."""
+
+    def __init__(self, key_names, key_codes, key_values, deductibles, rates, mask, integral=None, plan_deduct=None,
+                 decimals=None):
+        """
+        Initialize a rate table.
+
+        Args:
+            key_names: Group key column names, in key order
+            key_codes: Integer array (rows x keys) of codes into key_values
+            key_values: One object array per key column with the text of each code
+            deductibles: Deductible amounts (digit strings), one per rate column
+            rates: Float array (rows x deductibles); NaN where there is no rate.
+                With decimals set, int64 rates scaled by 10 ** decimals instead
+            mask: Boolean array (rows x deductibles), True where a rate is present
+            integral: Boolean per deductible, True when every rate was an integer
+            plan_deduct: Optional object array with the PlanDeduct value of each row
+            decimals: Decimal places of fixed-point rates (None for float rates)
+        """
+        self.key_names = list(key_names)
+        self.key_codes = np.asarray(key_codes, dtype=np.int64).reshape(len(key_codes), len(self.key_names))
+        self.key_values = [np.asarray(values, dtype=object) for values in key_values]
+        self.deductibles = [str(amount) for amount in deductibles]
+        self.decimals = decimals
+        self.rates = np.asarray(rates, dtype=np.float64 if decimals is None else np.int64).reshape(
+            len(self.key_codes), len(self.deductibles))
+        self.mask = np.asarray(mask, dtype=bool).reshape(self.rates.shape)
+        self.integral = (np.zeros(len(self.deductibles), dtype=bool) if integral is None
+                         else np.asarray(integral, dtype=bool))
+        self.plan_deduct = plan_deduct
+        self._index = None
+
+    @classmethod
+    def from_groups(cls, key_names, key_codes, key_values, group_count, cells, skip_empty=False, decimals=None):
+        """
+        Build a table from the pivot's group codes and rate cells.
+
+        Deductible columns are ordered by amount.
+
+        Args:
+            key_names: Group key column names
+            key_codes: Integer array (groups x keys) of codes into key_values
+            key_values: One object array per key column with the text of each code
+            group_count: Number of groups (rows)
+            cells: Iterable of (deductible amount, group rows, rate values)
+            skip_empty: Treat '' rates as no rate instead of rejecting them
+            decimals: Hold the rates as int64 fixed point with this many decimal
+                places (float rates if None)
+
+        Returns:
+            RateTable: The table
+
+        Raises:
+            ValueError: If a rate is not a number
+        """
+        cells = sorted(cells, key=lambda cell: int(cell[0]))
+        if decimals is not None:
+            return cls._from_fixed_point_groups(key_names, key_codes, key_values, group_count, cells,
+                                                skip_empty, decimals)
+        rates = np.full((group_count, len(cells)), np.nan)
+        mask = np.zeros((group_count, len(cells)), dtype=bool)
+        integral = np.zeros(len(cells), dtype=bool)
+        for j, (amount, rows, values) in enumerate(cells):
+            rows = np.asarray(rows)
+            values = np.asarray(values)
+            if skip_empty and values.dtype == object:
+                filled = np.array([not (isinstance(value, str) and value == '') for value in values], dtype=bool)
+                rows, values = rows[filled], values[filled]
+            if values.dtype == object:
+                if not all(is_rate(value) for value in values):
+                    raise ValueError(f"Deduct{amount} has rates that are not numbers")
+                integral[j] = all(isinstance(value, (int, np.integer)) for value in values)
+            elif values.dtype.kind not in 'iuf':
+                raise ValueError(f"Deduct{amount} has rates that are not numbers")
+            else:
+                integral[j] = values.dtype.kind in 'iu'
+            rates[rows, j] = values.astype(np.float64)
+            mask[rows, j] = True
+        return cls(key_names, key_codes, key_values, [cell[0] for cell in cells], rates, mask, integral)
+
+    @classmethod
+    def _from_fixed_point_groups(cls, key_names, key_codes, key_values, group_count, cells, skip_empty, decimals):
+        """Build a table with int64 fixed-point rates (see from_groups)."""
+        rates = np.zeros((group_count, len(cells)), dtype=np.int64)
+        mask = np.zeros((group_count, len(cells)), dtype=bool)
+        rounded = 0
+        for j, (amount, rows, values) in enumerate(cells):
+            rows = np.asarray(rows)
+            scaled, parsed, column_rounded = to_fixed_point(values, decimals)
+            if skip_empty:
+                empty = np.array([isinstance(value, str) and value == '' for value in np.asarray(values)], dtype=bool)
+                rows, scaled, parsed = rows[~empty], scaled[~empty], parsed[~empty]
+            if not parsed.all():
+                raise ValueError(f"Deduct{amount} has rates that are not numbers")
+            rounded += column_rounded
+            rates[rows, j] = scaled
+            mask[rows, j] = True
+        if rounded:
+            logging.warning(f"{rounded} rates had more than {decimals} decimal places and were rounded")
+        return cls(key_names, key_codes, key_values, [cell[0] for cell in cells], rates, mask, decimals=decimals)
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """
+        Build a table from a transformed DataFrame.
+
+        DeductN columns become rate columns; empty and missing cells have no
+        rate. Every other column except PlanDeduct becomes a key column.
+
+        Args:
+            df (DataFrame): Transformed data
+
+        Returns:
+            RateTable: The table
+
+        Raises:
+            ValueError: If a rate is not a number
+        """
+        deduct_cols = [col for col in df.columns if deductible_amount(col) is not None]
+        key_names = [col for col in df.columns if col not in deduct_cols and col != 'PlanDeduct']
+        key_codes = np.zeros((len(df), len(key_names)), dtype=np.int64)
+        key_values = []
+        for i, col in enumerate(key_names):
+            texts = df[col].fillna('').astype(str)
+            key_codes[:, i], uniques = pd.factorize(texts)
+            key_values.append(np.asarray(uniques, dtype=object))
+
+        cells = []
+        for col in deduct_cols:
+            values = df[col].to_numpy()
+            rows = np.flatnonzero(pd.notna(values))
+            cells.append((deductible_amount(col), rows, values[rows]))
+        table = cls.from_groups(key_names, key_codes, key_values, len(df), cells, skip_empty=True)
+        if 'PlanDeduct' in df.columns:
+            table.plan_deduct = df['PlanDeduct'].to_numpy(dtype=object)
+        return table
+
+    def __len__(self):
+        return len(self.key_codes)
+
+    @property
+    def columns(self):
+        """Rate column names (DeductN), in amount order."""
+        return [f"Deduct{amount}" for amount in self.deductibles]
+
+    @property
+    def shape(self):
+        """(rows, key columns + rate columns)."""
+        return (len(self), len(self.key_names) + len(self.deductibles))
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the arrays."""
+        return self.key_codes.nbytes + self.rates.nbytes + self.mask.nbytes
+
+    def key_column(self, name):
+        """
+        Decode a key column.
+
+        Args:
+            name: Key column name
+
+        Returns:
+            ndarray: Object array with the text of every row
+        """
+        i = self.key_names.index(name)
+        return self.key_values[i][self.key_codes[:, i]]
+
+    def rate_column(self, deductible):
+        """
+        Get the rates of one deductible.
+
+        Args:
+            deductible: Deductible amount, DeductN column name or column number
+
+        Returns:
+            ndarray: Float array with NaN where there is no rate
+        """
+        j = deductible if isinstance(deductible, (int, np.integer)) else self._deductible_index(deductible)
+        if self.decimals is None:
+            return self.rates[:, j]
+        return np.where(self.mask[:, j], self.rates[:, j] / 10 ** self.decimals, np.nan)
+
+    def lookup(self, key, deductible):
+        """
+        Look up one rate.
+
+        Args:
+            key: Tuple with the text of every key column, in key order
+            deductible: Deductible amount or DeductN column name
+
+        Returns:
+            float: The rate, or None if the group or its rate does not exist
+        """
+        row = self.find(key)
+        if row is None:
+            return None
+        j = self._deductible_index(deductible, required=False)
+        if j is None or not self.mask[row, j]:
+            return None
+        return float(self.rate_column(j)[row])
+
+    def find(self, key):
+        """
+        Find the row of a group.
+
+        Args:
+            key: Tuple with the text of every key column, in key order
+
+        Returns:
+            int: Row number, or None if the group does not exist
+        """
+        if self._index is None:
+            # Built on first use; later lookups are one dict access per key column
+            self._index = ([{value: code for code, value in enumerate(values)} for values in self.key_values],
+                           {codes: row for row, codes in enumerate(map(tuple, self.key_codes.tolist()))})
+        value_codes, rows = self._index
+        try:
+            codes = tuple(lookup[str(value)] for lookup, value in zip(value_codes, key))
+        except KeyError:
+            return None
+        return rows.get(codes) if len(codes) == len(self.key_names) else None
+
+    def __getitem__(self, rows):
+        """
+        Select rows by slice, row numbers or a boolean mask.
+
+        Returns:
+            RateTable: Table sharing the key values with this one
+        """
+        if isinstance(rows, (int, np.integer)):
+            rows = slice(rows, rows + 1 if rows != -1 else None)
+        plan_deduct = None if self.plan_deduct is None else self.plan_deduct[rows]
+        return RateTable(self.key_names, self.key_codes[rows], self.key_values, self.deductibles,
+                         self.rates[rows], self.mask[rows], self.integral, plan_deduct, self.decimals)
+
+    def __iter__(self):
+        """Yield (key tuple, {DeductN: rate}) for every row, with present rates only."""
+        columns = self.columns
+        scale = 1 if self.decimals is None else 10 ** self.decimals
+        for row in range(len(self)):
+            key = tuple(values[code] for values, code in zip(self.key_values, self.key_codes[row]))
+            present = np.flatnonzero(self.mask[row])
+            yield key, {columns[j]: float(self.rates[row, j]) / scale for j in present}
+
+    def with_plan_deduct(self, default_deductible=None):
+        """
+        Choose the PlanDeduct value of every row.
+
+        The rules are those of DataProcessor._add_plan_deduct_column: the
+        default deductible if the row has a rate for it; for classes C and D
+        the lowest deductible with a rate; otherwise 100 if the row has a rate
+        for it, or else the lowest deductible with a rate.
+
+        Args:
+            default_deductible: Preferred deductible (skipped if empty)
+
+        Returns:
+            RateTable: The same table with plan_deduct set
+        """
+        plan_deduct = np.full(len(self), None, dtype=object)
+        decided = np.zeros(len(self), dtype=bool)
+        by_amount = sorted(range(len(self.deductibles)), key=lambda j: int(self.deductibles[j]))
+
+        def lowest(rows):
+            for j in by_amount:
+                chosen = rows & ~decided & self.mask[:, j]
+                plan_deduct[chosen] = str(int(self.deductibles[j]))
+                decided[chosen] = True
+
+        def preferred(amount, rows):
+            j = self._deductible_index(amount, required=False)
+            if j is not None:
+                chosen = rows & ~decided & self.mask[:, j]
+                plan_deduct[chosen] = amount
+                decided[chosen] = True
+
+        everyone = np.ones(len(self), dtype=bool)
+        if default_deductible:
+            preferred(str(default_deductible), everyone)
+        if 'Class' in self.key_names:
+            classes = np.array([str(value).strip().upper() for value in self.key_values[self.key_names.index('Class')]],
+                               dtype=object)
+            low_classes = np.isin(classes, ['C', 'D'])[self.key_codes[:, self.key_names.index('Class')]]
+            lowest(low_classes & ~decided)
+            # Classes C and D without any rate stay empty
+            decided |= low_classes
+        preferred("100", everyone)
+        lowest(everyone)
+
+        self.plan_deduct = plan_deduct
+        return self
+
+    def to_dataframe(self, empty=''):
+        """
+        Export the table as a DataFrame.
+
+        Key columns hold their text, then PlanDeduct (if chosen), then one
+        DeductN column per deductible in amount order. Rates that were all
+        integers stay integers when the column has no gaps. Fixed-point rates
+        are formatted as decimal text with all their decimal places.
+
+        Args:
+            empty: Value of cells without a rate
+
+        Returns:
+            DataFrame: The table
+        """
+        data = {name: self.key_column(name).tolist() for name in self.key_names}
+        if self.plan_deduct is not None:
+            data['PlanDeduct'] = self.plan_deduct.tolist()
+        for j, column in enumerate(self.columns):
+            present = self.mask[:, j]
+            if self.decimals is not None:
+                values = format_fixed_point(self.rates[:, j], self.decimals)
+                values[~present] = empty
+                data[column] = values.tolist()
+            elif present.all():
+                data[column] = self.rates[:, j].astype(np.int64) if self.integral[j] else self.rates[:, j]
+            else:
+                values = self.rates[:, j].astype(object)
+                values[~present] = empty
+                data[column] = values.tolist()
+        if not data:
+            return pd.DataFrame(index=range(len(self)))
+        return pd.DataFrame(data)
+
+    def to_arrow(self):
+        """
+        Export the table as a pyarrow Table.
+
+        Key columns become dictionary arrays over their codes, and missing
+        rates become nulls.
+
+        Returns:
+            pyarrow.Table: The table
+
+        Raises:
+            ValueError: If pyarrow is not installed
+        """
+        if not PYARROW_AVAILABLE:
+            raise ValueError("Exporting a rate table to Arrow requires pyarrow (pip install pyarrow)")
+        arrays = [pa.DictionaryArray.from_arrays(pa.array(self.key_codes[:, i]), pa.array(values.tolist(), pa.string()))
+                  for i, values in enumerate(self.key_values)]
+        names = list(self.key_names)
+        if self.plan_deduct is not None:
+            arrays.append(pa.array(self.plan_deduct.tolist(), pa.string()))
+            names.append('PlanDeduct')
+        for j, column in enumerate(self.columns):
+            arrays.append(pa.array(self.rate_column(j), mask=~self.mask[:, j]))
+            names.append(column)
+        return pa.Table.from_arrays(arrays, names=names)
+
+    def to_excel(self, output_file, sheet_name="Sheet1"):
+        """
+        Save the table to an Excel file.
+
+        Args:
+            output_file (str): Path to save the Excel file
+            sheet_name (str): Name of the sheet to save to
+        """
+        from data_processor import DataProcessor
+        DataProcessor().save_excel_file(self.to_dataframe(), output_file, sheet_name=sheet_name)
+
+    def _deductible_index(self, deductible, required=True):
+        """Column number of a deductible amount or DeductN name."""
+        amount = deductible_amount(deductible) or str(deductible)
+        try:
+            return self.deductibles.index(amount)
+        except ValueError:
+            if required:
+                raise ValueError(f"Rate table has no Deduct{amount} column")
+            return None
+
+    def __repr__(self):
+        return f"RateTable({len(self)} rows, keys={self.key_names}, deductibles={self.deductibles})"
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Synthetic Data module for Moxy Rates Template Transfer
+
+This module generates realistic Adjusted Rates workbooks of any size for
+benchmarks and load tests. Each rate group (coverage, term, mileage band,
+class and vehicle years) gets one row per deductible, in the long
+Deductible/RateCost layout that vendors send.
+"""
+
+import os
+import logging
+import numpy as np
+import pandas as pd
+
+from template_spec import STANDARD_TEMPLATE_COLUMNS
+
+DEFAULT_COVERAGES = ("Powertrain", "Powertrain Plus", "Gold", "Platinum", "Exclusionary")
+DEFAULT_TERMS = (12, 24, 36, 48, 60, 72, 84)
+DEFAULT_MILEAGE_BANDS = ((0, 12000), (0, 24000), (0, 36000), (0, 48000), (0, 60000),
+                         (0, 75000), (0, 100000), (0, 125000))
+DEFAULT_CLASSES = ("A", "B", "C", "D", "E", "F", "G", "H")
+DEFAULT_DEDUCTIBLES = (0, 50, 100, 200, 250, 500)
+
+# Model years used for the MinYear column; MaxYears is the covered vehicle age
+MODEL_YEARS = tuple(range(2010, 2026))
+MAX_VEHICLE_AGES = (3, 5, 7, 10, 12, 15)
+
+# Column order of the template file written by generate_template
+TEMPLATE_COLUMNS = STANDARD_TEMPLATE_COLUMNS
+
+
+def generate_adjusted_rates(rows, coverages=DEFAULT_COVERAGES, terms=DEFAULT_TERMS,
+                            mileage_bands=DEFAULT_MILEAGE_BANDS, classes=DEFAULT_CLASSES,
+                            deductibles=DEFAULT_DEDUCTIBLES, seed=0):
+    """
+    Generate an Adjusted Rates table in the long Deductible/RateCost layout.
+
+    Rate groups are enumerated over coverage, term, mileage band, class, model
+    year and vehicle age; once those combinations run out, a plan code suffix
+    keeps groups unique. Costs grow with term, mileage and class and fall with
+    the deductible, with a little noise, so the data compresses and sorts like
+    real vendor files.
+
+    Args:
+        rows: Number of rows to generate
+        coverages: Coverage names
+        terms: Terms in months
+        mileage_bands: (FromMiles, ToMiles) pairs
+        classes: Vehicle class codes
+        deductibles: Deductible amounts; each group gets one row per deductible
+        seed: Random seed (same seed and arguments give identical data)
+
+    Returns:
+        DataFrame: Generated adjusted rates
+    """
+    rng = np.random.default_rng(seed)
+    deductibles = np.asarray(deductibles)
+    group_count = -(-rows // len(deductibles))
+
+    # Mixed-radix decomposition of the group index into its dimensions
+    dims = [len(coverages), len(terms), len(mileage_bands), len(classes),
+            len(MODEL_YEARS), len(MAX_VEHICLE_AGES)]
+    index = np.arange(group_count)
+    parts = []
+    remainder = index
+    for size in dims:
+        parts.append(remainder % size)
+        remainder = remainder // size
+    coverage_idx, term_idx, band_idx, class_idx, year_idx, age_idx = parts
+    plan_suffix = remainder
+
+    bands = np.asarray(mileage_bands)
+    term_values = np.asarray(terms)[term_idx]
+    from_miles = bands[band_idx, 0]
+    to_miles = bands[band_idx, 1]
+
+    base_cost = (150.0
+                 + 60.0 * coverage_idx
+                 + 4.5 * term_values
+                 + 0.004 * to_miles
+                 + 45.0 * class_idx
+                 + rng.normal(0, 15, group_count))
+
+    groups = pd.DataFrame({
+        'Coverage': np.asarray(coverages, dtype=object)[coverage_idx],
+        'Term': term_values,
+        'Miles': to_miles,
+        'FromMiles': from_miles,
+        'ToMiles': to_miles,
+        'Class': np.asarray(classes, dtype=object)[class_idx],
+        'MinYear': np.asarray(MODEL_YEARS)[year_idx],
+        'MaxYears': np.asarray(MAX_VEHICLE_AGES)[age_idx],
+        'PlanCode': np.char.add('P', plan_suffix.astype(str)).astype(object)
+    })
+
+    # One row per deductible, cheaper as the deductible rises
+    df = groups.loc[groups.index.repeat(len(deductibles))].reset_index(drop=True)
+    deductible_column = np.tile(deductibles, group_count)
+    discount = 1.0 - 0.0009 * deductible_column
+    df['Deductible'] = deductible_column
+    df['RateCost'] = np.round(np.repeat(base_cost, len(deductibles)) * discount, 2)
+
+    return df.iloc[:rows].reset_index(drop=True)
+
+
+def write_workbook(df, file_path, sheet_name="Dealer Cost Rates"):
+    """
+    Write a DataFrame to an Excel workbook, using the fastest available engine.
+
+    Args:
+        df: DataFrame to write
+        file_path: Path of the workbook
+        sheet_name: Sheet name
+
+    Returns:
+        str: Path of the workbook
+    """
+    directory = os.path.dirname(file_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    try:
+        import xlsxwriter
+    except ImportError:
+        xlsxwriter = None
+
+    if xlsxwriter is None:
+        df.to_excel(file_path, sheet_name=sheet_name, index=False, engine='openpyxl')
+    else:
+        # constant_memory streams finished rows to disk, which matters at a
+        # million rows; it only works when rows are written in order, so the
+        # rows are written here rather than through DataFrame.to_excel
+        workbook = xlsxwriter.Workbook(file_path, {'constant_memory': True})
+        try:
+            worksheet = workbook.add_worksheet(sheet_name)
+            worksheet.write_row(0, 0, [str(col) for col in df.columns])
+            for row_number, values in enumerate(df.itertuples(index=False, name=None), start=1):
+                worksheet.write_row(row_number, 0, values)
+        finally:
+            workbook.close()
+
+    logging.info(f"Wrote {len(df)} rows to {file_path}")
+    return file_path
+
+
+def generate_template(file_path, columns=TEMPLATE_COLUMNS, sheet_name="Sheet1"):
+    """
+    Write an empty template workbook with the given header.
+
+    Args:
+        file_path: Path of the workbook
+        columns: Template header
+        sheet_name: Sheet name
+
+    Returns:
+        str: Path of the workbook
+    """
+    return write_workbook(pd.DataFrame(columns=list(columns)), file_path, sheet_name=sheet_name)
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Template Specification module for Moxy Rates Template Transfer
+
+This module describes the template sheet that output is written in: its
+columns in sheet order, its deductible columns, and the default value and
+output type of every column. It is built once from the real template header
+and handed to every stage (mapping, transform, PlanDeduct and integration),
+so that no stage keeps its own list of template columns.
+
+Specifications read from a file are cached by the file's path, size and
+modification time, so a template is read once however often it is used.
+"""
+
+import os
+import logging
+import threading
+from collections import OrderedDict
+
+import openpyxl
+import pandas as pd
+
+from rate_table import deductible_amount
+from prefetch import file_signature
+
+# Header of the standard template, used when no template header is available
+STANDARD_TEMPLATE_COLUMNS = (
+    'CompanyCode', 'Term', 'Miles', 'FromMiles', 'ToMiles', 'Coverage', 'State', 'Class',
+    'PlanDeduct', 'Deduct0', 'Deduct50', 'Deduct100', 'Deduct200', 'Deduct250', 'Deduct500',
+    'Markup', 'New/Used', 'MaxYears', 'SurchargeCode', 'PlanCode', 'RateCardCode',
+    'ClassListCode', 'MinYear', 'IncScCode', 'IncScAmt'
+)
+
+# Fields that are always mapped, whether or not the template has them
+ESSENTIAL_FIELDS = ('CompanyCode', 'Term', 'Miles', 'FromMiles', 'ToMiles', 'Coverage', 'State', 'Class',
+                    'PlanDeduct')
+
+# Number of template specifications kept by from_file
+MAX_CACHED_SPECS = 32
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+# The standard TemplateSpec, created on first use
+_standard = {}
+
+
+def extract_required_fields(template_columns):
+    """
+    Extract the fields to map from template columns.
+
+    Deductible columns are filled by the pivot and PlanDeduct is computed, so
+    neither is mapped from the source; the essential fields always are.
+
+    Args:
+        template_columns: List or pandas Index of column names from template
+
+    Returns:
+        list: Required fields for mapping
+    """
+    required_fields = []
+    deductible_columns = []
+    template_columns = list(template_columns)
+    logging.info(f"Extracting required fields from {len(template_columns)} template columns")
+
+    for col in template_columns:
+        col_str = str(col).lower()
+        # Special handling for deductible columns (Deduct0, Deduct50, etc.)
+        if col_str.startswith('deduct'):
+            deductible_columns.append(col)
+            continue
+        # Skip PlanDeduct as it's handled separately
+        if col_str == 'plandeduct':
+            continue
+        required_fields.append(col)
+
+    lower_fields = [str(field).lower() for field in required_fields]
+    for essential_col in ESSENTIAL_FIELDS:
+        if essential_col.lower() not in lower_fields:
+            required_fields.append(essential_col)
+
+    logging.info(f"Extracted {len(required_fields)} required fields from template")
+    logging.info(f"Found {len(deductible_columns)} deductible columns that will be auto-populated")
+    return required_fields
+
+
+def read_header_row(template_file, sheet_name=None):
+    """
+    Read the cells of the first row of a template sheet as they are written.
+
+    Unlike reading the header with pandas, blank cells are not renamed to
+    ``Unnamed: N`` and repeated names are not suffixed with ``.1``.
+
+    Args:
+        template_file: Path to the Template Excel file
+        sheet_name: Sheet name in the template (first sheet if None)
+
+    Returns:
+        tuple: (sheet name, list of cell values; None for blank cells)
+    """
+    if os.fspath(template_file).lower().endswith('.xls'):
+        # openpyxl cannot read .xls; without a header row pandas keeps the cells as they are
+        with pd.ExcelFile(template_file) as xls:
+            resolved_sheet = sheet_name or xls.sheet_names[0]
+            row = xls.parse(resolved_sheet, header=None, nrows=1)
+        cells = [None if pd.isna(value) else value for value in row.iloc[0]] if len(row) else []
+        return resolved_sheet, cells
+
+    workbook = openpyxl.load_workbook(template_file, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+        # The stored dimension can be wrong; read the row as far as it goes
+        sheet.reset_dimensions()
+        row = next(sheet.iter_rows(min_row=1, max_row=1, values_only=True), ())
+        return sheet.title, list(row)
+    finally:
+        workbook.close()
+
+
+def header_columns(cells):
+    """
+    Turn the cells of a header row into template column names.
+
+    Names are text; whole numbers are written without decimals. A blank cell
+    names no field, so its column is left out of the template (with a warning
+    unless it only follows the last named column). A repeated name would make
+    the output columns ambiguous, so only its first column is kept and the
+    repeats are logged.
+
+    Args:
+        cells: Values of the header row, in sheet order
+
+    Returns:
+        list: Column names, in sheet order
+    """
+    names = []
+    for value in cells:
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        # A cell of only spaces is as blank as an empty one
+        names.append('' if value is None or not str(value).strip() else str(value))
+    while names and not names[-1]:
+        names.pop()
+
+    columns = []
+    blank = []
+    repeated = []
+    for position, name in enumerate(names, start=1):
+        if not name:
+            blank.append(position)
+        elif name in columns:
+            repeated.append(name)
+        else:
+            columns.append(name)
+    if blank:
+        logging.warning(f"Template header has blank cells in columns {', '.join(map(str, blank))}; "
+                        f"those columns are left out of the output")
+    if repeated:
+        logging.warning(f"Template header repeats {', '.join(sorted(set(repeated)))}; "
+                        f"only the first column of each name is used")
+    return columns
+
+
+class TemplateSpec:
+    """Column layout of the template sheet that output is written in."""
+
+    def __init__(self, columns, sheet_name=None, file_path=None):
+        """
+        Initialize the template specification.
+
+        Args:
+            columns: Template header, in sheet order
+            sheet_name: Name of the template sheet
+            file_path: Path of the template file the header came from (optional)
+        """
+        self.columns = tuple(columns)
+        self.sheet_name = sheet_name
+        self.file_path = file_path
+        self.required_fields = tuple(extract_required_fields(self.columns))
+
+        # DeductN columns in amount order; PlanDeduct is not one of them
+        self.deductible_columns = tuple(sorted((col for col in self.columns if deductible_amount(col) is not None),
+                                               key=lambda col: int(deductible_amount(col))))
+        self.deductibles = tuple(deductible_amount(col) for col in self.deductible_columns)
+
+        # Other columns before and after the block of deductible columns
+        positions = [i for i, col in enumerate(self.columns) if col in self.deductible_columns]
+        split = positions[0] if positions else len(self.columns)
+        self.leading_columns = tuple(col for col in self.columns[:split] if col not in self.deductible_columns)
+        self.trailing_columns = tuple(col for col in self.columns[split:] if col not in self.deductible_columns)
+
+    @classmethod
+    def standard(cls):
+        """
+        Get the specification of the standard template.
+
+        Returns:
+            TemplateSpec: Specification of STANDARD_TEMPLATE_COLUMNS
+        """
+        if "spec" not in _standard:
+            _standard["spec"] = cls(STANDARD_TEMPLATE_COLUMNS)
+        return _standard["spec"]
+
+    @classmethod
+    def from_file(cls, template_file, sheet_name=None):
+        """
+        Read the template header without loading any data rows.
+
+        The header is the first row of the sheet as written (see header_columns
+        for blank and repeated names). The result is cached until the file changes on disk.
+
+        Args:
+            template_file: Path to the Template Excel file
+            sheet_name: Sheet name in the template (first sheet if None)
+
+        Returns:
+            TemplateSpec: Specification of the template sheet
+        """
+        signature = file_signature(template_file)
+        key = (signature, sheet_name)
+        if signature is not None:
+            with _cache_lock:
+                spec = _cache.get(key)
+                if spec is not None:
+                    _cache.move_to_end(key)
+                    return spec
+
+        resolved_sheet, cells = read_header_row(template_file, sheet_name)
+        columns = header_columns(cells)
+        spec = cls(columns, sheet_name=resolved_sheet, file_path=template_file)
+        logging.info(f"Read template header of {template_file} ({len(columns)} columns, "
+                     f"deductibles {', '.join(spec.deductibles) or 'none'})")
+
+        if signature is not None:
+            with _cache_lock:
+                _cache[key] = spec
+                while len(_cache) > MAX_CACHED_SPECS:
+                    _cache.popitem(last=False)
+        return spec
+
+    @classmethod
+    def from_template(cls, template):
+        """
+        Get the specification of a template given in any of the usual forms.
+
+        Args:
+            template: TemplateSpec, path to the template file (first sheet),
+                DataFrame with the template columns, list of column names, or
+                None for the standard template
+
+        Returns:
+            TemplateSpec: The specification (the standard one if the template has no header)
+        """
+        if isinstance(template, TemplateSpec):
+            return template
+        if template is None:
+            return cls.standard()
+        if isinstance(template, (str, os.PathLike)):
+            spec = cls.from_file(template)
+        elif hasattr(template, 'columns'):
+            spec = cls(list(template.columns))
+        else:
+            spec = cls(list(template))
+        if not spec.columns:
+            logging.info("Template has no header, using the standard template columns")
+            return cls.standard()
+        return spec
+
+    def __repr__(self):
+        return f"TemplateSpec({len(self.columns)} columns, sheet={self.sheet_name!r}, file={self.file_path!r})"
@@ -0,0 +1,22 @@
+"""Shared fixtures for the Moxy Rates Template Transfer tests."""
+
+import os
+import sys
+
+import pytest
+
+# The application modules live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def long_rates():
+    """Adjusted rates in the long layout: one row per group and deductible."""
+    import pandas as pd
+    return pd.DataFrame({
+        'Coverage': ['Basic', 'Basic', 'Basic', 'Premium', 'Premium', 'Premium'],
+        'Term': [12, 12, 12, 24, 24, 24],
+        'Class': ['A', 'A', 'A', 'C', 'C', 'C'],
+        'Deductible': [0, 100, 250, 0, 100, 250],
+        'RateCost': [120, 100, 80, 300, 250, 200],
+    })
@@ -0,0 +1,41 @@
+"""Tests for the memory figures used by the benchmark regression gate."""
+
+import numpy as np
+
+from benchmark import compare_results, summarize_runs
+from pipeline_metrics import RunMetrics
+
+
+def test_stage_peak_rss_includes_memory_freed_before_the_stage_ends():
+    metrics = RunMetrics(sample_rss=True)
+    with metrics.stage("transform"):
+        block = np.ones(200 * 1024 * 1024 // 8)
+        block.sum()
+        del block
+    metrics.finish()
+
+    record = metrics.stages[0]
+    assert record.rss_peak - max(record.rss_start, record.rss_end) > 100 * 1024 * 1024
+    result = summarize_runs(1000, [metrics])[0]
+    assert result["rss_peak_mb"] * 1024 * 1024 >= record.rss_peak - 1024 * 1024
+
+
+def _document(rss_peak_mb, rss_sampled=True):
+    settings = {"sizes": [1000], "repeat": 1, "seed": 0, "track_memory": False}
+    if rss_sampled:
+        settings["rss_sampled"] = True
+    return {"settings": settings, "results": [{
+        "rows": 1000, "stage": "transform", "wall_seconds_median": 1.0, "wall_seconds_iqr": 0.0,
+        "rss_peak_mb": rss_peak_mb, "traced_peak_mb": None}]}
+
+
+def test_compare_flags_rss_peak_growth():
+    comparison = compare_results(_document(100.0), _document(300.0))[0]
+    assert comparison["memory_metric"] == "rss_peak_mb"
+    assert comparison["regressions"]
+
+
+def test_compare_skips_rss_of_unsampled_baselines():
+    comparison = compare_results(_document(100.0, rss_sampled=False), _document(300.0))[0]
+    assert comparison["memory_metric"] is None
+    assert not comparison["regressions"]
@@ -0,0 +1,229 @@
+"""Tests for the pivot, PlanDeduct and unpivot steps of data_processor."""
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+
+import parallel_transform
+from data_processor import DataProcessor
+from out_of_core import ChunkedTransformer
+from rate_table import RateTable
+from synthetic_data import generate_adjusted_rates
+from template_spec import STANDARD_TEMPLATE_COLUMNS
+
+LONG_MAPPING = {'Coverage': 'Coverage', 'Term': 'Term', 'Class': 'Class',
+                'Deductible': 'Deductible', 'RateCost': 'RateCost'}
+
+
+def _rates(df, columns):
+    """Rows of the given columns as lists, for comparing with expected values."""
+    return df[columns].values.tolist()
+
+
+def _mapping(df):
+    mapping = {col: col for col in df.columns if col not in ('Deductible', 'RateCost')}
+    mapping.update(Deductible='Deductible', RateCost='RateCost')
+    return mapping
+
+
+@pytest.fixture
+def processor():
+    return DataProcessor()
+
+
+class TestTransformData:
+    def test_long_layout_is_pivoted_one_row_per_group(self, processor, long_rates):
+        result = processor.transform_data(long_rates, dict(LONG_MAPPING))
+
+        assert _rates(result, ['Coverage', 'Term', 'Class', 'Deduct0', 'Deduct100', 'Deduct250']) == [
+            ['Basic', '12', 'A', 120, 100, 80],
+            ['Premium', '24', 'C', 300, 250, 200]]
+        # Group columns, deductible columns by amount, then the other template columns
+        assert list(result.columns[:3]) == ['Coverage', 'Term', 'Class']
+        deduct_cols = [col for col in result.columns if col.startswith('Deduct') and col[6:].isdigit()]
+        assert deduct_cols == sorted(deduct_cols, key=lambda col: int(col[6:]))
+
+    def test_same_result_as_the_row_by_row_pivot(self, processor):
+        # Expected values are those of the original row-by-row pivot, which
+        # also wrote group keys as text
+        source = pd.DataFrame({
+            'Coverage': ['Basic', 'Basic', 'Basic', 'Premium', 'Premium', 'Gold', 'Gold', 'Basic', 'Basic'],
+            'Term': [12, 12, 12, 24, 24, 36, 36, 48, 12],
+            'Class': ['A', 'A', 'A', 'C', 'C', 'D', 'D', 'B', 'A'],
+            'Deductible': [0, 100, 250, 0, 100, '$250', '', 0, 'none'],
+            'RateCost': [120, 100, 80, 300.5, 250, 90, 95, np.nan, 1],
+        })
+
+        result = processor.transform_data(source, dict(LONG_MAPPING))
+
+        assert _rates(result, ['Coverage', 'Term', 'Class', 'Deduct0', 'Deduct100', 'Deduct250']) == [
+            ['Basic', '12', 'A', 120.0, 100.0, 80.0],
+            ['Premium', '24', 'C', 300.5, 250.0, ''],
+            ['Gold', '36', 'D', '', '', 90.0],
+            # A deductible without a rate still creates its group
+            ['Basic', '48', 'B', '', '', '']]
+
+    def test_last_duplicate_rate_wins(self, processor):
+        source = pd.DataFrame({'Coverage': ['Basic', 'Basic'], 'Deductible': [100, '100'], 'RateCost': [1, 2]})
+
+        result = processor.transform_data(source, {'Coverage': 'Coverage', 'Deductible': 'Deductible',
+                                                   'RateCost': 'RateCost'})
+
+        assert _rates(result, ['Coverage', 'Deduct100']) == [['Basic', 2]]
+
+    def test_wide_layout_is_mapped_without_pivoting(self, processor):
+        source = pd.DataFrame({'Coverage': ['Basic', 'Premium', None], 'Term': [12, 24, None],
+                               'Deduct0': [120, 300, None], 'Deduct 100': [100, np.nan, None]})
+
+        result = processor.transform_data(source, {'Coverage': 'Coverage', 'Term': 'Term'})
+
+        # The blank row has no rate and is dropped; missing rates become ''
+        assert _rates(result, ['Coverage', 'Term', 'Deduct0', 'Deduct100']) == [
+            ['Basic', 12.0, 120.0, 100.0],
+            ['Premium', 24.0, 300.0, '']]
+
+    def test_text_rates_are_kept_as_read(self, processor):
+        source = pd.DataFrame({'Coverage': ['Basic', 'Basic'], 'Deductible': [0, 100], 'RateCost': ['N/A', 95]})
+
+        result = processor.transform_data(source, {'Coverage': 'Coverage', 'Deductible': 'Deductible',
+                                                   'RateCost': 'RateCost'})
+
+        assert _rates(result, ['Coverage', 'Deduct0', 'Deduct100']) == [['Basic', 'N/A', 95]]
+
+    def test_fixed_point_rates_are_written_with_two_decimals(self, processor):
+        processor.rate_decimals = 2
+        source = pd.DataFrame({'Coverage': ['Basic', 'Basic', 'Premium'], 'Deductible': [0, 100, 0],
+                               'RateCost': [120, 99.999, 300.5]})
+
+        result = processor.transform_data(source, {'Coverage': 'Coverage', 'Deductible': 'Deductible',
+                                                   'RateCost': 'RateCost'})
+
+        assert _rates(result, ['Coverage', 'Deduct0', 'Deduct100']) == [
+            ['Basic', '120.00', '100.00'],
+            ['Premium', '300.50', '']]
+
+    def test_fixed_point_wide_rates(self, processor):
+        processor.rate_decimals = 2
+        source = pd.DataFrame({'Coverage': ['Basic'], 'Deduct0': [120], 'Deduct100': [99.5]})
+
+        result = processor.transform_data(source, {'Coverage': 'Coverage'})
+
+        assert _rates(result, ['Deduct0', 'Deduct100']) == [['120.00', '99.50']]
+
+    def test_rate_table_matches_the_dataframe(self, processor, long_rates):
+        table = processor.transform_to_rate_table(long_rates, dict(LONG_MAPPING))
+        df = processor.transform_data(long_rates, dict(LONG_MAPPING))
+
+        assert isinstance(table, RateTable)
+        assert table.lookup(('Premium', '24', 'C'), '100') == 250
+        pd.testing.assert_frame_equal(table.to_dataframe()[table.columns], df[table.columns])
+
+
+class TestUnpivot:
+    def test_round_trip_restores_the_long_rates(self, processor, long_rates):
+        wide = processor.transform_data(long_rates, dict(LONG_MAPPING))
+
+        long = processor.unpivot_data(wide)
+
+        assert _rates(long, ['Coverage', 'Term', 'Class', 'Deductible', 'RateCost']) == \
+            _rates(long_rates.astype({'Term': str}), ['Coverage', 'Term', 'Class', 'Deductible', 'RateCost'])
+
+    def test_empty_cells_are_dropped(self, processor):
+        wide = pd.DataFrame({'Coverage': ['Basic', 'Premium'], 'Deduct100': ['', 250], 'Deduct0': [120, np.nan]})
+
+        long = processor.unpivot_data(wide)
+
+        assert _rates(long, ['Coverage', 'Deductible', 'RateCost']) == [['Basic', 0, 120], ['Premium', 100, 250]]
+
+    def test_rate_table_round_trip(self, processor, long_rates):
+        table = processor.transform_to_rate_table(long_rates, dict(LONG_MAPPING))
+
+        long = processor.unpivot_data(table)
+
+        assert _rates(long, ['Deductible', 'RateCost']) == _rates(long_rates, ['Deductible', 'RateCost'])
+
+    def test_data_without_deductible_columns_is_rejected(self, processor):
+        with pytest.raises(ValueError):
+            processor.unpivot_data(pd.DataFrame({'Coverage': ['Basic']}))
+
+
+class TestPlanDeduct:
+    @pytest.fixture
+    def pivoted(self):
+        return pd.DataFrame({
+            'Coverage': ['Basic', 'Basic', 'Basic', 'Basic', 'Basic', 'Basic'],
+            'Class': ['A', 'C', 'd', 'B', 'B', 'C'],
+            'Deduct0': [10, 20, '', 40, '', ''],
+            'Deduct100': [11, 21, 31, '', '', ''],
+            'Deduct250': [12, 22, 32, 42, 52, ''],
+        })
+
+    def _plan_deduct(self, processor, pivoted, default_deductible):
+        processor.default_deductible = default_deductible
+        frame = processor._add_plan_deduct_column(pivoted.copy())['PlanDeduct'].tolist()
+        table = processor._add_plan_deduct_column(RateTable.from_dataframe(pivoted)).plan_deduct.tolist()
+        assert frame == table
+        return frame
+
+    def test_default_deductible_wins_when_the_row_has_its_rate(self, processor, pivoted):
+        assert self._plan_deduct(processor, pivoted, "250") == ['250', '250', '250', '250', '250', None]
+
+    def test_classes_c_and_d_take_their_lowest_rate(self, processor, pivoted):
+        # Class C/D rows without a rate for the default deductible take their
+        # lowest deductible; other rows take 100, else their lowest
+        assert self._plan_deduct(processor, pivoted, "500") == ['100', '0', '100', '0', '250', None]
+
+    def test_missing_default_deductible_rates(self, processor, pivoted):
+        assert self._plan_deduct(processor, pivoted, "100") == ['100', '100', '100', '0', '250', None]
+
+
+class TestEquivalence:
+    @pytest.fixture
+    def source(self):
+        df = generate_adjusted_rates(3000, seed=1)
+        rng = np.random.default_rng(1)
+        # Shuffled rows and some missing or whole-number rates, so partitions differ
+        df = df.iloc[rng.permutation(len(df))].reset_index(drop=True)
+        df.loc[rng.random(len(df)) < 0.05, 'RateCost'] = np.nan
+        whole = df['Coverage'] == df['Coverage'].iloc[0]
+        df['RateCost'] = df['RateCost'].astype(object)
+        df.loc[whole, 'RateCost'] = df.loc[whole, 'RateCost'].map(lambda cost: cost if pd.isna(cost) else int(cost))
+        return df
+
+    def test_parallel_transform_matches_single_process(self, processor, source, monkeypatch):
+        monkeypatch.setitem(parallel_transform._defaults, "min_rows", 0)
+        expected = processor.transform_data(source.copy(), _mapping(source))
+        expected = processor._add_plan_deduct_column(expected)
+
+        result = parallel_transform.transform_parallel(source.copy(), _mapping(source), workers=2,
+                                                       add_plan_deduct=True)
+
+        pd.testing.assert_frame_equal(result, expected)
+
+    def test_out_of_core_transform_matches_in_memory(self, processor, source, tmp_path):
+        path = tmp_path / "rates.xlsx"
+        source.to_excel(path, sheet_name="Rates", index=False)
+        loaded = processor.load_excel_file(str(path), "Rates")
+        expected = processor.transform_data(loaded, _mapping(source))
+
+        transformer = ChunkedTransformer(spill_dir=str(tmp_path))
+        transformer.plan = lambda row_count, column_count: (500, 4)
+        result = transformer.transform(str(path), "Rates", _mapping(source))
+
+        assert transformer.partition_count == 4
+        pd.testing.assert_frame_equal(result, expected)
+
+
+class TestSaveExcelFile:
+    def test_header_wider_than_26_columns(self, processor, tmp_path):
+        # The standard template with two more deductibles has 27 columns
+        columns = list(STANDARD_TEMPLATE_COLUMNS) + ['Deduct150', 'Deduct1000']
+        df = pd.DataFrame([[f"{col} value" for col in columns]], columns=columns)
+        path = tmp_path / "wide.xlsx"
+
+        processor.save_excel_file(df, str(path))
+
+        worksheet = openpyxl.load_workbook(path).active
+        assert [cell.value for cell in worksheet[1]] == columns
+        assert worksheet.column_dimensions['AA'].width == len('Deduct1000 value') + 2
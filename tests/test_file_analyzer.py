@@ -0,0 +1,31 @@
+"""Tests for workbook profiling in file_analyzer."""
+
+import pandas as pd
+
+from file_analyzer import FileAnalyzer
+
+
+def test_analyze_workbook_picks_rate_sheet(tmp_path, long_rates):
+    path = tmp_path / "rates.xlsx"
+    rates = pd.concat([long_rates] * 20, ignore_index=True)
+    with pd.ExcelWriter(path) as writer:
+        pd.DataFrame({'Notes': ['Rates effective 2025']}).to_excel(writer, sheet_name="Cover", index=False)
+        rates.to_excel(writer, sheet_name="Dealer Cost Rates", index=False)
+        pd.DataFrame({'Class': ['A', 'C'], 'Description': ['Cars', 'Trucks']}).to_excel(
+            writer, sheet_name="Classes", index=False)
+
+    analysis = FileAnalyzer().analyze_workbook(str(path))
+
+    assert analysis["sheet_names"] == ["Cover", "Dealer Cost Rates", "Classes"]
+    assert analysis["main_sheet"] == "Dealer Cost Rates"
+    assert analysis["sheets"]["Dealer Cost Rates"]["row_count"] == len(rates)
+
+
+def test_analyze_workbook_limits_sampled_rows(tmp_path, long_rates):
+    path = tmp_path / "rates.xlsx"
+    pd.concat([long_rates] * 20, ignore_index=True).to_excel(path, sheet_name="Rates", index=False)
+
+    analysis = FileAnalyzer().analyze_workbook(str(path), sample_rows=10)
+
+    assert analysis["sheets"]["Rates"]["sampled_rows"] == 10
+    assert analysis["sheets"]["Rates"]["row_count"] == 120
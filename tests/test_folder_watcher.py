@@ -0,0 +1,19 @@
+"""Tests for output naming in folder_watcher."""
+
+import os
+
+from folder_watcher import FolderWatcher
+
+
+def test_output_path_never_reuses_a_name(tmp_path):
+    watcher = FolderWatcher(str(tmp_path), "template.xlsx")
+    os.makedirs(watcher.output_dir)
+
+    first = watcher._output_path("rates.xlsx")
+    open(first, 'wb').close()
+    second = watcher._output_path("rates.xlsx")
+    third = watcher._output_path("rates.xlsx")
+
+    assert os.path.basename(first).startswith("rates_processed_")
+    assert len({first, second, third}) == 3
+    assert all(os.path.dirname(path) == watcher.output_dir for path in (first, second, third))
@@ -0,0 +1,150 @@
+"""Tests for crash recovery in job_queue."""
+
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+import job_queue
+from job_queue import JobQueue, batch_output_path, run_batch
+
+
+def _fake_conversion(delay=0.0, converted=None):
+    def convert(adjusted_file, template_file, output_file, **kwargs):
+        time.sleep(delay)
+        if converted is not None:
+            converted.append(os.path.basename(adjusted_file))
+        with open(output_file, 'wb') as f:
+            f.write(b"converted " + open(adjusted_file, 'rb').read())
+        return {"output_file": output_file, "rows_in": 1, "rows_out": 1, "mapping_signature": "sig"}
+    return convert
+
+
+def _dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def _inputs(tmp_path, count=2):
+    batch_dir = tmp_path / "batch"
+    batch_dir.mkdir()
+    paths = []
+    for i in range(count):
+        path = batch_dir / f"rates{i}.xlsx"
+        path.write_bytes(f"rates {i}".encode())
+        paths.append(str(path))
+    template = tmp_path / "template.xlsx"
+    template.write_bytes(b"template")
+    return batch_dir, paths, str(template)
+
+
+def test_rerun_after_crash_converts_the_interrupted_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "run_conversion", _fake_conversion())
+    batch_dir, inputs, template = _inputs(tmp_path)
+    output_dir = str(batch_dir / "output")
+    (batch_dir / "output").mkdir()
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+
+    # First run: the worker process died while converting the first file
+    for path in inputs:
+        queue.enqueue("batch", path, template, os.path.join(output_dir, os.path.basename(path)))
+    crashed_worker = f"{socket.gethostname()}:{_dead_pid()}:1"
+    assert queue.claim(crashed_worker, batch_id="batch") is not None
+
+    counts = run_batch(queue, inputs, template, output_dir, batch_id="batch", max_workers=1)
+
+    assert counts == {"done": 2}
+    assert all(job["worker_id"] != crashed_worker for job in queue.jobs("batch"))
+
+
+def test_claims_of_other_hosts_wait_for_the_lease(tmp_path):
+    _, inputs, template = _inputs(tmp_path, count=1)
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+    queue.enqueue("batch", inputs[0], template, str(tmp_path / "out.xlsx"))
+    queue.claim(f"other-host:{_dead_pid()}:1", batch_id="batch")
+
+    assert queue.reclaim_dead_workers("batch") == 0
+    assert queue.counts("batch") == {"claimed": 1}
+
+
+def test_exhausted_stale_claim_is_marked_failed(tmp_path):
+    _, inputs, template = _inputs(tmp_path, count=1)
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"), lease_seconds=0.01, max_attempts=1)
+    queue.enqueue("batch", inputs[0], template, str(tmp_path / "out.xlsx"))
+    queue.claim("other-host:1:1", batch_id="batch")
+    time.sleep(0.05)
+
+    assert queue.claim("other-host:2:1", batch_id="batch") is None
+    assert queue.counts("batch") == {"failed": 1}
+
+
+def test_long_conversion_keeps_its_lease(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "run_conversion", _fake_conversion(delay=1.0))
+    _, inputs, template = _inputs(tmp_path, count=1)
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"), lease_seconds=0.3)
+    queue.enqueue("batch", inputs[0], template, str(tmp_path / "out.xlsx"))
+
+    worker = threading.Thread(target=job_queue.run_worker, args=(queue, "batch", "host:1:1"))
+    worker.start()
+    time.sleep(0.6)
+    # The lease has run out twice over, but the heartbeat kept it alive
+    stolen = queue.claim("host:2:1", batch_id="batch")
+    worker.join()
+
+    assert stolen is None
+    assert queue.counts("batch") == {"done": 1}
+
+
+def test_rerun_reconverts_only_the_edited_input(tmp_path, monkeypatch):
+    converted = []
+    monkeypatch.setattr(job_queue, "run_conversion", _fake_conversion(converted=converted))
+    batch_dir, inputs, template = _inputs(tmp_path)
+    output_dir = str(batch_dir / "output")
+    os.makedirs(output_dir)
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+
+    assert run_batch(queue, inputs, template, output_dir, batch_id="batch", max_workers=1) == {"done": 2}
+    with open(inputs[0], 'ab') as f:
+        f.write(b" edited")
+    assert run_batch(queue, inputs, template, output_dir, batch_id="batch", max_workers=1) == {"done": 2}
+    for _ in range(2):
+        assert run_batch(queue, inputs, template, output_dir, batch_id="batch", max_workers=1) == {"done": 2}
+
+    assert converted == ["rates0.xlsx", "rates1.xlsx", "rates0.xlsx"]
+    assert len(queue.jobs("batch")) == 2
+    with open(batch_output_path(output_dir, inputs[0]), 'rb') as f:
+        assert f.read() == b"converted rates 0 edited"
+
+
+def test_inputs_with_the_same_name_get_their_own_output(tmp_path):
+    first = tmp_path / "east" / "rates.xlsx"
+    second = tmp_path / "west" / "rates.xlsx"
+
+    assert batch_output_path("out", str(first)) != batch_output_path("out", str(second))
+    assert batch_output_path("out", str(first)) == batch_output_path("out", str(first))
+    assert os.path.basename(batch_output_path("out", str(first))).startswith("rates_")
+
+
+def test_queue_files_keyed_on_the_checksum_are_migrated(tmp_path):
+    _, inputs, template = _inputs(tmp_path, count=1)
+    db_path = str(tmp_path / "jobs.sqlite")
+    old_schema = job_queue.SCHEMA.replace("UNIQUE (batch_id, adjusted_file)", job_queue.OLD_UNIQUE_KEY)
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript(old_schema)
+        for checksum in ("old", "new"):
+            conn.execute("INSERT INTO jobs (batch_id, adjusted_file, input_checksum, template_file, output_file, "
+                         "created_at) VALUES ('batch', ?, ?, ?, 'out.xlsx', 0)",
+                         (os.path.abspath(inputs[0]), checksum, template))
+    conn.close()
+
+    queue = JobQueue(db_path)
+
+    assert [job["input_checksum"] for job in queue.jobs("batch")] == ["new"]
+    # The changed input replaces the job instead of adding a second one
+    assert queue.enqueue("batch", inputs[0], template, "out.xlsx")
+    assert not queue.enqueue("batch", inputs[0], template, "out.xlsx")
+    assert len(queue.jobs("batch")) == 1
@@ -0,0 +1,72 @@
+"""Tests for upload lifetime in job_service."""
+
+import asyncio
+import json
+import os
+
+import job_service
+from job_service import JobService
+
+
+async def _request(port, method, target, body=b""):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write((f"{method} {target} HTTP/1.1\r\nHost: localhost\r\n"
+                  f"Content-Length: {len(body)}\r\n\r\n").encode('latin-1') + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(payload)
+
+
+def test_shared_template_upload_outlives_its_first_job(tmp_path, monkeypatch):
+    def fake_conversion(adjusted_file, template_file, output_file, **kwargs):
+        # Every job must still find both of its inputs
+        assert os.path.exists(adjusted_file) and os.path.exists(template_file)
+        with open(output_file, 'wb') as f:
+            f.write(b"converted")
+        return {"output_file": output_file, "rows_in": 1, "rows_out": 1}
+
+    monkeypatch.setattr(job_service, "run_conversion", fake_conversion)
+
+    async def scenario():
+        service = JobService(port=0, work_dir=str(tmp_path), max_workers=1, upload_ttl=3600)
+        await service.start()
+        port = service._server.sockets[0].getsockname()[1]
+        try:
+            _, template = await _request(port, "POST", "/uploads?name=template.xlsx", b"template")
+            job_ids = []
+            for i in range(3):
+                _, rates = await _request(port, "POST", f"/uploads?name=rates{i}.xlsx", b"rates")
+                status, job = await _request(port, "POST", "/jobs", json.dumps({
+                    "adjusted_upload": rates["upload_id"],
+                    "template_upload": template["upload_id"]}).encode())
+                assert status == 202
+                job_ids.append(job["job_id"])
+            await service._queue.join()
+
+            assert [service.jobs[job_id].status for job_id in job_ids] == ["done"] * 3
+            # Released uploads are kept until they expire
+            template_path = service.uploads[template["upload_id"]].path
+            assert os.path.exists(template_path)
+            assert all(upload.refs == 0 for upload in service.uploads.values())
+
+            assert service.expire_uploads() == 0
+            assert service.expire_uploads(now=service.uploads[template["upload_id"]].idle_since + 3600) == 4
+            assert not os.path.exists(template_path)
+            assert service.uploads == {}
+        finally:
+            await service.stop()
+
+    asyncio.run(scenario())
+
+
+def test_referenced_upload_is_not_expired(tmp_path):
+    service = JobService(work_dir=str(tmp_path), upload_ttl=0)
+    path = tmp_path / "template.xlsx"
+    path.write_bytes(b"template")
+    service.uploads["a"] = job_service.Upload("a", str(path))
+    service.uploads["a"].refs = 1
+
+    assert service.expire_uploads() == 0
+    assert path.exists()
@@ -0,0 +1,91 @@
+"""Tests for log compression and the dropping queue handler in log_pipeline."""
+
+import gzip
+import logging
+import queue
+
+from log_pipeline import CompressingRotatingFileHandler, DroppingQueueHandler, compress_old_logs
+
+
+def test_compress_old_logs(tmp_path):
+    (tmp_path / "app_20250313.log").write_text("previous day\n")
+    (tmp_path / "app_20250312.log").write_text("already compressed\n")
+    (tmp_path / "app_20250312.log.gz").write_bytes(gzip.compress(b"previous day\n"))
+    (tmp_path / "app_20250314.log").write_text("active\n")
+    (tmp_path / "app_20250314.log.2").write_text("interrupted rotation\n")
+    (tmp_path / "app_20250314.log.1").write_text("segment\n")
+    (tmp_path / "app_20250314.log.1.gz").write_bytes(gzip.compress(b"newer segment\n"))
+    (tmp_path / "notes.log.1").write_text("not ours\n")
+    (tmp_path / "app.log").write_text("not ours\n")
+
+    assert compress_old_logs(str(tmp_path), str(tmp_path / "app_20250314.log"), idle_seconds=0) == 2
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "app.log", "app_20250312.log", "app_20250312.log.gz", "app_20250313.log.gz", "app_20250314.log",
+        "app_20250314.log.1", "app_20250314.log.1.gz", "app_20250314.log.2.gz", "notes.log.1"]
+    assert gzip.decompress((tmp_path / "app_20250313.log.gz").read_bytes()) == b"previous day\n"
+    assert gzip.decompress((tmp_path / "app_20250314.log.2.gz").read_bytes()) == b"interrupted rotation\n"
+    assert gzip.decompress((tmp_path / "app_20250314.log.1.gz").read_bytes()) == b"newer segment\n"
+
+
+def test_recently_written_daily_logs_are_kept(tmp_path):
+    # For example the log of a watch daemon started on an earlier day
+    (tmp_path / "app_20250313.log").write_text("still written\n")
+
+    assert compress_old_logs(str(tmp_path), str(tmp_path / "app_20250314.log")) == 0
+    assert [path.name for path in tmp_path.iterdir()] == ["app_20250313.log"]
+
+
+def test_rotated_segments_are_compressed(tmp_path):
+    log_file = tmp_path / "app_20250314.log"
+    handler = CompressingRotatingFileHandler(str(log_file), max_bytes=200, backup_count=2)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    try:
+        for i in range(20):
+            handler.emit(logging.LogRecord("test", logging.INFO, __file__, 0, f"record {i:02d} " + "x" * 20,
+                                           None, None))
+    finally:
+        handler.close()
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "app_20250314.log", "app_20250314.log.1.gz", "app_20250314.log.2.gz"]
+    assert b"record" in gzip.decompress((tmp_path / "app_20250314.log.1.gz").read_bytes())
+
+
+class _CountingMessage:
+    """Log message that counts how often it is formatted."""
+
+    def __init__(self):
+        self.formatted = 0
+
+    def __str__(self):
+        self.formatted += 1
+        return "message"
+
+
+def _record(level, msg):
+    return logging.LogRecord("test", level, __file__, 0, msg, None, None)
+
+
+def test_dropped_records_are_not_formatted():
+    log_queue = queue.Queue(maxsize=10)
+    handler = DroppingQueueHandler(log_queue, sample_every=5)
+    for _ in range(8):
+        log_queue.put_nowait(_record(logging.INFO, "queued"))
+
+    # Above the watermark one record in five is kept
+    sampled = [_CountingMessage() for _ in range(5)]
+    for msg in sampled:
+        handler.emit(_record(logging.INFO, msg))
+    assert [msg.formatted for msg in sampled] == [0, 0, 0, 0, 1]
+    # The kept record is followed by a summary of the four dropped ones
+    messages = [log_queue.get_nowait().getMessage() for _ in range(log_queue.qsize())]
+    assert messages[-2:] == ["message", "Log buffer full: dropped 4 log records"]
+
+    # A full queue drops INFO records without formatting them
+    for _ in range(10):
+        log_queue.put_nowait(_record(logging.INFO, "queued"))
+    dropped = _CountingMessage()
+    handler.emit(_record(logging.INFO, dropped))
+    assert dropped.formatted == 0
+    assert handler.dropped == 1
@@ -0,0 +1,58 @@
+"""Tests for the chunked long-format export."""
+
+import openpyxl
+import pandas as pd
+import pytest
+
+from long_export import export_long
+
+
+@pytest.fixture
+def template():
+    # The first two rows have no rates, so the first chunks unpivot to nothing
+    return pd.DataFrame({'Coverage': ['Basic', 'Gold', 'Premium', 'Gold'], 'Term': ['12', '24', '36', '48'],
+                         'Deduct100': ['', '', 250, ''], 'Deduct0': ['', '', 300, 90]})
+
+
+def _csv_lines(path):
+    with open(path, encoding="utf-8") as handle:
+        return handle.read().splitlines()
+
+
+def test_csv_header_is_written_once_after_empty_chunks(template, tmp_path):
+    path = str(tmp_path / "long.csv")
+
+    assert export_long(template, path, chunk_rows=1) == 3
+
+    assert _csv_lines(path) == ['Coverage,Term,Deductible,RateCost', 'Premium,36,0,300',
+                                'Premium,36,100,250', 'Gold,48,0,90']
+
+
+def test_csv_header_is_written_without_rates(template, tmp_path):
+    path = str(tmp_path / "long.csv")
+
+    assert export_long(template.iloc[:2], path, chunk_rows=1) == 0
+    assert _csv_lines(path) == ['Coverage,Term,Deductible,RateCost']
+
+    assert export_long(template.iloc[:0], path) == 0
+    assert _csv_lines(path) == ['Coverage,Term,Deductible,RateCost']
+
+
+def test_workbook_header_is_written_once_after_empty_chunks(template, tmp_path):
+    path = str(tmp_path / "long.xlsx")
+
+    assert export_long(template, path, chunk_rows=1) == 3
+
+    rows = list(openpyxl.load_workbook(path)["Rates"].iter_rows(values_only=True))
+    assert rows[0] == ('Coverage', 'Term', 'Deductible', 'RateCost')
+    assert len(rows) == 4
+
+
+def test_header_only_workbook_exports_the_header(template, tmp_path):
+    source = str(tmp_path / "template.xlsx")
+    template.iloc[:0].to_excel(source, index=False)
+    path = str(tmp_path / "long.csv")
+
+    assert export_long(source, path) == 0
+
+    assert _csv_lines(path) == ['Coverage,Term,Deductible,RateCost']
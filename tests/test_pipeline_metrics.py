@@ -0,0 +1,50 @@
+"""Tests for memory tracing in pipeline_metrics."""
+
+import tracemalloc
+
+from pipeline_metrics import RunMetrics
+
+
+def test_finish_keeps_tracing_started_elsewhere():
+    tracemalloc.start()
+    try:
+        run = RunMetrics(track_memory=True)
+        run.finish()
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+def test_tracing_stops_after_the_last_concurrent_run():
+    assert not tracemalloc.is_tracing()
+    first = RunMetrics(track_memory=True)
+    second = RunMetrics(track_memory=True)
+
+    first.finish()
+    assert tracemalloc.is_tracing()
+    second.finish()
+    assert not tracemalloc.is_tracing()
+
+
+def test_peak_rss_includes_the_sampled_peak_of_each_stage():
+    run = RunMetrics(track_memory=False, sample_rss=False)
+    with run.stage("load"):
+        pass
+    with run.stage("transform"):
+        pass
+    mb = 1024 * 1024
+    load, transform = run.stages
+    load.rss_start, load.rss_end, load.rss_peak = 100 * mb, 150 * mb, 160 * mb
+    # A transient spike inside the stage, freed before it returned
+    transform.rss_start, transform.rss_end, transform.rss_peak = 150 * mb, 140 * mb, 400 * mb
+    run.finish()
+
+    record = run.to_dict()
+    assert record["peak_rss_mb"] == 400
+    assert record["peak_stage"] == "transform"
+    assert "400.0" in run.format_summary().splitlines()[3]
+
+    # Without sampling the RSS at stage exit is used
+    transform.rss_peak = None
+    assert run.to_dict()["peak_rss_mb"] == 160
+    assert run.peak_stage is load
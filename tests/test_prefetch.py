@@ -0,0 +1,30 @@
+"""Tests for the background workbook prefetcher."""
+
+import os
+import subprocess
+import sys
+
+from prefetch import file_signature
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_prefetch_leaves_the_readers_unloaded():
+    # main.py imports prefetch on the Tk thread, where pandas must not be loaded
+    code = ("import sys, prefetch; "
+            "print(' '.join(m for m in ('pandas', 'openpyxl', 'fuzzywuzzy', 'data_processor') if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == ""
+
+
+def test_signature_changes_with_the_file(tmp_path):
+    path = tmp_path / "rates.xlsx"
+    path.write_bytes(b"rates")
+    before = file_signature(str(path))
+
+    path.write_bytes(b"edited rates")
+
+    assert before[0] == os.path.abspath(str(path))
+    assert file_signature(str(path)) != before
+    assert file_signature(str(tmp_path / "missing.xlsx")) is None
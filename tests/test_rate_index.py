@@ -0,0 +1,72 @@
+"""Tests for saving, opening and closing rate index files."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import rate_index
+from rate_index import RateIndex
+
+
+@pytest.fixture
+def converted():
+    return pd.DataFrame({
+        'Coverage': ['Gold', 'Gold', 'Gold', 'Basic'],
+        'Term': ['36', '36', '48', '12'],
+        'Miles': ['36000', '48000', '48000', '12000'],
+        'Class': ['C', 'C', 'C', 'A'],
+        'Deduct0': ['300', '320', '', '120'],
+        'Deduct100': ['250', '270', '290', ''],
+    })
+
+
+def test_opened_index_finds_the_saved_rates(converted, tmp_path):
+    path = RateIndex.build(converted).save(str(tmp_path / "rates.rateidx"))
+
+    with RateIndex.open(path) as index:
+        assert len(index) == 4
+        assert index.lookup('Gold', 36, 48000, 'C', 100) == 270
+        assert index.lookup('Basic', 12, 12000, 'A', 'Deduct100') is None
+        assert index.lookup_band('Gold', 40, 40000, 'C', 0) == {"term": 48.0, "miles": 48000.0, "rate": None}
+        assert index._mmap is not None
+
+    assert index._mmap is None
+    assert len(index) == 0
+
+
+def test_index_is_mapped_once(converted, tmp_path):
+    path = RateIndex.build(converted).save(str(tmp_path / "rates.rateidx"))
+
+    with RateIndex.open(path) as index:
+        for array in (index.segments, index.term, index.miles, index.rates, index.source_row):
+            assert array.base is not None
+            assert np.shares_memory(np.frombuffer(index._mmap, dtype=np.uint8), array)
+
+
+def test_closed_index_can_be_replaced(converted, tmp_path):
+    path = RateIndex.build(converted).save(str(tmp_path / "rates.rateidx"))
+    index = RateIndex.open(path)
+    index.close()
+    index.close()
+
+    converted.loc[0, 'Deduct100'] = '260'
+    RateIndex.build(converted).save(path)
+
+    with RateIndex.open(path) as index:
+        assert index.lookup('Gold', 36, 36000, 'C', 100) == 260
+
+
+def test_empty_index_round_trips(converted, tmp_path):
+    path = RateIndex.build(converted.iloc[:0]).save(str(tmp_path / "empty.rateidx"))
+
+    with RateIndex.open(path) as index:
+        assert len(index) == 0
+        assert index.lookup('Gold', 36, 36000, 'C', 100) is None
+
+
+def test_cli_lookup(converted, tmp_path, capsys):
+    path = RateIndex.build(converted).save(str(tmp_path / "rates.rateidx"))
+
+    assert rate_index.main(["lookup", path, "--coverage", "Gold", "--term", "36", "--miles", "36000",
+                            "--class", "C", "--deductible", "0"]) == 0
+    assert capsys.readouterr().out.strip() == '{"rate": 300.0}'
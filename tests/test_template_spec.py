@@ -0,0 +1,76 @@
+"""Tests for reading template headers into a TemplateSpec."""
+
+import logging
+
+import openpyxl
+import pytest
+
+from template_spec import TemplateSpec, header_columns
+
+
+def _template(path, *rows, sheet="Template"):
+    workbook = openpyxl.Workbook()
+    worksheet = workbook.active
+    worksheet.title = sheet
+    for row in rows:
+        worksheet.append(row)
+    workbook.save(path)
+    return str(path)
+
+
+def test_header_is_read_as_written(tmp_path):
+    path = _template(tmp_path / "template.xlsx",
+                     ['CompanyCode', 'Coverage', 'Deduct100', 'Deduct0', 'Markup'],
+                     ['X', 'Basic', 1, 2, 3])
+
+    spec = TemplateSpec.from_file(path)
+
+    assert spec.sheet_name == "Template"
+    assert spec.columns == ('CompanyCode', 'Coverage', 'Deduct100', 'Deduct0', 'Markup')
+    assert spec.deductible_columns == ('Deduct0', 'Deduct100')
+
+
+def test_blank_header_cells_are_left_out(tmp_path, caplog):
+    path = _template(tmp_path / "template.xlsx", ['Coverage', 'Term', None, ' ', 'Deduct0', None, None])
+
+    with caplog.at_level(logging.WARNING):
+        spec = TemplateSpec.from_file(path)
+
+    assert spec.columns == ('Coverage', 'Term', 'Deduct0')
+    assert not any(col.startswith('Unnamed') for col in spec.columns)
+    # Trailing blank cells are not worth a warning
+    assert "columns 3, 4;" in caplog.text
+
+
+def test_repeated_header_keeps_the_first_column(tmp_path, caplog):
+    path = _template(tmp_path / "template.xlsx", ['Note', 'Coverage', 'Note', 'Deduct0', 'Note'])
+
+    with caplog.at_level(logging.WARNING):
+        spec = TemplateSpec.from_file(path)
+
+    assert spec.columns == ('Note', 'Coverage', 'Deduct0')
+    assert "repeats Note" in caplog.text
+
+
+def test_numeric_header_cells_become_names():
+    assert header_columns(['Coverage', 2024, 100.0, 2.5]) == ['Coverage', '2024', '100', '2.5']
+
+
+def test_named_sheet_and_empty_sheet(tmp_path):
+    path = str(tmp_path / "template.xlsx")
+    workbook = openpyxl.Workbook()
+    workbook.active.title = "Empty"
+    workbook.create_sheet("Rates").append(['Coverage', 'Deduct0'])
+    workbook.save(path)
+
+    assert TemplateSpec.from_file(path, "Rates").columns == ('Coverage', 'Deduct0')
+    assert TemplateSpec.from_file(path).columns == ()
+    assert TemplateSpec.from_template(path) is TemplateSpec.standard()
+
+
+def test_template_given_as_a_path(tmp_path):
+    path = tmp_path / "template.xlsx"
+    _template(path, ['Coverage', 'Deduct100', 'Deduct0'])
+
+    assert TemplateSpec.from_file(path).columns == ('Coverage', 'Deduct100', 'Deduct0')
+    assert TemplateSpec.from_template(path).deductible_columns == ('Deduct0', 'Deduct100')